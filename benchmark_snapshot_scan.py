@@ -0,0 +1,65 @@
+import os
+import time
+import argparse
+from synthetic_chat_db import create_synthetic_chat_db
+from snapshot_reader import open_chat_db
+
+# The same per-chat scan extract_chats runs, minus the DataFrame construction
+SCAN_QUERY = '''
+    SELECT
+        message.ROWID,
+        message.text,
+        message.date,
+        message.date_delivered,
+        message.date_read,
+        message.is_from_me,
+        handle.id
+    FROM message
+    JOIN chat_message_join ON message.ROWID = chat_message_join.message_id
+    LEFT JOIN handle ON message.handle_id = handle.ROWID
+    WHERE chat_message_join.chat_id = ?
+    ORDER BY message.date ASC
+'''
+
+
+def scan(db_path: str, **open_kwargs) -> tuple[int, float]:
+    """Run the extraction scan over every chat; returns (rows, seconds) including any snapshot copy."""
+    start = time.perf_counter()
+    rows = 0
+    with open_chat_db(db_path, **open_kwargs) as conn:
+        cursor = conn.cursor()
+        chat_ids = [chat_id for (chat_id,) in cursor.execute('SELECT ROWID FROM chat')]
+        for chat_id in chat_ids:
+            cursor.execute(SCAN_QUERY, (chat_id,))
+            rows += len(cursor.fetchall())
+    return rows, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark chat.db scan throughput with and without mmap")
+    parser.add_argument("--db", default="benchmark_chat.db")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--messages-per-chat", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--snapshot-dir", default="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Generating {args.chats * args.messages_per_chat:,} messages in {args.db}...")
+        create_synthetic_chat_db(args.db, args.chats, args.messages_per_chat)
+    print(f"Database size: {os.path.getsize(args.db) / 1e6:.1f} MB")
+
+    configs = {
+        "no mmap, default cache": dict(mmap_size=0, cache_size_kib=2000),
+        "no mmap, 256 MiB cache": dict(mmap_size=0),
+        "mmap 1 GiB, 256 MiB cache": dict(),
+    }
+    if args.snapshot_dir:
+        configs[f"snapshot to {args.snapshot_dir} + mmap"] = dict(snapshot_dir=args.snapshot_dir)
+
+    print(f"\n{'config':<40} {'best s':>8} {'rows/s':>12}")
+    for name, open_kwargs in configs.items():
+        timings = [scan(args.db, **open_kwargs) for _ in range(args.repeats)]
+        rows = timings[0][0]
+        best = min(seconds for _, seconds in timings)
+        print(f"{name:<40} {best:>8.3f} {rows / best:>12,.0f}")
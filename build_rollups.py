@@ -0,0 +1,239 @@
+import os
+import json
+import argparse
+import polars as pl
+from typing import Dict, Iterable, List
+from message_index import DEFAULT_INDEX_PATH
+from snapshot_reader import connect_read_only
+
+DEFAULT_ROLLUP_DIR = "rollups"
+
+# An answer more than this long after the other side's last message starts a new conversation; it isn't a reply
+REPLY_WINDOW_SECONDS = 12 * 60 * 60
+
+MESSAGES_SCHEMA = {
+    "chat_id": pl.Int64,
+    "group_chat_name": pl.Utf8,
+    "date_sent": pl.Datetime("us"),
+    "author_handle": pl.Utf8,
+    "author_name": pl.Utf8,
+}
+
+# Sort order of each table, whose leading column is also what update_rollups replaces rows by
+ROLLUP_KEYS = {
+    "chats": ["chat_id"],
+    "contacts": ["author_handle"],
+    "participants": ["chat_id", "author_handle"],
+    "daily": ["chat_id", "day"],
+    "weekly": ["chat_id", "week"],
+}
+
+# The given chats plus every other chat of the people who wrote in them: a contact's totals and
+# median reply latencies span all of their chats, so updating them needs all of those messages
+AFFECTED_CHATS_QUERY = """
+    SELECT value FROM json_each(?)
+    UNION
+    SELECT chat_id FROM handle_chats WHERE author_handle IN (
+        SELECT author_handle FROM handle_chats WHERE chat_id IN (SELECT value FROM json_each(?))
+    )
+"""
+
+
+def messages_from_chats(chat_dfs: List[pl.DataFrame]) -> pl.DataFrame:
+    """Stack the columns the rollups need from the extracted chats (or chats reloaded from CSV)."""
+    frames = []
+    for chat_df in chat_dfs:
+        if len(chat_df) == 0:
+            continue
+        if chat_df.schema['date_sent'] == pl.Utf8:
+            chat_df = chat_df.with_columns(
+                pl.col('date_sent').str.strptime(pl.Datetime, format="%Y-%m-%dT%H:%M:%S%.f", strict=False)
+            )
+        if 'author_name' not in chat_df.columns:
+            chat_df = chat_df.with_columns(author_name=pl.lit(None, pl.Utf8))
+        frames.append(chat_df.select(
+            pl.col(column).cast(dtype) for column, dtype in MESSAGES_SCHEMA.items()
+        ))
+    if not frames:
+        return pl.DataFrame(schema=MESSAGES_SCHEMA)
+    return pl.concat(frames).drop_nulls('date_sent').with_columns(pl.col('author_handle').fill_null(''))
+
+
+def messages_from_index(index_path: str = DEFAULT_INDEX_PATH, chat_ids: Iterable[int] | None = None) -> pl.DataFrame:
+    """Read every message (or those of chat_ids) from the message index, which the ingest daemon keeps current."""
+    query = (
+        "SELECT messages.chat_id, chats.group_chat_name, messages.date_sent, messages.author_handle, messages.author_name "
+        "FROM messages LEFT JOIN chats USING (chat_id)"
+    )
+    conn = connect_read_only(index_path)
+    if chat_ids is None:
+        rows = conn.execute(query).fetchall()
+    else:
+        rows = conn.execute(f"{query} WHERE messages.chat_id IN (SELECT value FROM json_each(?))",
+                            (json.dumps(sorted(chat_ids)),)).fetchall()
+    conn.close()
+    schema = {**MESSAGES_SCHEMA, "date_sent": pl.Utf8}
+    return pl.DataFrame(rows, schema=schema, orient="row").with_columns(
+        pl.col('date_sent').str.to_datetime(time_unit="us")
+    )
+
+
+def compute_rollups(messages: pl.DataFrame) -> Dict[str, pl.DataFrame]:
+    """
+    Aggregate messages into small tables:
+    - chats: per chat counts, first/last message, active days, my share and median reply latencies
+    - contacts: per handle, the same for their 1:1 chats plus their messages in group chats
+    - participants: which handles take part in which chat
+    - daily / weekly: message counts per chat and period
+    A reply is a message following one from someone else in the same chat within REPLY_WINDOW_SECONDS.
+    """
+    messages = messages.sort('chat_id', 'date_sent').with_columns(
+        from_me=pl.col('author_handle') == 'Me',
+        prev_author=pl.col('author_handle').shift(1).over('chat_id'),
+        gap_seconds=(pl.col('date_sent') - pl.col('date_sent').shift(1).over('chat_id')).dt.total_seconds(),
+    ).with_columns(
+        is_reply=((pl.col('prev_author') != pl.col('author_handle')) & (pl.col('gap_seconds') <= REPLY_WINDOW_SECONDS)).fill_null(False)
+    )
+
+    participants = messages.filter(~pl.col('from_me') & (pl.col('author_handle') != '')).group_by('chat_id', 'author_handle').agg(
+        author_name=pl.col('author_name').drop_nulls().first(),
+        n_from_them=pl.len(),
+    ).sort('chat_id', 'author_handle')
+
+    participant_names = participants.group_by('chat_id').agg(
+        n_participants=pl.len(),
+        participant_names=pl.coalesce('author_name', 'author_handle').sort().str.join(", "),
+    )
+
+    chats = messages.group_by('chat_id').agg(
+        group_chat_name=pl.col('group_chat_name').drop_nulls().first(),
+        n_messages=pl.len(),
+        n_from_me=pl.col('from_me').sum(),
+        first_message=pl.col('date_sent').min(),
+        last_message=pl.col('date_sent').max(),
+        active_days=pl.col('date_sent').dt.date().n_unique(),
+        my_median_reply_seconds=pl.col('gap_seconds').filter(pl.col('is_reply') & pl.col('from_me')).median(),
+        their_median_reply_seconds=pl.col('gap_seconds').filter(pl.col('is_reply') & ~pl.col('from_me')).median(),
+    ).join(participant_names, on='chat_id', how='left').with_columns(
+        n_participants=pl.col('n_participants').fill_null(0),
+        n_from_them=pl.col('n_messages') - pl.col('n_from_me'),
+        my_share=pl.col('n_from_me') / pl.col('n_messages'),
+        is_group=pl.col('group_chat_name').is_not_null() | (pl.col('n_participants').fill_null(0) > 1),
+        chat_name=pl.coalesce('group_chat_name', 'participant_names', pl.col('chat_id').cast(pl.Utf8)),
+    ).drop('participant_names').sort('chat_id')
+
+    messages = messages.join(chats.select('chat_id', 'is_group'), on='chat_id', how='left')
+
+    # Contact totals: both sides of their 1:1 chats, plus what they wrote in group chats
+    contact_chats = participants.select('chat_id', 'author_handle').join(
+        chats.select('chat_id', 'is_group', 'n_messages', 'n_from_me', 'first_message', 'last_message'), on='chat_id'
+    ).group_by('author_handle').agg(
+        n_chats=pl.len(),
+        n_group_chats=pl.col('is_group').sum(),
+        n_direct_messages=pl.col('n_messages').filter(~pl.col('is_group')).sum(),
+        n_direct_from_me=pl.col('n_from_me').filter(~pl.col('is_group')).sum(),
+        first_message=pl.col('first_message').min(),
+        last_message=pl.col('last_message').max(),
+    )
+    their_messages = messages.filter(~pl.col('from_me') & (pl.col('author_handle') != '')).group_by('author_handle').agg(
+        author_name=pl.col('author_name').drop_nulls().first(),
+        n_group_from_them=pl.col('is_group').sum(),
+        last_from_them=pl.col('date_sent').max(),
+        their_median_reply_seconds=pl.col('gap_seconds').filter(pl.col('is_reply') & (pl.col('prev_author') == 'Me')).median(),
+    )
+    my_replies = messages.filter(pl.col('from_me') & pl.col('is_reply')).group_by('prev_author').agg(
+        my_median_reply_seconds=pl.col('gap_seconds').median(),
+    ).rename({'prev_author': 'author_handle'})
+
+    contacts = their_messages.join(contact_chats, on='author_handle', how='left').join(
+        my_replies, on='author_handle', how='left'
+    ).with_columns(
+        n_messages=pl.col('n_direct_messages') + pl.col('n_group_from_them'),
+        my_share=pl.when(pl.col('n_direct_messages') > 0).then(pl.col('n_direct_from_me') / pl.col('n_direct_messages')),
+    ).sort('author_handle')
+
+    daily = messages.group_by('chat_id', day=pl.col('date_sent').dt.date()).agg(
+        n_messages=pl.len(),
+        n_from_me=pl.col('from_me').sum(),
+    ).sort('chat_id', 'day')
+    weekly = messages.group_by('chat_id', week=pl.col('date_sent').dt.truncate('1w').dt.date()).agg(
+        n_messages=pl.len(),
+        n_from_me=pl.col('from_me').sum(),
+    ).sort('chat_id', 'week')
+
+    return {
+        "chats": chats,
+        "contacts": contacts,
+        "participants": participants,
+        "daily": daily,
+        "weekly": weekly,
+    }
+
+
+def write_rollups(rollups: Dict[str, pl.DataFrame], rollup_dir: str = DEFAULT_ROLLUP_DIR) -> None:
+    """Write each table to <rollup_dir>/<name>.parquet, replacing files atomically so readers never see half a file."""
+    os.makedirs(rollup_dir, exist_ok=True)
+    for name, table in rollups.items():
+        path = os.path.join(rollup_dir, f"{name}.parquet")
+        table.write_parquet(f"{path}.tmp", compression="zstd")
+        os.replace(f"{path}.tmp", path)
+
+
+def build_rollups(chat_dfs: List[pl.DataFrame], rollup_dir: str = DEFAULT_ROLLUP_DIR) -> Dict[str, pl.DataFrame]:
+    """Compute and write the conversation rollups used by the conversation_stats tool."""
+    rollups = compute_rollups(messages_from_chats(chat_dfs))
+    write_rollups(rollups, rollup_dir)
+    return rollups
+
+
+def build_rollups_from_index(index_path: str = DEFAULT_INDEX_PATH, rollup_dir: str = DEFAULT_ROLLUP_DIR) -> Dict[str, pl.DataFrame]:
+    """Same as build_rollups, reading the messages from the message index instead of chat DataFrames."""
+    rollups = compute_rollups(messages_from_index(index_path))
+    write_rollups(rollups, rollup_dir)
+    return rollups
+
+
+def update_rollups(chat_ids: Iterable[int], index_path: str = DEFAULT_INDEX_PATH,
+                   rollup_dir: str = DEFAULT_ROLLUP_DIR) -> Dict[str, pl.DataFrame]:
+    """
+    Recompute the rollups of the given chats, and of the contacts who wrote in them, from the message index
+    and splice them into the tables already in rollup_dir. Each chat is recomputed whole (its medians need
+    every message), but chats and contacts the new messages can't affect are left as they are.
+    Falls back to build_rollups_from_index if the tables don't exist yet.
+    """
+    paths = {name: os.path.join(rollup_dir, f"{name}.parquet") for name in ROLLUP_KEYS}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return build_rollups_from_index(index_path, rollup_dir)
+
+    chat_ids = sorted(set(chat_ids))
+    conn = connect_read_only(index_path)
+    affected_chats = [chat_id for chat_id, in conn.execute(AFFECTED_CHATS_QUERY, (json.dumps(chat_ids),) * 2)]
+    conn.close()
+    fresh = compute_rollups(messages_from_index(index_path, affected_chats))
+    # Only the contacts of the given chats have all their chats in affected_chats
+    handles = fresh["participants"].filter(pl.col('chat_id').is_in(chat_ids))["author_handle"].unique().to_list()
+
+    rollups = {}
+    for name, keys in ROLLUP_KEYS.items():
+        column = keys[0]
+        values = handles if column == "author_handle" else affected_chats
+        old = pl.read_parquet(paths[name]).filter(~pl.col(column).is_in(values))
+        rollups[name] = pl.concat([old, fresh[name].filter(pl.col(column).is_in(values))], how="vertical_relaxed").sort(keys)
+    write_rollups(rollups, rollup_dir)
+    return rollups
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Rebuild the conversation rollups from the message index")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH)
+    parser.add_argument("--out", default=DEFAULT_ROLLUP_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rollups = build_rollups_from_index(args.index, args.out)
+    elapsed = time.perf_counter() - start
+    sizes = sum(os.path.getsize(os.path.join(args.out, f"{name}.parquet")) for name in rollups)
+    print(f"Wrote {', '.join(f'{name} ({len(table):,} rows)' for name, table in rollups.items())} "
+          f"to {args.out}/ in {elapsed:.2f}s, {sizes / 1024:.0f} KiB total")
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import chromadb
@@ -7,35 +8,327 @@ from chromadb.utils import embedding_functions
 import time
 import shutil
 import os
+import json
+import asyncio
+import logging
+import uuid
+import numpy as np
+from collection_io import export_collection, import_collection
+from chat_centroids import DEFAULT_CLUSTERS, ChatCentroids
+from maintenance import collection_stats, copy_collection, probe_latency, sample_queries, sync_ids
+from wire_format import MSGPACK_MEDIA_TYPE, accepts_msgpack, encode_msgpack, project_metadata
+
+logger = logging.getLogger("chroma-imessage")
 
 app = FastAPI(title="ChromaDB API Server")
 
 # Initialize ChromaDB with persistent storage
 DB_PATH = "./chroma_db"
-chroma_client = chromadb.PersistentClient(path=DB_PATH)
+
+# With a memory limit, collections' HNSW indexes are only loaded when first queried and the least
+# recently used ones are evicted once the limit is reached, so old time shards stay on disk until needed
+CHROMA_MEMORY_LIMIT_BYTES = int(os.getenv("CHROMA_MEMORY_LIMIT_BYTES", "0"))
+if CHROMA_MEMORY_LIMIT_BYTES > 0:
+    chroma_client = chromadb.PersistentClient(
+        path=DB_PATH,
+        settings=Settings(chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=CHROMA_MEMORY_LIMIT_BYTES)
+    )
+else:
+    chroma_client = chromadb.PersistentClient(path=DB_PATH)
 
 # Initialize the embedding function using BAAI/bge-base-en-v1.5
+EMBEDDING_MODEL = "BAAI/bge-base-en-v1.5"
 embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="BAAI/bge-base-en-v1.5"
+    model_name=EMBEDDING_MODEL
 )
 
-def get_or_create_collection(name: str = "default"):
-    """Get or create a collection with the specified name."""
-    return chroma_client.get_or_create_collection(
-        name=name,
-        embedding_function=embedding_function,
-        metadata={"description": f"Collection for document embeddings: {name}"}
-    )
+# The only directory /export_collection and /import_collection read and write
+EXPORT_DIR = os.getenv("EXPORT_DIR", "./exports")
+
+# Per-chat centroid matrices behind /find_chats, one .npy + .json pair per collection (or sharded base name)
+CENTROID_DIR = os.getenv("CENTROID_DIR", "./centroids")
+CENTROID_CLUSTERS = int(os.getenv("CENTROID_CLUSTERS", str(DEFAULT_CLUSTERS)))
+# Ingest sends many small batches; rewrite the files at most this often (and on shutdown)
+CENTROID_SAVE_INTERVAL = float(os.getenv("CENTROID_SAVE_INTERVAL", "5"))
+# Chunk metadata the centroids keep per chat
+CENTROID_METADATA_KEYS = ("chat_id", "group_chat_name", "authors", "start_ts", "end_ts")
+# Per-day digest collections, which get no centroids of their own
+DAYS_SUFFIX = "_days"
+
+# Background maintenance: every MAINTENANCE_INTERVAL_SECONDS (0 disables it), collections whose HNSW graph
+# is at least MAINTENANCE_DELETED_RATIO deleted elements are rebuilt. Finished jobs are appended to MAINTENANCE_LOG.
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "0"))
+MAINTENANCE_DELETED_RATIO = float(os.getenv("MAINTENANCE_DELETED_RATIO", "0.2"))
+MAINTENANCE_LOG = os.getenv("MAINTENANCE_LOG", "./maintenance_log.jsonl")
+# A rebuild copies into <name>__rebuild, then renames the original to <name>__retired and deletes it
+REBUILD_SUFFIX = "__rebuild"
+RETIRED_SUFFIX = "__retired"
+
+# Distance space for new collections. BGE embeddings are normalized, so cosine distances map directly
+# to similarity; Chroma's own default is squared L2. Existing collections keep the space they were built with.
+DEFAULT_HNSW_SPACE = os.getenv("HNSW_SPACE", "cosine")
+
+class HnswConfig(BaseModel):
+    """HNSW index settings; fixed when a collection is created (None keeps Chroma's default)."""
+    space: str = DEFAULT_HNSW_SPACE  # "l2", "cosine" or "ip"
+    M: int | None = None
+    construction_ef: int | None = None
+    search_ef: int | None = None
+
+    def to_metadata(self) -> Dict[str, Any]:
+        metadata = {"hnsw:space": self.space}
+        for key in ("M", "construction_ef", "search_ef"):
+            if getattr(self, key) is not None:
+                metadata[f"hnsw:{key}"] = getattr(self, key)
+        return metadata
+
+def get_or_create_collection(name: str = "default", metadata: Optional[Dict[str, Any]] = None,
+                             hnsw: Optional[HnswConfig] = None):
+    """
+    Get the collection with the specified name, or create it with the given metadata and HNSW settings.
+    Chroma's get_or_create_collection would overwrite an existing collection's metadata (shard bounds,
+    hnsw:* keys) with whatever is passed, so existing collections are fetched as they are.
+    """
+    try:
+        return chroma_client.get_collection(name, embedding_function=embedding_function)
+    except ValueError:
+        return chroma_client.get_or_create_collection(
+            name=name,
+            embedding_function=embedding_function,
+            metadata={
+                "description": f"Collection for document embeddings: {name}",
+                **(hnsw or HnswConfig()).to_metadata(),
+                **(metadata or {})
+            }
+        )
+
+def collection_space(collection) -> str:
+    return (collection.metadata or {}).get("hnsw:space", "l2")
+
+def list_shards(base_name: str) -> list:
+    """Time-shard collections of a base collection, oldest first."""
+    shards = [
+        chroma_client.get_collection(c.name, embedding_function=embedding_function)
+        for c in chroma_client.list_collections()
+        if (c.metadata or {}).get("shard_of") == base_name and not c.name.endswith((REBUILD_SUFFIX, RETIRED_SUFFIX))
+    ]
+    return sorted(shards, key=lambda c: c.metadata["period_start"])
+
+def combine_where(*conditions: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """AND together the non-empty where filters."""
+    conditions = [c for c in conditions if c]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
 
 # Create a default collection
 collection = get_or_create_collection()
 
+chat_centroids: Dict[str, ChatCentroids] = {}
+
+def centroids_for(name: str) -> ChatCentroids:
+    """The chat centroids of a collection (shards share their base collection's), loaded on first use."""
+    if name not in chat_centroids:
+        chat_centroids[name] = ChatCentroids(os.path.join(CENTROID_DIR, name), CENTROID_CLUSTERS)
+    return chat_centroids[name]
+
+def centroid_name(collection) -> str:
+    return (collection.metadata or {}).get("shard_of", collection.name)
+
+def has_centroids(name: str) -> bool:
+    """Day digest collections (<name>_days, see generate_embedding_vectors.days_collection) summarize chats that are already tracked."""
+    return not name.endswith(DAYS_SUFFIX)
+
+def track_chunks(collection, ids: List[str], documents: List[str], metadatas: Optional[List[Dict[str, Any]]],
+                 embeddings: Optional[List[List[float]]], replace: bool = False) -> Optional[List[List[float]]]:
+    """
+    Fold chat chunks into the collection's chat centroids (taking out the chunks they replace).
+    Returns the embeddings to store, computed here if needed so documents are only embedded once;
+    None (let Chroma embed) when no document belongs to a chat.
+    """
+    if not has_centroids(collection.name) or not metadatas or not any(m and m.get("chat_id") is not None for m in metadatas):
+        return embeddings
+    if embeddings is None:
+        embeddings = [[float(x) for x in embedding] for embedding in embedding_function(documents)]
+    centroids = centroids_for(centroid_name(collection))
+    if replace:
+        existing = collection.get(ids=ids, include=["embeddings", "metadatas"])
+        centroids.remove(existing["embeddings"], existing["metadatas"])
+    centroids.add(embeddings, metadatas)
+    centroids.save(CENTROID_SAVE_INTERVAL)
+    return embeddings
+
+def rebuild_centroids(name: str) -> int:
+    """
+    Recompute a collection's (or all its shards') chat centroids from the stored embeddings.
+    Pages are copied into one preallocated float32 array (4 bytes per value, where Python lists of
+    floats take several times that), keeping only the metadata keys the centroids record.
+    """
+    collections = list_shards(name) or [chroma_client.get_collection(name, embedding_function=embedding_function)]
+    total = sum(c.count() for c in collections)
+    embeddings: Optional[np.ndarray] = None
+    metadatas: List[Dict[str, Any]] = []
+    for c in collections:
+        for offset in range(0, c.count(), 5000):
+            page = c.get(offset=offset, limit=5000, include=["embeddings", "metadatas"])
+            if not page["ids"]:
+                break
+            page_embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.empty((total, page_embeddings.shape[1]), dtype=np.float32)
+            embeddings[len(metadatas):len(metadatas) + len(page_embeddings)] = page_embeddings
+            metadatas.extend({key: m.get(key) for key in CENTROID_METADATA_KEYS} if m else m for m in page["metadatas"])
+    centroids = centroids_for(name)
+    centroids.rebuild(embeddings[:len(metadatas)] if embeddings is not None else np.zeros((0, 0), dtype=np.float32), metadatas)
+    centroids.save()
+    return len(centroids.chats)
+
+# Collections being rebuilt, with the ids written to them since the copy started
+rebuild_writes: Dict[str, set] = {}
+# One rebuild at a time; each holds a full second copy of a collection
+rebuild_lock = asyncio.Lock()
+maintenance_jobs: Dict[str, Dict[str, Any]] = {}
+# Running rebuild tasks (asyncio only keeps weak references to tasks)
+maintenance_tasks: set = set()
+
+def note_writes(collection_name: str, ids: List[str]) -> None:
+    """Remember writes to a collection that is being rebuilt, so they are replayed onto the copy before the swap."""
+    if collection_name in rebuild_writes:
+        rebuild_writes[collection_name].update(ids)
+
+def new_job(collection_name: str, trigger: str) -> Dict[str, Any]:
+    job = {"id": uuid.uuid4().hex[:12], "collection": collection_name, "trigger": trigger, "status": "queued",
+           "queued_at": time.time()}
+    maintenance_jobs[job["id"]] = job
+    # Keep the most recent jobs only
+    for job_id in list(maintenance_jobs)[:-50]:
+        del maintenance_jobs[job_id]
+    return job
+
+async def rebuild_collection_index(name: str, hnsw: Optional[HnswConfig], job: Dict[str, Any]) -> None:
+    """
+    Rebuild a collection's HNSW index without tombstones (and optionally with new HNSW settings):
+    copy its stored embeddings into a fresh collection in a worker thread while queries and writes
+    carry on against the original, replay the writes made meanwhile, then swap the names.
+    The final replay and the swap run on the event loop without awaiting, so no request can
+    observe a half-finished swap.
+    """
+    async with rebuild_lock:
+        temp_name, retired_name = f"{name[:50]}{REBUILD_SUFFIX}", f"{name[:50]}{RETIRED_SUFFIX}"
+        try:
+            job.update(status="running", started_at=time.time())
+            old = chroma_client.get_collection(name, embedding_function=embedding_function)
+            queries = await asyncio.to_thread(sample_queries, old)
+            job["before"] = {
+                **await asyncio.to_thread(collection_stats, chroma_client, old, DB_PATH),
+                **await asyncio.to_thread(probe_latency, old, queries),
+            }
+            for leftover in (temp_name, retired_name):
+                if leftover in [c.name for c in chroma_client.list_collections()]:
+                    chroma_client.delete_collection(leftover)
+            new = chroma_client.create_collection(
+                temp_name,
+                embedding_function=embedding_function,
+                metadata={**(old.metadata or {}), **(hnsw.to_metadata() if hnsw else {})}
+            )
+            rebuild_writes[name] = set()
+            job["copied"] = await asyncio.to_thread(copy_collection, old, new)
+            
+            # Catch up on the writes made during the copy, then the (usually few) made during the catch-up
+            pending, rebuild_writes[name] = rebuild_writes[name], set()
+            await asyncio.to_thread(sync_ids, old, new, sorted(pending))
+            sync_ids(old, new, sorted(rebuild_writes.pop(name)))
+            old.modify(name=retired_name)
+            new.modify(name=name)
+            
+            await asyncio.to_thread(chroma_client.delete_collection, retired_name)
+            job["after"] = {
+                **await asyncio.to_thread(collection_stats, chroma_client, new, DB_PATH),
+                **await asyncio.to_thread(probe_latency, new, queries),
+            }
+            job["status"] = "done"
+        except Exception as e:
+            logger.error(f"Rebuild of {name} failed: {str(e)}")
+            job.update(status="failed", error=str(e))
+            if temp_name in [c.name for c in chroma_client.list_collections()]:
+                chroma_client.delete_collection(temp_name)
+        finally:
+            rebuild_writes.pop(name, None)
+            job["finished_at"] = time.time()
+            with open(MAINTENANCE_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(job) + "\n")
+
+async def maintenance_scheduler() -> None:
+    """Periodically rebuild collections whose index has accumulated too many deleted elements."""
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            collections = chroma_client.list_collections()
+        except Exception as e:
+            logger.error(f"Maintenance pass failed: {str(e)}")
+            continue
+        for c in collections:
+            if c.name.endswith((REBUILD_SUFFIX, RETIRED_SUFFIX)):
+                continue
+            # One collection failing must not hold up the others
+            try:
+                stats = await asyncio.to_thread(collection_stats, chroma_client, c, DB_PATH)
+                if stats["deleted_elements"] and stats["deleted_ratio"] >= MAINTENANCE_DELETED_RATIO:
+                    await rebuild_collection_index(c.name, None, new_job(c.name, "scheduled"))
+            except Exception as e:
+                logger.error(f"Maintenance of {c.name} failed: {str(e)}")
+
 class BatchInsertRequest(BaseModel):
     documents: List[str]
     metadatas: List[Dict[str, Any]] | None = None
     ids: List[str] | None = None
+    # Precomputed vectors (e.g. from an export); documents are embedded by the server when omitted
+    embeddings: List[List[float]] | None = None
+    collection_name: str = "default"
+    collection_metadata: Dict[str, Any] | None = None
+    hnsw: HnswConfig | None = None
+
+class CreateCollectionRequest(BaseModel):
+    collection_name: str
+    hnsw: HnswConfig = HnswConfig()
+    metadata: Dict[str, Any] | None = None
+
+class DeleteRequest(BaseModel):
+    ids: List[str]
     collection_name: str = "default"
 
+class UpdateMetadataRequest(BaseModel):
+    ids: List[str]
+    metadatas: List[Dict[str, Any]]
+    collection_name: str = "default"
+
+class RebuildRequest(BaseModel):
+    # New HNSW settings for the rebuilt index (the distance space can change too); None keeps the current ones
+    hnsw: HnswConfig | None = None
+    # Wait for the rebuild to finish instead of returning the job right away
+    wait: bool = False
+
+class ResetRequest(BaseModel):
+    # HNSW settings for the recreated collection, e.g. to move an l2 archive to cosine before re-ingesting;
+    # None keeps the current ones
+    hnsw: HnswConfig | None = None
+
+class FindChatsRequest(BaseModel):
+    query_text: str
+    n_results: int = 10
+    collection_name: str = "default"
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+class ExportRequest(BaseModel):
+    path: str | None = None  # Directory under EXPORT_DIR; defaults to <collection_name>
+
+class ImportRequest(BaseModel):
+    path: str  # Directory under EXPORT_DIR
+    collection_name: str | None = None  # Defaults to the exported collection's name
+    replace: bool = False
+
 class QueryRequest(BaseModel):
     query_texts: List[str]
     n_results: int = 5
@@ -43,11 +336,40 @@ class QueryRequest(BaseModel):
     where_document: Dict[str, Any] | None = None
     include: List[str] = ["metadatas", "documents", "distances"]
     collection_name: str = "default"
+    metadata_fields: List[str] | None = None  # Only these metadata keys are returned (default: all)
+
+class ShardedQueryRequest(QueryRequest):
+    # Only chunks overlapping [start_ts, end_ts] (epoch seconds) are searched
+    start_ts: float | None = None
+    end_ts: float | None = None
+
+class BatchQueryItem(BaseModel):
+    query_text: str
+    where: Dict[str, Any] | None = None
+    where_document: Dict[str, Any] | None = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[BatchQueryItem]
+    n_results: int = 5
+    include: List[str] = ["metadatas", "documents", "distances"]
+    collection_name: str = "default"
+    metadata_fields: List[str] | None = None
+
+def query_response(results: Dict[str, Any], request: QueryRequest | BatchQueryRequest, http_request: Request):
+    """
+    Query results projected to request.metadata_fields, as msgpack if the client's Accept header
+    asks for it (skipping FastAPI's JSON encoding of every nested value), otherwise as JSON.
+    """
+    if request.metadata_fields is not None and results.get("metadatas"):
+        results["metadatas"] = project_metadata(results["metadatas"], request.metadata_fields)
+    if accepts_msgpack(http_request.headers.get("accept")):
+        return Response(content=encode_msgpack(results), media_type=MSGPACK_MEDIA_TYPE)
+    return results
 
 @app.post("/batch_insert")
 async def batch_insert(request: BatchInsertRequest):
     try:
-        collection = get_or_create_collection(request.collection_name)
+        collection = get_or_create_collection(request.collection_name, request.collection_metadata, request.hnsw)
         
         # Generate sequential IDs if not provided
         if request.ids is None:
@@ -59,17 +381,96 @@ async def batch_insert(request: BatchInsertRequest):
             timestamp = int(time.time())
             request.metadatas = [{"timestamp": timestamp, "index": i} for i in range(len(request.documents))]
         
+        embeddings = track_chunks(collection, request.ids, request.documents, request.metadatas, request.embeddings)
+        note_writes(collection.name, request.ids)
         collection.add(
             documents=request.documents,
             metadatas=request.metadatas,
-            ids=request.ids
+            ids=request.ids,
+            embeddings=embeddings
         )
         return {"message": f"Successfully inserted {len(request.documents)} documents", "ids": request.ids}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/batch_upsert")
+async def batch_upsert(request: BatchInsertRequest):
+    """Insert documents, replacing any existing documents with the same ids."""
+    try:
+        if request.ids is None:
+            raise ValueError("ids are required for upsert")
+        collection = get_or_create_collection(request.collection_name, request.collection_metadata, request.hnsw)
+        embeddings = track_chunks(collection, request.ids, request.documents, request.metadatas, request.embeddings, replace=True)
+        note_writes(collection.name, request.ids)
+        collection.upsert(
+            documents=request.documents,
+            metadatas=request.metadatas,
+            ids=request.ids,
+            embeddings=embeddings
+        )
+        return {"message": f"Successfully upserted {len(request.documents)} documents", "ids": request.ids}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/delete_documents")
+async def delete_documents(request: DeleteRequest):
+    """Delete documents by id. Their vectors stay in the HNSW graph as deleted elements until the collection is rebuilt."""
+    try:
+        collection = chroma_client.get_collection(request.collection_name, embedding_function=embedding_function)
+        existing = collection.get(ids=request.ids, include=["embeddings", "metadatas"])
+        centroids_for(centroid_name(collection)).remove(existing["embeddings"], existing["metadatas"])
+        centroids_for(centroid_name(collection)).save(CENTROID_SAVE_INTERVAL)
+        note_writes(collection.name, request.ids)
+        collection.delete(ids=request.ids)
+        return {"message": f"Deleted {len(existing['ids'])} documents", "ids": existing["ids"]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/update_metadata")
+async def update_metadata(request: UpdateMetadataRequest):
+    """Merge metadata keys into existing documents, keeping their other keys, documents and embeddings."""
+    try:
+        collection = chroma_client.get_collection(request.collection_name, embedding_function=embedding_function)
+        note_writes(collection.name, request.ids)
+        collection.update(ids=request.ids, metadatas=request.metadatas)
+        return {"message": f"Updated metadata of {len(request.ids)} documents", "ids": request.ids}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/embed")
+async def embed(request: EmbedRequest):
+    """Embed texts with the server's model without storing them (e.g. to build digests client-side)."""
+    try:
+        embeddings = embedding_function(request.texts)
+        return {"embeddings": [[float(x) for x in embedding] for embedding in embeddings]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/find_chats")
+async def find_chats(request: FindChatsRequest):
+    """
+    Rank the chats of a collection by how close their centroid (or any of their sub-centroids) is
+    to the query: one matrix-vector product over a small in-memory matrix, no index search.
+    """
+    try:
+        embedding = embedding_function([request.query_text])[0]
+        start = time.perf_counter()
+        chats = centroids_for(request.collection_name).search(embedding, request.n_results)
+        return {"chats": chats, "search_ms": (time.perf_counter() - start) * 1000}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/rebuild_chat_centroids/{collection_name}")
+async def rebuild_chat_centroids(collection_name: str):
+    """Recompute the chat centroids from the collection's stored embeddings, clustering each chat with k-means."""
+    try:
+        n_chats = await asyncio.to_thread(rebuild_centroids, collection_name)
+        return {"message": f"Rebuilt centroids of {n_chats} chats in {collection_name}"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/query")
-async def query(request: QueryRequest):
+async def query(request: QueryRequest, http_request: Request):
     try:
         collection = get_or_create_collection(request.collection_name)
         results = collection.query(
@@ -79,7 +480,149 @@ async def query(request: QueryRequest):
             where_document=request.where_document,
             include=request.include
         )
-        return results
+        # Tell clients how to turn distances into similarities
+        return query_response({**results, "space": collection_space(collection)}, request, http_request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query_batch")
+async def query_batch(request: BatchQueryRequest, http_request: Request):
+    """
+    Run many queries, each with its own filters, in one request.
+    All query texts are embedded in a single batch; queries sharing the same filters are then
+    searched together. Results come back in Chroma's usual shape, one row per query, in request order.
+    """
+    try:
+        embeddings = embedding_function([item.query_text for item in request.queries])
+        
+        # Group queries by their filters so each distinct filter is one Chroma query
+        groups: Dict[str, List[int]] = {}
+        for i, item in enumerate(request.queries):
+            key = json.dumps([item.where, item.where_document], sort_keys=True)
+            groups.setdefault(key, []).append(i)
+        
+        # A base name with time shards searches all of them
+        shards = list_shards(request.collection_name)
+        
+        fields = ["ids"] + request.include
+        results: Dict[str, List[Any]] = {field: [None] * len(request.queries) for field in fields}
+        for indices in groups.values():
+            first = request.queries[indices[0]]
+            group_embeddings = [embeddings[i] for i in indices]
+            if shards:
+                group_results = await search_shards(shards, group_embeddings, request.n_results,
+                                                    first.where, first.where_document, request.include)
+            else:
+                group_results = get_or_create_collection(request.collection_name).query(
+                    query_embeddings=group_embeddings,
+                    n_results=request.n_results,
+                    where=first.where,
+                    where_document=first.where_document,
+                    include=request.include
+                )
+            for field in fields:
+                for row, i in enumerate(indices):
+                    results[field][i] = group_results[field][row]
+        results["space"] = collection_space(shards[0] if shards else get_or_create_collection(request.collection_name))
+        return query_response(results, request, http_request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def search_shards(shards: list, embeddings: list, n_results: int, where: Optional[Dict[str, Any]],
+                        where_document: Optional[Dict[str, Any]], include: List[str]) -> Dict[str, List[Any]]:
+    """Query shards concurrently in worker threads and merge the hits by distance into a global top n_results."""
+    def query_shard(shard):
+        return shard.query(
+            query_embeddings=embeddings,
+            n_results=n_results,
+            where=where,
+            where_document=where_document,
+            include=list(set(include) | {"distances"})
+        )
+    shards = [shard for shard in shards if shard.count() > 0]
+    shard_results = await asyncio.gather(*(asyncio.to_thread(query_shard, shard) for shard in shards))
+    
+    # Merge: for each query, take the n_results closest hits across all shards
+    fields = ["ids"] + include
+    merged = {field: [] for field in fields}
+    for q in range(len(embeddings)):
+        hits = sorted(
+            (result["distances"][q][j], s, j)
+            for s, result in enumerate(shard_results)
+            for j in range(len(result["ids"][q]))
+        )[:n_results]
+        for field in fields:
+            merged[field].append([shard_results[s][field][q][j] for _, s, j in hits])
+    return merged
+
+@app.post("/query_sharded")
+async def query_sharded(request: ShardedQueryRequest, http_request: Request):
+    """
+    Query the time shards of a base collection (request.collection_name).
+    Only shards whose period overlaps [start_ts, end_ts] are searched, concurrently, with the query
+    embedded once; the per-shard results are merged by distance into a global top n_results.
+    """
+    try:
+        shards = [
+            shard for shard in list_shards(request.collection_name)
+            if (request.start_ts is None or shard.metadata["period_end"] > request.start_ts)
+            and (request.end_ts is None or shard.metadata["period_start"] <= request.end_ts)
+        ]
+        fields = ["ids"] + request.include
+        n_queries = len(request.query_texts)
+        if not shards:
+            return query_response({field: [[] for _ in range(n_queries)] for field in fields}, request, http_request)
+        
+        embeddings = embedding_function(request.query_texts)
+        where = combine_where(
+            request.where,
+            {"end_ts": {"$gte": request.start_ts}} if request.start_ts is not None else None,
+            {"start_ts": {"$lte": request.end_ts}} if request.end_ts is not None else None
+        )
+        results = await search_shards(shards, embeddings, request.n_results, where, request.where_document, request.include)
+        return query_response({**results, "space": collection_space(shards[0])}, request, http_request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/shards/{base_name}")
+async def get_shards(base_name: str):
+    """List the time shards of a base collection with their periods and sizes."""
+    try:
+        return [
+            {
+                "name": shard.name,
+                "count": shard.count(),
+                "period_start": shard.metadata["period_start"],
+                "period_end": shard.metadata["period_end"]
+            }
+            for shard in list_shards(base_name)
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/reset_shards/{base_name}")
+async def reset_shards(base_name: str):
+    """Delete all time shards of a base collection; ingestion recreates them as needed."""
+    try:
+        shards = list_shards(base_name)
+        for shard in shards:
+            chroma_client.delete_collection(shard.name)
+        centroids_for(base_name).clear()
+        return {"message": f"Deleted {len(shards)} shards of {base_name}"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/create_collection")
+async def create_collection(request: CreateCollectionRequest):
+    """Create a collection with explicit HNSW settings (distance space, M, construction_ef, search_ef)."""
+    try:
+        existing = [c.name for c in chroma_client.list_collections()]
+        if request.collection_name in existing:
+            raise ValueError(f"Collection {request.collection_name} already exists; HNSW settings can only be set on creation")
+        # The explicit settings win over any hnsw:* keys in the metadata (e.g. copied from another collection)
+        metadata = {**(request.metadata or {}), **request.hnsw.to_metadata()}
+        collection = get_or_create_collection(request.collection_name, metadata, request.hnsw)
+        return {"message": f"Collection {request.collection_name} has been created", "metadata": collection.metadata}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -90,26 +633,129 @@ async def get_collection_info(collection_name: str = "default"):
         return {
             "count": collection.count(),
             "name": collection.name,
-            "metadata": collection.metadata
+            "metadata": collection.metadata,
+            "space": collection_space(collection)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/collection_stats")
+async def get_all_collection_stats():
+    """Index health of every collection, plus the size of Chroma's shared SQLite file."""
+    try:
+        stats = [
+            await asyncio.to_thread(collection_stats, chroma_client, c, DB_PATH)
+            for c in chroma_client.list_collections()
+            if not c.name.endswith((REBUILD_SUFFIX, RETIRED_SUFFIX))
+        ]
+        sqlite_path = os.path.join(DB_PATH, "chroma.sqlite3")
+        return {"collections": stats, "sqlite_bytes": os.path.getsize(sqlite_path) if os.path.exists(sqlite_path) else 0}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/collection_stats/{collection_name}")
+async def get_collection_stats(collection_name: str):
+    """Live and deleted element counts, on-disk size and index memory of one collection."""
+    try:
+        collection = chroma_client.get_collection(collection_name, embedding_function=embedding_function)
+        return await asyncio.to_thread(collection_stats, chroma_client, collection, DB_PATH)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/rebuild_collection/{collection_name}")
+async def rebuild_collection(collection_name: str, request: RebuildRequest = RebuildRequest()):
+    """
+    Rebuild a collection's index in the background (dropping deleted elements, optionally with new
+    HNSW settings) and swap it in. Returns the job, whose before/after stats and query latencies
+    appear in GET /maintenance once it finishes.
+    """
+    try:
+        chroma_client.get_collection(collection_name, embedding_function=embedding_function)
+        job = new_job(collection_name, "manual")
+        task = asyncio.create_task(rebuild_collection_index(collection_name, request.hnsw, job))
+        maintenance_tasks.add(task)
+        task.add_done_callback(maintenance_tasks.discard)
+        if request.wait:
+            await task
+        return job
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/maintenance")
+async def get_maintenance():
+    """Recent and running maintenance jobs, and the scheduler settings."""
+    return {
+        "jobs": list(maintenance_jobs.values()),
+        "scheduler": {
+            "interval_seconds": MAINTENANCE_INTERVAL_SECONDS,
+            "deleted_ratio": MAINTENANCE_DELETED_RATIO,
+        },
+    }
+
 @app.post("/reset_collection/{collection_name}")
-async def reset_collection(collection_name: str = "default"):
-    """Delete and recreate a collection."""
+async def reset_collection(collection_name: str = "default", request: ResetRequest = ResetRequest()):
+    """Delete and recreate a collection, keeping its metadata and (unless new ones are given) HNSW settings."""
     try:
+        metadata = get_or_create_collection(collection_name).metadata
+        if request.hnsw is not None:
+            metadata = {**(metadata or {}), **request.hnsw.to_metadata()}
         chroma_client.delete_collection(collection_name)
-        collection = get_or_create_collection(collection_name)
+        collection = chroma_client.create_collection(
+            name=collection_name,
+            embedding_function=embedding_function,
+            metadata=metadata
+        )
+        centroids_for(collection_name).clear()
         return {"message": f"Collection {collection_name} has been reset"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def export_path(path: str) -> str:
+    """Resolve an export directory relative to EXPORT_DIR; the endpoints never touch files outside it."""
+    root = os.path.realpath(EXPORT_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Export paths must be inside EXPORT_DIR ({EXPORT_DIR}): {path}")
+    return resolved
+
+@app.post("/export_collection/{collection_name}")
+async def export_collection_endpoint(collection_name: str, request: ExportRequest = ExportRequest()):
+    """Dump a collection's ids, documents, metadata and embeddings to a directory on the server."""
+    try:
+        collection = chroma_client.get_collection(collection_name, embedding_function=embedding_function)
+        path = export_path(request.path or collection_name)
+        # Paging through a large collection takes a while; keep the event loop serving queries meanwhile
+        manifest = await asyncio.to_thread(export_collection, collection, path, embedding_model=EMBEDDING_MODEL)
+        return {"message": f"Exported {manifest['count']} documents to {path}", "path": path, "manifest": manifest}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/import_collection")
+async def import_collection_endpoint(request: ImportRequest):
+    """Recreate a collection from an export directory using its stored embeddings (no re-embedding)."""
+    try:
+        collection = await asyncio.to_thread(
+            import_collection,
+            chroma_client,
+            export_path(request.path),
+            request.collection_name,
+            embedding_function,
+            request.replace,
+            embedding_model=EMBEDDING_MODEL
+        )
+        if has_centroids(collection.name):
+            # An imported shard belongs to its base collection's centroids
+            await asyncio.to_thread(rebuild_centroids, centroid_name(collection))
+        return {"message": f"Imported {collection.count()} documents into {collection.name}", "collection_name": collection.name}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/delete_collection/{collection_name}")
 async def delete_collection(collection_name: str):
     """Permanently delete a collection."""
     try:
         chroma_client.delete_collection(collection_name)
+        centroids_for(collection_name).clear()
         return {"message": f"Collection {collection_name} has been deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -124,6 +770,10 @@ async def reset_database():
         # Remove the database directory
         if os.path.exists(DB_PATH):
             shutil.rmtree(DB_PATH)
+        for centroids in chat_centroids.values():
+            centroids.clear()
+        if os.path.exists(CENTROID_DIR):
+            shutil.rmtree(CENTROID_DIR)
         
         # Create default collection
         collection = get_or_create_collection()
@@ -131,6 +781,16 @@ async def reset_database():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.on_event("startup")
+async def start_maintenance_scheduler():
+    if MAINTENANCE_INTERVAL_SECONDS > 0:
+        maintenance_tasks.add(asyncio.create_task(maintenance_scheduler()))
+
+@app.on_event("shutdown")
+def flush_centroids():
+    for centroids in chat_centroids.values():
+        centroids.flush()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+# Sub-centroids per chat, so a chat that covers several topics can match any of them
+DEFAULT_CLUSTERS = 4
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Cluster labels for unit vectors, seeded with farthest-point initialization."""
+    if len(vectors) <= k:
+        return np.arange(len(vectors))
+    rng = np.random.default_rng(seed)
+    centers = [vectors[rng.integers(len(vectors))]]
+    for _ in range(k - 1):
+        centers.append(vectors[np.argmin(np.max(vectors @ np.array(centers).T, axis=1))])
+    centers = np.array(centers)
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centers.T, axis=1)
+        for c in range(k):
+            members = vectors[labels == c]
+            if len(members):
+                centers[c] = normalize(members.sum(axis=0))
+    return np.argmax(vectors @ centers.T, axis=1)
+
+
+class ChatCentroids:
+    """
+    Per-chat sums of chunk embeddings for one collection, split into up to n_clusters sub-centroids.
+    Updated incrementally as chunks are added and removed (each vector goes to its nearest
+    sub-centroid), rebuilt exactly with k-means by rebuild(), and persisted as <path>.npy (one row
+    per sub-centroid sum) plus <path>.json (each row's chat and count, and per-chat name,
+    participants and time range) so find_chats needs nothing but this small matrix.
+    """
+
+    def __init__(self, path: str, n_clusters: int = DEFAULT_CLUSTERS):
+        self.path = path
+        self.n_clusters = n_clusters
+        self.sums: List[np.ndarray] = []
+        self.row_chats: List[Any] = []
+        self.counts: List[int] = []
+        self.chats: Dict[Any, Dict[str, Any]] = {}
+        self.chat_rows: Dict[Any, List[int]] = {}
+        self._index = None
+        self._dirty = False
+        self._saved_at = 0.0
+        if os.path.exists(f"{path}.json"):
+            self.load()
+
+    def load(self) -> None:
+        with open(f"{self.path}.json", encoding="utf-8") as f:
+            state = json.load(f)
+        self.sums = list(np.load(f"{self.path}.npy"))
+        self.row_chats = [row["chat_id"] for row in state["rows"]]
+        self.counts = [row["count"] for row in state["rows"]]
+        self.chats = {chat["chat_id"]: {**chat, "authors": set(chat["authors"])} for chat in state["chats"]}
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self.chat_rows = {}
+        for row, chat_id in enumerate(self.row_chats):
+            self.chat_rows.setdefault(chat_id, []).append(row)
+        self._index = None
+
+    def _compact(self) -> None:
+        """Drop sub-centroids emptied by removals."""
+        keep = [row for row, (chat_id, count) in enumerate(zip(self.row_chats, self.counts))
+                if count > 0 and chat_id in self.chats]
+        self.sums = [self.sums[row] for row in keep]
+        self.row_chats = [self.row_chats[row] for row in keep]
+        self.counts = [self.counts[row] for row in keep]
+        self._reindex()
+
+    def save(self, min_interval: float = 0.0) -> None:
+        """Persist the centroids, or with min_interval only if that many seconds passed since the last save."""
+        self._dirty = True
+        if min_interval and time.monotonic() - self._saved_at < min_interval:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._compact()
+        # Write both files next to the old ones, then swap them in
+        np.save(f"{self.path}.tmp.npy", np.array(self.sums) if self.sums else np.zeros((0, 0)))
+        with open(f"{self.path}.tmp.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "rows": [{"chat_id": chat_id, "count": count} for chat_id, count in zip(self.row_chats, self.counts)],
+                "chats": [{**chat, "authors": sorted(chat["authors"])} for chat in self.chats.values()],
+            }, f)
+        os.replace(f"{self.path}.tmp.npy", f"{self.path}.npy")
+        os.replace(f"{self.path}.tmp.json", f"{self.path}.json")
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def flush(self) -> None:
+        """Write out changes held back by save(min_interval)."""
+        if self._dirty:
+            self.save()
+
+    def clear(self) -> None:
+        self.sums, self.row_chats, self.counts, self.chats = [], [], [], {}
+        self._reindex()
+        self._dirty = False
+        for suffix in (".npy", ".json"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def _nearest_row(self, chat_id: Any, vector: np.ndarray) -> int:
+        rows = [row for row in self.chat_rows[chat_id] if self.counts[row] > 0] or self.chat_rows[chat_id]
+        return rows[int(np.argmax(normalize(np.array([self.sums[row] for row in rows])) @ vector))]
+
+    def _note_chat(self, metadata: Dict[str, Any]) -> None:
+        chat = self.chats.setdefault(metadata["chat_id"], {
+            "chat_id": metadata["chat_id"], "group_chat_name": None, "authors": set(),
+            "start_ts": None, "end_ts": None, "n_chunks": 0,
+        })
+        chat["group_chat_name"] = metadata.get("group_chat_name") or chat["group_chat_name"]
+        chat["authors"].update(a for a in str(metadata.get("authors") or "").split(", ") if a)
+        for key, pick in (("start_ts", min), ("end_ts", max)):
+            if metadata.get(key) is not None:
+                chat[key] = metadata[key] if chat[key] is None else pick(chat[key], metadata[key])
+        chat["n_chunks"] += 1
+
+    def add(self, embeddings: Iterable[List[float]], metadatas: Iterable[Dict[str, Any]]) -> None:
+        """Fold chunks into their chats' sub-centroids; chunks without a chat_id are ignored."""
+        for embedding, metadata in zip(embeddings, metadatas):
+            if not metadata or metadata.get("chat_id") is None:
+                continue
+            vector = normalize(np.asarray(embedding, dtype=np.float64))
+            chat_id = metadata["chat_id"]
+            rows = self.chat_rows.setdefault(chat_id, [])
+            if len(rows) < self.n_clusters:
+                # The first chunks of a chat each seed a sub-centroid
+                rows.append(len(self.sums))
+                self.sums.append(vector)
+                self.row_chats.append(chat_id)
+                self.counts.append(1)
+            else:
+                row = self._nearest_row(chat_id, vector)
+                self.sums[row] = self.sums[row] + vector
+                self.counts[row] += 1
+            self._note_chat(metadata)
+        self._index = None
+
+    def remove(self, embeddings: Iterable[List[float]], metadatas: Iterable[Dict[str, Any]]) -> None:
+        """
+        Take replaced or deleted chunks back out of their nearest sub-centroid. Participants and
+        time ranges only ever grow; rebuild() recomputes them exactly.
+        """
+        for embedding, metadata in zip(embeddings, metadatas):
+            if not metadata or metadata.get("chat_id") not in self.chats:
+                continue
+            chat_id = metadata["chat_id"]
+            vector = normalize(np.asarray(embedding, dtype=np.float64))
+            row = self._nearest_row(chat_id, vector)
+            self.sums[row] = self.sums[row] - vector
+            self.counts[row] -= 1
+            self.chats[chat_id]["n_chunks"] -= 1
+            if self.chats[chat_id]["n_chunks"] <= 0:
+                del self.chats[chat_id]
+        self._index = None
+
+    def rebuild(self, embeddings: np.ndarray, metadatas: List[Dict[str, Any]]) -> None:
+        """
+        Recompute everything from a collection's full contents, clustering each chat with k-means.
+        A float32 embeddings array is normalized in place rather than copied.
+        """
+        self.sums, self.row_chats, self.counts, self.chats = [], [], [], {}
+        by_chat: Dict[Any, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            if metadata and metadata.get("chat_id") is not None:
+                by_chat.setdefault(metadata["chat_id"], []).append(i)
+                self._note_chat(metadata)
+        # Normalized in place: for a large collection this array is most of the memory a rebuild takes
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if len(vectors):
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        for chat_id, indices in by_chat.items():
+            chat_vectors = vectors[indices]
+            labels = spherical_kmeans(chat_vectors, self.n_clusters)
+            for label in np.unique(labels):
+                members = chat_vectors[labels == label]
+                self.sums.append(members.sum(axis=0, dtype=np.float64))
+                self.row_chats.append(chat_id)
+                self.counts.append(len(members))
+        self._reindex()
+
+    def _build_index(self):
+        """
+        Unit-length matrix holding, for each chat in turn, its overall centroid followed by its
+        sub-centroids, plus the row where each chat's block starts.
+        """
+        chat_ids = list(self.chats)
+        blocks, starts = [], []
+        for chat_id in chat_ids:
+            subs = [self.sums[row] for row in self.chat_rows.get(chat_id, []) if self.counts[row] > 0]
+            starts.append(sum(len(block) for block in blocks))
+            if len(subs) > 1:
+                blocks.append(np.vstack([np.sum(subs, axis=0)] + subs))
+            else:
+                blocks.append(np.vstack(subs) if subs else np.zeros((1, len(self.sums[0]))))
+        self._index = (chat_ids, normalize(np.vstack(blocks)).astype(np.float32), np.array(starts))
+
+    def search(self, query_embedding: List[float], n_results: int = 10) -> List[Dict[str, Any]]:
+        """Chats ranked by their best cosine similarity (overall centroid or any sub-centroid) to the query."""
+        if not self.chats:
+            return []
+        if self._index is None:
+            self._build_index()
+        chat_ids, matrix, starts = self._index
+        # One matrix-vector product, then the best row within each chat's block
+        best = np.maximum.reduceat(matrix @ normalize(np.asarray(query_embedding, dtype=np.float32)), starts)
+        top = np.argsort(-best)[:n_results]
+        return [
+            {**self.chats[chat_ids[i]], "authors": sorted(self.chats[chat_ids[i]]["authors"]), "score": float(best[i])}
+            for i in top
+        ]
@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional
+
+import chromadb
+import numpy as np
+
+from maintenance import get_rows
+
+DB_PATH = "./chroma_db"
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+RECORDS_FILE = "records.jsonl"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+# Rows per get()/add() call; well under Chroma's max batch size and a few tens of MB of vectors
+DEFAULT_PAGE_SIZE = 5000
+
+
+def export_collection(collection, out_dir: str, page_size: int = DEFAULT_PAGE_SIZE,
+                      embedding_model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Write a collection to out_dir a page at a time, never holding more than one page in memory:
+    - embeddings.npy: float32 matrix, row i belongs to line i of records.jsonl
+    - records.jsonl: one {"id", "document", "metadata"} object per line
+    - manifest.json: collection name and metadata (including hnsw:* settings), row count, dimension
+    Returns the manifest. Pages are taken from a snapshot of the ids (see maintenance.copy_collection),
+    so deletes during an export cannot shift rows out of it; rows written meanwhile may be missing.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    ids = collection.get(include=[])["ids"]
+    count = len(ids)
+    embeddings_path = os.path.join(out_dir, EMBEDDINGS_FILE)
+    embeddings = None
+    dim = 0
+    written = 0
+
+    with open(os.path.join(out_dir, RECORDS_FILE), "w", encoding="utf-8") as records:
+        for i in range(0, count, page_size):
+            page = get_rows(collection, ids[i:i + page_size])
+            if not page["ids"]:
+                continue
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            if embeddings is None:
+                dim = vectors.shape[1]
+                # Preallocated on disk and filled in place, so the full matrix never needs to fit in memory
+                embeddings = np.lib.format.open_memmap(embeddings_path, mode="w+", dtype=np.float32, shape=(count, dim))
+            embeddings[written:written + len(vectors)] = vectors
+            for record_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                records.write(json.dumps({"id": record_id, "document": document, "metadata": metadata}) + "\n")
+            written += len(vectors)
+
+    if embeddings is None:
+        np.save(embeddings_path, np.zeros((0, 0), dtype=np.float32))
+    else:
+        embeddings.flush()
+        del embeddings
+        if written < count:
+            # Rows were deleted while exporting; shrink the matrix to what was written
+            np.save(embeddings_path, np.array(np.load(embeddings_path, mmap_mode="r")[:written]))
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "name": collection.name,
+        "metadata": collection.metadata,
+        "count": written,
+        "dim": dim,
+        "dtype": "float32",
+        "embedding_model": embedding_model,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(in_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(in_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported export format version {manifest.get('format_version')}")
+    return manifest
+
+
+def iter_export_batches(in_dir: str, batch_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Dict[str, list]]:
+    """Stream an export back as add() batches; embeddings are memory-mapped, not loaded."""
+    manifest = read_manifest(in_dir)
+    if manifest["count"] == 0:
+        return
+    embeddings = np.load(os.path.join(in_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    batch = {"ids": [], "documents": [], "metadatas": []}
+    start = 0
+    with open(os.path.join(in_dir, RECORDS_FILE), encoding="utf-8") as records:
+        for line in records:
+            record = json.loads(line)
+            batch["ids"].append(record["id"])
+            batch["documents"].append(record["document"])
+            batch["metadatas"].append(record["metadata"])
+            if len(batch["ids"]) == batch_size:
+                yield {**batch, "embeddings": embeddings[start:start + batch_size].tolist()}
+                start += batch_size
+                batch = {"ids": [], "documents": [], "metadatas": []}
+    if batch["ids"]:
+        yield {**batch, "embeddings": embeddings[start:start + len(batch["ids"])].tolist()}
+
+
+def import_collection(client, in_dir: str, name: Optional[str] = None, embedding_function=None,
+                      replace: bool = False, batch_size: int = DEFAULT_PAGE_SIZE,
+                      embedding_model: Optional[str] = None):
+    """
+    Recreate an exported collection (under its original name unless name is given) with the stored
+    vectors, so nothing is re-embedded. The collection keeps its exported metadata and HNSW settings.
+    Fails if the collection exists, unless replace is set.
+    """
+    manifest = read_manifest(in_dir)
+    if embedding_model and manifest.get("embedding_model") and manifest["embedding_model"] != embedding_model:
+        raise ValueError(
+            f"Export was embedded with {manifest['embedding_model']}, but this server embeds queries with {embedding_model}"
+        )
+    name = name or manifest["name"]
+    if replace and name in [c.name for c in client.list_collections()]:
+        client.delete_collection(name)
+    kwargs = {"embedding_function": embedding_function} if embedding_function is not None else {}
+    collection = client.create_collection(name=name, metadata=manifest["metadata"], **kwargs)
+    for batch in iter_export_batches(in_dir, batch_size):
+        collection.add(**batch)
+    return collection
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import a collection with its embeddings (stop app.py first, or use its endpoints)")
+    parser.add_argument("--db", default=DB_PATH, help="Chroma persistent directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Dump a collection to a directory")
+    export_parser.add_argument("collection")
+    export_parser.add_argument("out_dir")
+    export_parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    import_parser = subparsers.add_parser("import", help="Load an exported directory into a new collection")
+    import_parser.add_argument("in_dir")
+    import_parser.add_argument("--name", help="Collection name (default: the exported one)")
+    import_parser.add_argument("--replace", action="store_true", help="Delete an existing collection with that name first")
+    import_parser.add_argument("--batch-size", type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    client = chromadb.PersistentClient(path=args.db)
+    start = time.perf_counter()
+    if args.command == "export":
+        manifest = export_collection(client.get_collection(args.collection), args.out_dir, args.page_size)
+        n_rows = manifest["count"]
+        size = sum(os.path.getsize(os.path.join(args.out_dir, f)) for f in (MANIFEST_FILE, RECORDS_FILE, EMBEDDINGS_FILE))
+        print(f"Exported {n_rows:,} rows (dim {manifest['dim']}) to {args.out_dir}, {size / 1e6:.1f} MB")
+    else:
+        collection = import_collection(client, args.in_dir, args.name, replace=args.replace, batch_size=args.batch_size)
+        n_rows = collection.count()
+        print(f"Imported {n_rows:,} rows into {collection.name}")
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.1f}s, {n_rows / max(elapsed, 1e-9):,.0f} rows/s")
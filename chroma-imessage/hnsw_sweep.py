@@ -0,0 +1,136 @@
+import argparse
+import itertools
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import chromadb
+import numpy as np
+
+DB_PATH = "./chroma_db"
+
+
+def load_sample(collection_name: str, sample_size: int, db_path: str = DB_PATH) -> np.ndarray:
+    """Read up to sample_size stored embeddings from an existing collection (no re-embedding)."""
+    client = chromadb.PersistentClient(path=db_path)
+    collection = client.get_collection(collection_name)
+    embeddings = collection.get(limit=sample_size, include=["embeddings"])["embeddings"]
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def synthetic_sample(sample_size: int, dim: int = 768, n_clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """Normalized vectors drawn around random centers, which is closer to real chat embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, n_clusters, sample_size)] + 0.6 * rng.normal(size=(sample_size, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def brute_force_top_k(data: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """Exact top-k neighbor indices per query, computed with NumPy in the same space Chroma uses."""
+    if space == "cosine":
+        data = data / np.linalg.norm(data, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        distances = -queries @ data.T
+    elif space == "ip":
+        distances = -queries @ data.T
+    else:
+        distances = (queries ** 2).sum(1)[:, None] - 2 * queries @ data.T + (data ** 2).sum(1)[None, :]
+    top = np.argpartition(distances, k, axis=1)[:, :k]
+    order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def estimated_index_bytes(n: int, dim: int, M: int) -> int:
+    """
+    hnswlib's memory for n elements: each element stores its vector, 2*M level-0 links and a label;
+    about 1/M of the elements also appear on upper levels with M links each.
+    """
+    level0 = n * (dim * 4 + 2 * M * 4 + 4 + 8)
+    upper = n * (M * 4 + 4) / max(M - 1, 1)
+    return int(level0 + upper)
+
+
+def run_config(data: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int, space: str,
+               M: int, construction_ef: int, search_ef: int, batch_size: int = 5000) -> Dict[str, float]:
+    """Build a throwaway collection with the given HNSW settings and measure recall@k and per-query latency."""
+    path = tempfile.mkdtemp(prefix="hnsw-sweep-")
+    try:
+        client = chromadb.PersistentClient(path=path)
+        collection = client.create_collection(
+            name="sweep",
+            metadata={"hnsw:space": space, "hnsw:M": M, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef}
+        )
+        start = time.perf_counter()
+        for i in range(0, len(data), batch_size):
+            collection.add(
+                ids=[str(j) for j in range(i, min(i + batch_size, len(data)))],
+                embeddings=data[i:i + batch_size].tolist()
+            )
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(map(int, result["ids"][0])) & set(expected.tolist()))
+
+        latencies_ms = np.array(latencies) * 1000
+        return {
+            "recall": hits / (len(queries) * k),
+            "p50_ms": float(np.percentile(latencies_ms, 50)),
+            "p99_ms": float(np.percentile(latencies_ms, 99)),
+            "index_mb": estimated_index_bytes(len(data), data.shape[1], M) / 1e6,
+            "build_s": build_seconds,
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def parse_ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep HNSW settings: recall@k vs. query latency and index memory")
+    parser.add_argument("--collection", help="Sample embeddings from this collection in ./chroma_db (default: synthetic vectors)")
+    parser.add_argument("--sample-size", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Vectors held out of the index and used as queries")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--space", default="cosine", choices=["cosine", "l2", "ip"])
+    parser.add_argument("--M", default="8,16,32")
+    parser.add_argument("--construction-ef", default="100,200")
+    parser.add_argument("--search-ef", default="10,50,100,200")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    args = parser.parse_args()
+
+    if args.collection:
+        sample = load_sample(args.collection, args.sample_size + args.queries)
+    else:
+        sample = synthetic_sample(args.sample_size + args.queries, args.dim)
+    queries, data = sample[:args.queries], sample[args.queries:]
+    print(f"{len(data):,} vectors of dim {data.shape[1]}, {len(queries)} queries, k={args.k}, space={args.space}")
+
+    start = time.perf_counter()
+    truth = brute_force_top_k(data, queries, args.k, args.space)
+    print(f"Brute-force ground truth: {(time.perf_counter() - start) * 1000 / len(queries):.2f} ms/query\n")
+
+    print(f"{'M':>4} {'cons_ef':>8} {'search_ef':>10} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'index MB':>9} {'build s':>8}")
+    results: List[Tuple[Tuple[int, int, int], Dict[str, float]]] = []
+    for M, construction_ef, search_ef in itertools.product(parse_ints(args.M), parse_ints(args.construction_ef), parse_ints(args.search_ef)):
+        stats = run_config(data, queries, truth, args.k, args.space, M, construction_ef, search_ef)
+        results.append(((M, construction_ef, search_ef), stats))
+        print(f"{M:>4} {construction_ef:>8} {search_ef:>10} {stats['recall']:>9.3f} {stats['p50_ms']:>8.2f} "
+              f"{stats['p99_ms']:>8.2f} {stats['index_mb']:>9.1f} {stats['build_s']:>8.1f}")
+
+    good_enough = [r for r in results if r[1]["recall"] >= args.target_recall]
+    if good_enough:
+        (M, construction_ef, search_ef), stats = min(good_enough, key=lambda r: r[1]["p50_ms"])
+        print(f"\nFastest config with recall@{args.k} >= {args.target_recall}: M={M}, construction_ef={construction_ef}, "
+              f"search_ef={search_ef} ({stats['recall']:.3f} recall, {stats['p50_ms']:.2f} ms p50)")
+    else:
+        print(f"\nNo config reached recall@{args.k} >= {args.target_recall}; try larger M or search_ef")
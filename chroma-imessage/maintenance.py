@@ -0,0 +1,141 @@
+import os
+import time
+import pickle
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Rows per get()/upsert() call when copying a collection
+COPY_PAGE_SIZE = 5000
+HNSW_FILES = ("header.bin", "data_level0.bin", "length.bin", "link_lists.bin")
+
+
+def dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def vector_segment_dir(client, collection, persist_dir: str) -> Optional[str]:
+    """Directory of the collection's persisted HNSW index (named after its vector segment's id)."""
+    try:
+        # Chroma has no public API for segments; this is what its own local segment manager does
+        segments = client._server._sysdb.get_segments(collection=collection.id)
+    except Exception:
+        # A Chroma version with a different internal layout: report the index as not persisted
+        return None
+    for segment in segments:
+        if str(segment["scope"]).endswith("VECTOR"):
+            path = os.path.join(persist_dir, str(segment["id"]))
+            return path if os.path.isdir(path) else None
+    return None
+
+
+def index_counts(client, collection) -> Optional[Tuple[int, int]]:
+    """
+    (elements ever added, elements still live) of the collection's HNSW index, read together from its
+    in-memory segment, which Chroma keeps current by replaying writes since the last persist.
+    """
+    try:
+        from chromadb.segment import VectorReader
+        # Private, like vector_segment_dir; any other Chroma layout falls back to the persisted snapshot
+        segment = client._server._manager.get_segment(collection.id, VectorReader)
+        return segment._total_elements_added, len(segment._id_to_label)
+    except Exception:
+        return None
+
+
+def collection_stats(client, collection, persist_dir: str) -> Dict[str, Any]:
+    """
+    Health of a collection's index: live elements, elements still in the HNSW graph but deleted
+    (tombstones, which still cost memory and search time), and the index size on disk, which is
+    also what loading it takes in memory. Chroma only persists an index after about a thousand
+    writes; until then "persisted" is False and the size figures are zero.
+    """
+    stats: Dict[str, Any] = {"name": collection.name, "live_elements": collection.count()}
+    path = vector_segment_dir(client, collection, persist_dir)
+    metadata_path = os.path.join(path, "index_metadata.pickle") if path else None
+    persisted = None
+    if metadata_path is not None and os.path.exists(metadata_path):
+        with open(metadata_path, "rb") as f:
+            persisted = pickle.load(f)
+
+    # Labels are never reused: every element ever added is still in the graph, live or marked deleted,
+    # while deleted ids are dropped from id_to_label. Both counts come from the same source so they agree.
+    counts = index_counts(client, collection)
+    if counts is None and persisted is not None:
+        counts = persisted.total_elements_added, len(persisted.id_to_label)
+    index_elements, live_in_index = counts or (0, 0)
+    deleted = max(0, index_elements - live_in_index)
+    return {
+        **stats,
+        "persisted": persisted is not None,
+        "index_elements": index_elements,
+        "deleted_elements": deleted,
+        "deleted_ratio": deleted / index_elements if index_elements else 0.0,
+        "dimensionality": persisted.dimensionality if persisted is not None else None,
+        "disk_bytes": dir_bytes(path) if path else 0,
+        "index_memory_bytes": sum(
+            os.path.getsize(os.path.join(path, f)) for f in HNSW_FILES if os.path.exists(os.path.join(path, f))
+        ) if persisted is not None else 0,
+    }
+
+
+def sample_queries(collection, n_queries: int = 20) -> List[List[float]]:
+    """Stored embeddings to reuse as probe queries, so before/after latencies use identical inputs."""
+    page = collection.get(limit=n_queries, include=["embeddings"])
+    return [list(map(float, e)) for e in page["embeddings"] or []]
+
+
+def probe_latency(collection, queries: List[List[float]], n_results: int = 10) -> Dict[str, float]:
+    """p50/p95 milliseconds of single-vector queries against the collection (after one warm-up query)."""
+    if not queries or collection.count() == 0:
+        return {}
+    n_results = min(n_results, collection.count())
+    collection.query(query_embeddings=queries[:1], n_results=n_results, include=[])
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[query], n_results=n_results, include=[])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95))}
+
+
+def get_rows(source, ids: List[str], attempts: int = 3) -> Dict[str, Any]:
+    """
+    The given rows of source with their embeddings. Chroma reads metadata and vectors separately, so a
+    row deleted in between fails the whole get (its vector is None); a retry no longer sees the row.
+    """
+    for attempt in range(attempts):
+        try:
+            return source.get(ids=list(ids), include=["embeddings", "documents", "metadatas"])
+        except TypeError:
+            if attempt == attempts - 1:
+                raise
+    return {"ids": []}
+
+
+def copy_collection(source, target, page_size: int = COPY_PAGE_SIZE) -> int:
+    """
+    Copy every row of source (with its stored embedding) into target. Returns the rows copied.
+    Pages are taken from a snapshot of the ids rather than by offset, which deletes during the copy would
+    shift past rows that were never copied; rows deleted since the snapshot are simply missing from their page.
+    """
+    copied = 0
+    ids = source.get(include=[])["ids"]
+    for i in range(0, len(ids), page_size):
+        page = get_rows(source, ids[i:i + page_size])
+        if page["ids"]:
+            target.upsert(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"], metadatas=page["metadatas"])
+        copied += len(page["ids"])
+    return copied
+
+
+def sync_ids(source, target, ids: List[str]) -> None:
+    """Bring the given rows of target up to date with source: copy the ones that exist, delete the rest."""
+    if not ids:
+        return
+    page = get_rows(source, ids)
+    if page["ids"]:
+        target.upsert(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"], metadatas=page["metadatas"])
+    gone = sorted(set(ids) - set(page["ids"]))
+    if gone:
+        target.delete(ids=gone)
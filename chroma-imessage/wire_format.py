@@ -0,0 +1,44 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # Query responses are then always JSON
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def accepts_msgpack(accept: Optional[str]) -> bool:
+    """Whether an Accept header prefers msgpack over JSON (and msgpack is installed to encode it)."""
+    if msgpack is None or not accept:
+        return False
+    quality = {}
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = next((float(p[2:]) for p in params if p.startswith("q=")), 1.0)
+        quality[media_type.lower()] = q
+    q_msgpack = max(quality.get(MSGPACK_MEDIA_TYPE, 0.0), quality.get("application/x-msgpack", 0.0))
+    return q_msgpack > 0 and q_msgpack >= quality.get("application/json", 0.0)
+
+
+def project_metadata(metadatas: List[List[Dict[str, Any]]], fields: List[str]) -> List[List[Dict[str, Any]]]:
+    """Keep only the given keys of each hit's metadata (e.g. dropping the per-author and per-chat filter flags)."""
+    return [
+        [{key: metadata[key] for key in fields if key in metadata} if metadata else metadata for metadata in row]
+        for row in metadatas
+    ]
+
+
+def _encode_numpy(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_msgpack(results: Dict[str, Any]) -> bytes:
+    """Query results in msgpack, same shape as the JSON response."""
+    return msgpack.packb(results, default=_encode_numpy)
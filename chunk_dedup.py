@@ -0,0 +1,246 @@
+import os
+import re
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Universal hashing modulo a Mersenne prime; shingle hashes are 32-bit, so a * x + b fits in a uint64
+MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+# Duplicate locations kept on a representative; Chroma stores metadata per row, so this bounds its size
+MAX_DUPLICATES_LISTED = 20
+# Dimension of BAAI/bge-base-en-v1.5, for estimating the index space saved
+EMBEDDING_DIM = 768
+
+
+def chat_key(chat_id: int) -> str:
+    """Metadata key flagging chunks whose text also occurs in the given chat (e.g. "chat:42")."""
+    return f"chat:{chat_id}"
+
+
+def shingle_hashes(text: str, shingle_size: int = 3) -> np.ndarray:
+    """32-bit hashes of the text's word shingles, after lowercasing and dropping punctuation."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < shingle_size:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+    return np.unique(np.array([zlib.crc32(s.encode()) for s in shingles], dtype=np.uint64))
+
+
+def lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    (bands, rows) splitting the signature so that pairs around the threshold become candidates.
+    The S-curve midpoint (1 / bands) ** (1 / rows) is kept at or below the threshold, trading a few
+    extra candidate checks for not missing duplicates.
+    """
+    splits = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    below = [(b, r) for b, r in splits if (1 / b) ** (1 / r) <= threshold]
+    return min(below or splits, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+class NearDuplicateIndex:
+    """
+    Streaming MinHash/LSH index over texts. Each text is either a new representative or a
+    near-duplicate (estimated Jaccard similarity of word shingles >= threshold) of an earlier one.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self.signatures: List[np.ndarray] = []
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text, self.shingle_size)
+        if len(hashes) == 0:
+            return np.full(len(self.a), MERSENNE_PRIME, dtype=np.uint64)
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def insert(self, signature: np.ndarray) -> int:
+        """Add a signature as a new representative, returning its number."""
+        for band, key in enumerate(self._band_keys(signature)):
+            self.buckets[band].setdefault(key, []).append(len(self.signatures))
+        self.signatures.append(signature)
+        return len(self.signatures) - 1
+
+    def replace(self, i: int, text: str) -> None:
+        """Re-index representative i under a new text (e.g. its conversation window grew)."""
+        for band, key in enumerate(self._band_keys(self.signatures[i])):
+            self.buckets[band][key].remove(i)
+        self.signatures[i] = self.signature(text)
+        for band, key in enumerate(self._band_keys(self.signatures[i])):
+            self.buckets[band].setdefault(key, []).append(i)
+
+    def add(self, text: str) -> int | None:
+        """
+        The index of the representative the text duplicates, or None if it is new,
+        in which case it becomes representative number len(index) - 1.
+        """
+        signature = self.signature(text)
+        candidates = {i for band, key in enumerate(self._band_keys(signature)) for i in self.buckets[band].get(key, ())}
+        best, best_similarity = None, self.threshold
+        for i in sorted(candidates):
+            similarity = float(np.mean(self.signatures[i] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = i, similarity
+        if best is not None:
+            return best
+        self.insert(signature)
+        return None
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+
+def location(metadata: Dict[str, Any]) -> Tuple[Any, ...]:
+    """(chat_id, start_time, end_time) of a chunk, with ISO strings for times."""
+    return tuple(value.isoformat() if isinstance(value, datetime) else value
+                 for value in (metadata['chat_id'], metadata['start_time'], metadata['end_time']))
+
+
+class ChunkDeduplicator:
+    """
+    Near-duplicate suppression for one collection: a NearDuplicateIndex of the representative chunks,
+    plus each representative's chunk id and the other places its text occurred. Saved as <path>.npy
+    (signatures) and <path>.json, so later ingests (e.g. ingest_daemon.py) check new chunks against
+    everything already in the collection instead of starting over.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128):
+        self.index = NearDuplicateIndex(threshold, num_perm)
+        self.ids: List[str] = []
+        self.own_locations: List[Tuple[Any, ...]] = []
+        self.locations: List[List[Tuple[Any, ...]]] = []
+        self.flags: List[Dict[str, bool]] = []
+        self.by_id: Dict[str, int] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkDeduplicator":
+        with open(f"{path}.json", encoding="utf-8") as f:
+            state = json.load(f)
+        dedup = cls(state["threshold"], state["num_perm"])
+        for signature in np.load(f"{path}.npy"):
+            dedup.index.insert(signature.astype(np.uint64))
+        dedup.ids = state["ids"]
+        dedup.own_locations = [tuple(loc) for loc in state["own_locations"]]
+        dedup.locations = [[tuple(loc) for loc in locs] for locs in state["locations"]]
+        dedup.flags = state["flags"]
+        dedup.by_id = {chunk_id: i for i, chunk_id in enumerate(dedup.ids)}
+        return dedup
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.save(f"{path}.tmp.npy", np.array(self.index.signatures, dtype=np.uint64).reshape(-1, self.index.num_perm))
+        with open(f"{path}.tmp.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "threshold": self.index.threshold,
+                "num_perm": self.index.num_perm,
+                "ids": self.ids,
+                "own_locations": self.own_locations,
+                "locations": self.locations,
+                "flags": self.flags,
+            }, f)
+        os.replace(f"{path}.tmp.npy", f"{path}.npy")
+        os.replace(f"{path}.tmp.json", f"{path}.json")
+
+    def duplicate_metadata(self, rep: int) -> Dict[str, Any]:
+        """
+        Metadata recording where else a representative's text occurred: n_duplicates, a JSON list of
+        chat_id/start_time/end_time, and chat:<id> and author:<handle> flags so chat and person filters still find it.
+        """
+        metadata: Dict[str, Any] = dict(self.flags[rep])
+        if self.locations[rep]:
+            metadata['n_duplicates'] = len(self.locations[rep])
+            metadata['duplicates'] = json.dumps([
+                {'chat_id': chat_id, 'start_time': start_time, 'end_time': end_time}
+                for chat_id, start_time, end_time in self.locations[rep][:MAX_DUPLICATES_LISTED]
+            ])
+        return metadata
+
+    def add(self, chunks: List[Tuple[str, Dict[str, Any]]], ids: List[str]) -> Tuple[List[Tuple[str, Dict[str, Any]]], List[str]]:
+        """
+        Run chunks (with their chunk ids) through the index. Returns the representatives among them,
+        with their duplicate metadata, and the ids of earlier representatives that gained duplicates
+        here but are not among the returned chunks (their stored metadata needs updating).
+        """
+        kept: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        changed = set()
+        for (text, metadata), chunk_id in zip(chunks, ids):
+            if chunk_id in self.by_id:
+                # A representative re-chunked (e.g. by the daemon), possibly with more messages:
+                # keep it, with what it already represents, and match later chunks against its new text
+                rep = self.by_id[chunk_id]
+                self.index.replace(rep, text)
+                self.own_locations[rep] = location(metadata)
+                if self.own_locations[rep] in self.locations[rep]:
+                    self.locations[rep].remove(self.own_locations[rep])
+                kept[rep] = (text, metadata)
+                continue
+            rep = self.index.add(text)
+            if rep is None:
+                rep = len(self.ids)
+                self.ids.append(chunk_id)
+                self.by_id[chunk_id] = rep
+                self.own_locations.append(location(metadata))
+                self.locations.append([])
+                self.flags.append({})
+                kept[rep] = (text, metadata)
+                continue
+            # The same window seen from another offset is not another occurrence of the text
+            loc = location(metadata)
+            if loc != self.own_locations[rep] and loc not in self.locations[rep]:
+                self.locations[rep].append(loc)
+                changed.add(rep)
+            new_flags = {key: True for key, value in metadata.items() if key.startswith("author:") and value}
+            if metadata['chat_id'] != self.own_locations[rep][0]:
+                new_flags[chat_key(metadata['chat_id'])] = True
+            if not new_flags.items() <= self.flags[rep].items():
+                self.flags[rep].update(new_flags)
+                changed.add(rep)
+        representatives = [(text, {**metadata, **self.duplicate_metadata(rep)}) for rep, (text, metadata) in kept.items()]
+        return representatives, [self.ids[rep] for rep in sorted(changed - set(kept))]
+
+
+def dedup_stats(chunks: List[Tuple[str, Dict[str, Any]]], representatives: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+    return {
+        "chunks": len(chunks),
+        "representatives": len(representatives),
+        "duplicates": len(chunks) - len(representatives),
+        "chars": sum(len(text) for text, _ in chunks),
+        "chars_embedded": sum(len(text) for text, _ in representatives),
+    }
+
+
+def dedup_chunks(chunks: List[Tuple[str, Dict[str, Any]]], threshold: float = 0.9,
+                 num_perm: int = 128) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, int]]:
+    """
+    Collapse near-duplicate chunk texts (forwarded messages, group blasts, identical windows from
+    different offsets) onto the first occurrence, which is the only one embedded. Each representative
+    records where else its text occurred (see ChunkDeduplicator.duplicate_metadata).
+    Returns (representatives, stats).
+    """
+    ids = [str(i) for i in range(len(chunks))]
+    representatives, _ = ChunkDeduplicator(threshold, num_perm).add(chunks, ids)
+    return representatives, dedup_stats(chunks, representatives)
+
+
+def format_dedup_stats(stats: Dict[str, int], dim: int = EMBEDDING_DIM, hnsw_m: int = 16) -> str:
+    """One-line summary of the embedding work and index space the dedup saved."""
+    # Each indexed chunk costs a float32 vector plus ~2M neighbor links in the base HNSW layer
+    bytes_per_vector = dim * 4 + 2 * hnsw_m * 4
+    saved = stats["duplicates"] / max(stats["chunks"], 1)
+    chars_saved = 1 - stats["chars_embedded"] / max(stats["chars"], 1)
+    return (f"Dedup: embedding {stats['representatives']:,} of {stats['chunks']:,} chunks "
+            f"({stats['duplicates']:,} near-duplicates, {saved:.1%} fewer vectors, {chars_saved:.1%} less text to embed, "
+            f"~{stats['duplicates'] * bytes_per_vector / 1e6:.1f} MB less index)")
@@ -0,0 +1,51 @@
+import os
+import argparse
+import polars as pl
+from extract_chats import extract_chats
+from synthetic_chat_db import create_synthetic_chat_db
+from generate_embedding_vectors import (
+    MODEL_MAX_TOKENS,
+    count_tokens,
+    create_chunks_with_overlap,
+    create_token_budget_chunks,
+    load_tokenizer,
+)
+
+
+def truncation_stats(tokenizer, chunks, max_tokens: int = MODEL_MAX_TOKENS) -> dict:
+    """How many chunks (and tokens) the embedding model would cut off at max_tokens."""
+    lengths = count_tokens(tokenizer, [text for text, _ in chunks], add_special_tokens=True)
+    truncated = [n for n in lengths if n > max_tokens]
+    return {
+        "chunks": len(lengths),
+        "truncated": len(truncated),
+        "tokens": sum(lengths),
+        "tokens_lost": sum(n - max_tokens for n in truncated),
+        "max_tokens": max(lengths, default=0),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare chunk truncation between time-window and token-budget chunking")
+    parser.add_argument("--db", default="busy_chat.db", help="chat.db to read; a busy synthetic one is generated if missing")
+    parser.add_argument("--contacts", default="contacts_cache.csv")
+    parser.add_argument("--max-tokens", type=int, default=MODEL_MAX_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Generating a synthetic archive with busy group chats in {args.db}...")
+        create_synthetic_chat_db(args.db, n_chats=40, messages_per_chat=2000, mean_gap_seconds=20, max_words=40)
+
+    contacts = pl.read_csv(args.contacts) if os.path.exists(args.contacts) else pl.DataFrame(schema={"Phone Number": pl.Utf8, "Name": pl.Utf8})
+    chat_dfs = extract_chats(args.db, contacts)
+    tokenizer = load_tokenizer()
+
+    time_chunks = [chunk for df in chat_dfs for chunk in create_chunks_with_overlap(df)]
+    token_chunks = [chunk for df in chat_dfs for chunk in create_token_budget_chunks(df, tokenizer, args.max_tokens, args.overlap_tokens)]
+
+    print(f"\n{'chunking':<12} {'chunks':>8} {'truncated':>10} {'% trunc':>8} {'tokens':>12} {'tokens lost':>12} {'longest':>8}")
+    for name, chunks in [("time", time_chunks), ("tokens", token_chunks)]:
+        stats = truncation_stats(tokenizer, chunks, MODEL_MAX_TOKENS)
+        print(f"{name:<12} {stats['chunks']:>8,} {stats['truncated']:>10,} {stats['truncated'] / max(stats['chunks'], 1):>8.1%} "
+              f"{stats['tokens']:>12,} {stats['tokens_lost']:>12,} {stats['max_tokens']:>8,}")
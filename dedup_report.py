@@ -0,0 +1,47 @@
+import os
+import time
+import random
+import argparse
+import datetime as dt
+import polars as pl
+from extract_chats import extract_chats
+from synthetic_chat_db import WORDS, append_messages, create_synthetic_chat_db
+from generate_embedding_vectors import create_chunks_with_overlap
+from chunk_dedup import dedup_chunks, format_dedup_stats
+
+
+def add_forwarded_blasts(db_path: str, n_chats: int, n_blasts: int = 20, seed: int = 0) -> None:
+    """Send the same long message (with the odd word changed) to most chats, like a forwarded chain message."""
+    rng = random.Random(seed)
+    for b in range(n_blasts):
+        blast = [rng.choice(WORDS) for _ in range(60)]
+        for chat_id in rng.sample(range(1, n_chats + 1), k=max(1, n_chats * 3 // 4)):
+            copy = list(blast)
+            copy[rng.randrange(len(copy))] = rng.choice(WORDS)
+            append_messages(db_path, chat_id, [" ".join(copy)], when=dt.datetime(2024, 6, 1) + dt.timedelta(days=b))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how many chunks near-duplicate suppression saves at each Jaccard threshold")
+    parser.add_argument("--db", default="blast_chat.db", help="chat.db to read; a synthetic one with forwarded blasts is generated if missing")
+    parser.add_argument("--contacts", default="contacts_cache.csv")
+    parser.add_argument("--thresholds", default="0.7,0.8,0.9,1.0", help="Comma-separated Jaccard thresholds")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Generating a synthetic archive with forwarded blasts in {args.db}...")
+        create_synthetic_chat_db(args.db, n_chats=40, messages_per_chat=1000)
+        add_forwarded_blasts(args.db, n_chats=40)
+
+    contacts = pl.read_csv(args.contacts) if os.path.exists(args.contacts) else pl.DataFrame(schema={"Phone Number": pl.Utf8, "Name": pl.Utf8})
+    chat_dfs = extract_chats(args.db, contacts)
+    chunks = [chunk for df in chat_dfs for chunk in create_chunks_with_overlap(df)]
+
+    print(f"\n{'threshold':>9} {'chunks':>8} {'kept':>8} {'dups':>8} {'dups %':>7} {'text -%':>8} {'seconds':>8}")
+    for threshold in [float(t) for t in args.thresholds.split(",")]:
+        start = time.perf_counter()
+        _, stats = dedup_chunks(chunks, threshold)
+        elapsed = time.perf_counter() - start
+        print(f"{threshold:>9.2f} {stats['chunks']:>8,} {stats['representatives']:>8,} {stats['duplicates']:>8,} "
+              f"{stats['duplicates'] / max(stats['chunks'], 1):>7.1%} {1 - stats['chars_embedded'] / max(stats['chars'], 1):>8.1%} {elapsed:>8.2f}")
+    print(f"\nAt the last threshold: {format_dedup_stats(stats)}")
@@ -1,91 +1,205 @@
 import datetime as dt
 import sqlite3
 import polars as pl
+from snapshot_reader import open_chat_db
 
+MESSAGES_QUERY = '''
+    SELECT
+        message.ROWID,
+        message.guid,
+        message.text,
+        message.attributedBody,
+        message.date,
+        message.date_delivered,
+        message.date_read,
+        message.is_from_me,
+        handle.id
+    FROM message
+    JOIN chat_message_join ON message.ROWID = chat_message_join.message_id
+    LEFT JOIN handle ON message.handle_id = handle.ROWID
+    WHERE chat_message_join.chat_id = ? AND IFNULL(message.date, 0) >= ?
+    {content_filter}
+    ORDER BY message.date ASC
+'''
 
-def extract_chats(db_path: str, contacts_df: pl.DataFrame) -> list[pl.DataFrame]:
-    # Connect to the database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('SELECT ROWID, guid, display_name FROM chat')
-    chats = cursor.fetchall()
-
-    chat_dfs = []
-
-    # print(f"Found {len(chats)} chats in sqlite db")
-    for chat in chats:
-        chat_id = chat[0]
-        chat_guid = chat[1]
-        group_chat_name = chat[2] if chat[2] else None
-        
-        # Query to get messages for the chat
-        cursor.execute('''
-            SELECT 
-                message.ROWID, 
-                message.text, 
-                message.date, 
-                message.date_delivered, 
-                message.date_read, 
-                message.is_from_me, 
-                handle.id
-            FROM message
-            JOIN chat_message_join ON message.ROWID = chat_message_join.message_id
-            LEFT JOIN handle ON message.handle_id = handle.ROWID
-            WHERE chat_message_join.chat_id = ?
-            ORDER BY message.date ASC
-        ''', (chat_id,))
-        
-        messages = cursor.fetchall()
-        
-        data = []
-        for msg in messages:
-            message_id = msg[0]
-            text = msg[1]
-            date_sent = msg[2]
-            date_delivered = msg[3]
-            date_read = msg[4]
-            is_from_me = msg[5]
-            author = "Me" if is_from_me else msg[6]
-            
-            # Convert Apple timestamps to datetime
-            # Apple timestamps are in nanoseconds since 2001-01-01
-            def parse_apple_timestamp(ts):
-                if ts:
-                    return dt.datetime(2001, 1, 1) + dt.timedelta(seconds=ts/1e9)
-                else:
-                    return None
-            
-            date_sent = parse_apple_timestamp(date_sent)
-            date_delivered = parse_apple_timestamp(date_delivered)
-            date_read = parse_apple_timestamp(date_read)
-            
-            data.append({
-                "chat_id": chat_id,
-                "chat_guid": chat_guid,
-                "group_chat_name": group_chat_name,
-                "author_handle": author,
-                "text": text,
-                "date_sent": date_sent,
-                "date_delivered": date_delivered,
-                "date_read": date_read
-            })
-        
-        df = pl.DataFrame(data, infer_schema_length=10_000)
-        if len(df) == 0:
-            # print(f"Warning: No messages found for chat {chat_id}")
+# Rows without searchable text:
+# - reactions point at another message through associated_message_guid (associated_message_type
+#   2000-2005 tapback added, 3000-3005 removed, 1000 sticker), with text like 'Liked “…”'
+# - item_type != 0 marks system rows: participant added/removed, group renamed, photo changed, ...
+# - attachment-only messages have just U+FFFC placeholders as text
+# Recent macOS versions often leave text NULL and store the body only in attributedBody, so those rows
+# are kept here and judged on their decoded text (attachment-only ones have a placeholder there too).
+# Edits are applied to the original row in place, so they need no filtering.
+CONTENT_FILTER = '''
+    AND IFNULL(message.associated_message_type, 0) = 0
+    AND IFNULL(message.item_type, 0) = 0
+    AND (TRIM(REPLACE(IFNULL(message.text, ''), char(65532), '')) != '' OR message.attributedBody IS NOT NULL)
+'''
+
+REACTIONS_QUERY = '''
+    SELECT
+        message.associated_message_guid,
+        message.associated_message_type,
+        message.is_from_me,
+        handle.id
+    FROM message
+    JOIN chat_message_join ON message.ROWID = chat_message_join.message_id
+    LEFT JOIN handle ON message.handle_id = handle.ROWID
+    WHERE chat_message_join.chat_id = ? AND IFNULL(message.date, 0) >= ?
+        AND message.associated_message_type BETWEEN 2000 AND 3005
+    ORDER BY message.date ASC
+'''
+
+TAPBACKS = {2000: "Loved", 2001: "Liked", 2002: "Disliked", 2003: "Laughed at", 2004: "Emphasized", 2005: "Questioned"}
+
+
+# Convert Apple timestamps to datetime
+# Apple timestamps are in nanoseconds since 2001-01-01
+def parse_apple_timestamp(ts):
+    if ts:
+        return dt.datetime(2001, 1, 1) + dt.timedelta(seconds=ts/1e9)
+    else:
+        return None
+
+
+def decode_attributed_body(attributed_body: bytes | None) -> str | None:
+    """
+    The plain text of an attributedBody blob: an NSAttributedString in NeXTSTEP typedstream format.
+    The NSString class name is followed by 5 bytes of class version and type markers, then the length
+    (one byte, or 0x81/0x82 and a little-endian 16/32-bit integer), then the UTF-8 text.
+    """
+    if not attributed_body:
+        return None
+    _, found, rest = bytes(attributed_body).partition(b"NSString")
+    if not found or len(rest) < 6:
+        return None
+    rest = rest[5:]
+    if rest[0] == 0x81:
+        length, start = int.from_bytes(rest[1:3], "little"), 3
+    elif rest[0] == 0x82:
+        length, start = int.from_bytes(rest[1:5], "little"), 5
+    else:
+        length, start = rest[0], 1
+    return rest[start:start + length].decode("utf-8", errors="replace")
+
+
+def has_content(text: str | None) -> bool:
+    return bool(text and text.replace("\ufffc", "").strip())
+
+
+def reaction_target(associated_message_guid: str) -> str:
+    # "p:0/<guid>" (a part of a message) or "bp:<guid>"
+    return associated_message_guid.split("/", 1)[-1].split(":", 1)[-1]
+
+
+def fetch_reactions(cursor: sqlite3.Cursor, chat_id: int, contacts_df: pl.DataFrame, since_date: int = 0) -> dict[str, str]:
+    """
+    Current tapbacks on the messages of a chat as compact annotations keyed by message guid,
+    e.g. {"<guid>": "[Loved by Alice; Liked by Me]"}. Removed tapbacks (3000-3005) cancel earlier ones.
+    """
+    names = dict(zip(contacts_df["Phone Number"], contacts_df["Name"]))
+    current: dict[tuple[str, str], int] = {}
+    for associated_guid, reaction_type, is_from_me, handle in cursor.execute(REACTIONS_QUERY, (chat_id, since_date)).fetchall():
+        if not associated_guid:
             continue
-        
-        # Add author names to the dataframe
-        df = df.join(contacts_df.select(pl.col("Phone Number"), pl.col("Name")), left_on="author_handle", right_on="Phone Number", how="left")\
-            .with_columns(pl.when(pl.col("author_handle")=="Me").then(pl.lit("Me")).otherwise(pl.col("Name")).alias("author_name")).drop("Name") # Fill in my rows
+        key = (reaction_target(associated_guid), "Me" if is_from_me else names.get(handle) or handle or "Unknown")
+        if reaction_type >= 3000:
+            current.pop(key, None)
+        elif reaction_type in TAPBACKS:
+            current[key] = reaction_type
+
+    by_target: dict[str, list[str]] = {}
+    for (target, author), reaction_type in current.items():
+        by_target.setdefault(target, []).append(f"{TAPBACKS[reaction_type]} by {author}")
+    return {target: f"[{'; '.join(reactions)}]" for target, reactions in by_target.items()}
+
+
+def extract_chat_messages(cursor: sqlite3.Cursor, chat_id: int, chat_guid: str, group_chat_name: str | None,
+                          contacts_df: pl.DataFrame, since_date: int = 0, content_only: bool = True,
+                          fold_reactions: bool = False) -> pl.DataFrame | None:
+    """
+    Read the messages of one chat (optionally only those with an Apple timestamp >= since_date)
+    into a DataFrame with author names filled in. Returns None if the chat has no messages.
+    Messages whose text is only in attributedBody get it decoded from there.
+    With content_only, reactions, system rows and attachment-only messages are skipped (in SQL where the
+    text column allows it); fold_reactions appends the tapbacks a message received to its text instead.
+    """
+    # Query to get messages for the chat
+    cursor.execute(MESSAGES_QUERY.format(content_filter=CONTENT_FILTER if content_only else ""), (chat_id, since_date))
+
+    messages = cursor.fetchall()
+    reactions = fetch_reactions(cursor, chat_id, contacts_df, since_date) if fold_reactions else {}
+
+    data = []
+    for msg in messages:
+        message_id = msg[0]
+        guid = msg[1]
+        text = msg[2] if has_content(msg[2]) else decode_attributed_body(msg[3]) or msg[2]
+        date_sent = msg[4]
+        date_delivered = msg[5]
+        date_read = msg[6]
+        is_from_me = msg[7]
+        author = "Me" if is_from_me else msg[8]
+
+        if content_only and not has_content(text):
+            continue
+
+        if guid in reactions:
+            text = f"{text} {reactions[guid]}" if text else reactions[guid]
+
+        date_sent = parse_apple_timestamp(date_sent)
+        date_delivered = parse_apple_timestamp(date_delivered)
+        date_read = parse_apple_timestamp(date_read)
+
+        data.append({
+            "chat_id": chat_id,
+            "chat_guid": chat_guid,
+            "message_id": message_id,
+            "group_chat_name": group_chat_name,
+            "author_handle": author,
+            "text": text,
+            "date_sent": date_sent,
+            "date_delivered": date_delivered,
+            "date_read": date_read
+        })
+
+    df = pl.DataFrame(data, infer_schema_length=10_000)
+    if len(df) == 0:
+        # print(f"Warning: No messages found for chat {chat_id}")
+        return None
+
+    # Add author names to the dataframe
+    df = df.join(contacts_df.select(pl.col("Phone Number"), pl.col("Name")), left_on="author_handle", right_on="Phone Number", how="left")\
+        .with_columns(pl.when(pl.col("author_handle")=="Me").then(pl.lit("Me")).otherwise(pl.col("Name")).alias("author_name")).drop("Name") # Fill in my rows
+
+    return df
+
+
+def extract_chats(db_path: str, contacts_df: pl.DataFrame, snapshot_dir: str | None = None,
+                  content_only: bool = True, fold_reactions: bool = False) -> list[pl.DataFrame]:
+    # Open a read-only, consistent snapshot of the database (optionally copied to snapshot_dir first)
+    with open_chat_db(db_path, snapshot_dir) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT ROWID, guid, display_name FROM chat')
+        chats = cursor.fetchall()
+
+        chat_dfs = []
+
+        # print(f"Found {len(chats)} chats in sqlite db")
+        for chat in chats:
+            chat_id = chat[0]
+            chat_guid = chat[1]
+            group_chat_name = chat[2] if chat[2] else None
 
-        # You can save each DataFrame to a file or process it as needed
-        # print(f"Data for Chat ID {chat_id} - {group_chat_name}:")
-        # print(df.head())
+            df = extract_chat_messages(cursor, chat_id, chat_guid, group_chat_name, contacts_df,
+                                       content_only=content_only, fold_reactions=fold_reactions)
+            if df is None:
+                continue
 
-        chat_dfs.append(df) 
+            # You can save each DataFrame to a file or process it as needed
+            # print(f"Data for Chat ID {chat_id} - {group_chat_name}:")
+            # print(df.head())
 
-    # Close the connection
-    conn.close()
+            chat_dfs.append(df)
 
-    return chat_dfs
\ No newline at end of file
+    return chat_dfs
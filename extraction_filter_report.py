@@ -0,0 +1,42 @@
+import os
+import argparse
+import polars as pl
+from extract_chats import extract_chats
+from synthetic_chat_db import create_synthetic_chat_db
+from generate_embedding_vectors import count_tokens, create_chunks_with_overlap, load_tokenizer
+
+MODES = [
+    ("all rows", {"content_only": False}),
+    ("content only", {"content_only": True}),
+    ("content + reactions", {"content_only": True, "fold_reactions": True}),
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how many rows, tokens and chunks filtering reactions and system rows removes")
+    parser.add_argument("--db", default="noisy_chat.db", help="chat.db to read; a synthetic one with reactions and system rows is generated if missing")
+    parser.add_argument("--contacts", default="contacts_cache.csv")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Generating a synthetic archive with tapbacks, system rows, attachments and attributedBody-only messages in {args.db}...")
+        create_synthetic_chat_db(args.db, n_chats=20, messages_per_chat=1000,
+                                 reaction_rate=0.2, system_rate=0.02, attachment_rate=0.05, body_only_rate=0.3)
+
+    contacts = pl.read_csv(args.contacts) if os.path.exists(args.contacts) else pl.DataFrame(schema={"Phone Number": pl.Utf8, "Name": pl.Utf8})
+    tokenizer = load_tokenizer()
+
+    print(f"\n{'mode':<22} {'rows':>9} {'chunks':>8} {'tokens':>11} {'rows -%':>8} {'chunks -%':>10} {'tokens -%':>10}")
+    baseline = None
+    for name, options in MODES:
+        chat_dfs = extract_chats(args.db, contacts, **options)
+        chunks = [chunk for df in chat_dfs for chunk in create_chunks_with_overlap(df)]
+        stats = {
+            "rows": sum(len(df) for df in chat_dfs),
+            "chunks": len(chunks),
+            "tokens": sum(count_tokens(tokenizer, [text for text, _ in chunks], add_special_tokens=True)),
+        }
+        baseline = baseline or stats
+        saved = {key: 1 - stats[key] / baseline[key] if baseline[key] else 0.0 for key in stats}
+        print(f"{name:<22} {stats['rows']:>9,} {stats['chunks']:>8,} {stats['tokens']:>11,} "
+              f"{saved['rows']:>8.1%} {saved['chunks']:>10.1%} {saved['tokens']:>10.1%}")
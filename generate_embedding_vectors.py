@@ -1,28 +1,35 @@
+import os
+import shutil
 import polars as pl
-from datetime import datetime, timedelta
-from typing import List, Tuple, Dict, Any
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from typing import List, Tuple, Dict, Any, Iterator
 import numpy as np
 import requests
 import json
+import re
+import time
+from chunk_dedup import ChunkDeduplicator, dedup_stats, format_dedup_stats
 
 BASE_URL = "http://localhost:8000"
+# Near-duplicate state of deduplicated collections, one subdirectory per base collection
+DEDUP_DIR = "dedup"
 
-def create_chunks_with_overlap(df: pl.DataFrame, window_minutes: int = 30, offset_minutes: int = 10) -> List[Tuple[str, Dict[str, Any]]]:
+DEFAULT_TOKENIZER = "BAAI/bge-base-en-v1.5"
+# BGE (like all BERT models) truncates inputs past 512 tokens, special tokens included
+MODEL_MAX_TOKENS = 512
+
+def time_windows(df: pl.DataFrame, window_minutes: int = 30, offset_minutes: int = 10) -> Iterator[Tuple[timedelta, List[Dict[str, Any]]]]:
     """
-    Create overlapping chunks from a conversation with metadata.
-    Returns list of (chunk_text, metadata) tuples.
+    Group a conversation's messages into time windows, once per offset.
+    Yields (offset, messages) tuples, where messages are row dicts sorted by date.
     """
-    chunks = []
-    
     # Sort messages by date
     df = df.sort("date_sent")
     
     # Create 3 different offsets
     offsets = [timedelta(minutes=i * offset_minutes) for i in range(3)]
     
-    # Determine which author column to use
-    author_col = 'author_name' if 'author_name' in df.columns else 'author_handle'
-    
     for offset in offsets:
         current_chunk_messages = []
         chunk_start_time = None
@@ -44,17 +51,7 @@ def create_chunks_with_overlap(df: pl.DataFrame, window_minutes: int = 30, offse
                 
                 # Save previous chunk if it exists
                 if current_chunk_messages:
-                    chunk_text = "\n".join(msg['text'] for msg in current_chunk_messages if msg['text'] is not None)
-                    authors = [str(author) for author in set(msg[author_col] for msg in current_chunk_messages) if author is not None]
-                    metadata = {
-                        'chat_id': current_chunk_messages[0]['chat_id'],
-                        'group_chat_name': current_chunk_messages[0].get('group_chat_name'),
-                        'start_time': current_chunk_messages[0]['date_sent'],
-                        'end_time': current_chunk_messages[-1]['date_sent'],
-                        'authors': ', '.join(authors),  # Convert list to string immediately
-                        'offset_minutes': offset.total_seconds() / 60
-                    }
-                    chunks.append((chunk_text, metadata))
+                    yield offset, current_chunk_messages
                 
                 # Start new chunk
                 current_chunk_messages = [row]
@@ -66,91 +63,473 @@ def create_chunks_with_overlap(df: pl.DataFrame, window_minutes: int = 30, offse
         
         # Don't forget the last chunk
         if current_chunk_messages:
-            chunk_text = "\n".join(msg['text'] for msg in current_chunk_messages if msg['text'] is not None)
-            authors = [str(author) for author in set(msg[author_col] for msg in current_chunk_messages) if author is not None]
-            metadata = {
-                'chat_id': current_chunk_messages[0]['chat_id'],
-                'group_chat_name': current_chunk_messages[0].get('group_chat_name'),
-                'start_time': current_chunk_messages[0]['date_sent'],
-                'end_time': current_chunk_messages[-1]['date_sent'],
-                'authors': ', '.join(authors),  # Convert list to string immediately
-                'offset_minutes': offset.total_seconds() / 60
-            }
-            chunks.append((chunk_text, metadata))
+            yield offset, current_chunk_messages
+
+def author_key(handle: str) -> str:
+    """Metadata key flagging chunks in which the given handle wrote (e.g. "author:+15551234567")."""
+    return f"author:{handle}"
+
+def chunk_from_messages(messages: List[Dict[str, Any]], author_col: str, offset: timedelta) -> Tuple[str, Dict[str, Any]]:
+    """Build the (chunk_text, metadata) tuple for a run of consecutive messages."""
+    chunk_text = "\n".join(msg['text'] for msg in messages if msg['text'] is not None)
+    authors = [str(author) for author in set(msg[author_col] for msg in messages) if author is not None]
+    metadata = {
+        'chat_id': messages[0]['chat_id'],
+        'group_chat_name': messages[0].get('group_chat_name'),
+        'start_time': messages[0]['date_sent'],
+        'end_time': messages[-1]['date_sent'],
+        'authors': ', '.join(authors),  # Convert list to string immediately
+        'offset_minutes': offset.total_seconds() / 60
+    }
+    # Chroma metadata can't hold lists, so each participant gets a boolean key that a where filter can match
+    for handle in set(msg.get('author_handle') for msg in messages):
+        if handle:
+            metadata[author_key(handle)] = True
+    return chunk_text, metadata
+
+def create_chunks_with_overlap(df: pl.DataFrame, window_minutes: int = 30, offset_minutes: int = 10) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Create overlapping chunks from a conversation with metadata.
+    Returns list of (chunk_text, metadata) tuples.
+    """
+    # Determine which author column to use
+    author_col = 'author_name' if 'author_name' in df.columns else 'author_handle'
+    
+    return [
+        chunk_from_messages(messages, author_col, offset)
+        for offset, messages in time_windows(df, window_minutes, offset_minutes)
+    ]
+
+def load_tokenizer(model_name: str = DEFAULT_TOKENIZER):
+    """Load the embedding model's fast (Rust) tokenizer."""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+def count_tokens(tokenizer, texts: List[str | None], add_special_tokens: bool = False) -> List[int]:
+    """Token counts for many texts in one batched tokenizer call."""
+    non_empty = [text for text in texts if text]
+    counts = iter(len(ids) for ids in tokenizer(non_empty, add_special_tokens=add_special_tokens)["input_ids"]) if non_empty else iter(())
+    return [next(counts) if text else 0 for text in texts]
+
+def create_token_budget_chunks(df: pl.DataFrame, tokenizer, max_tokens: int = MODEL_MAX_TOKENS, overlap_tokens: int = 64,
+                               window_minutes: int = 30, offset_minutes: int = 10) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Like create_chunks_with_overlap, but windows that would exceed max_tokens (special tokens included)
+    are split at message boundaries. Consecutive pieces of a window share up to overlap_tokens tokens
+    worth of trailing messages. Only a single message longer than the budget can still be truncated.
+    Returns list of (chunk_text, metadata) tuples; metadata also records the chunk's token count and
+    its piece number within the window, which keeps ids unique when pieces start at the same time.
+    """
+    author_col = 'author_name' if 'author_name' in df.columns else 'author_handle'
+    budget = max_tokens - tokenizer.num_special_tokens_to_add()
+    separator_tokens = count_tokens(tokenizer, ["\n"])[0]
+    
+    # Tokenize every message of the conversation in one batch
+    df = df.with_row_index("message_index")
+    message_tokens = count_tokens(tokenizer, df['text'].to_list())
+    
+    chunks = []
+    for offset, messages in time_windows(df, window_minutes, offset_minutes):
+        # Prefix sums of tokens and non-empty texts, so any run of messages is costed in O(1)
+        token_sums = [0]
+        text_counts = [0]
+        for msg in messages:
+            token_sums.append(token_sums[-1] + message_tokens[msg['message_index']])
+            text_counts.append(text_counts[-1] + (msg['text'] is not None))
+        
+        def cost(start: int, end: int) -> int:
+            texts = text_counts[end] - text_counts[start]
+            return token_sums[end] - token_sums[start] + separator_tokens * max(texts - 1, 0)
+        
+        start = 0
+        piece = 0
+        for end in range(1, len(messages) + 1):
+            if end - start > 1 and cost(start, end) > budget:
+                chunk_text, metadata = chunk_from_messages(messages[start:end - 1], author_col, offset)
+                chunks.append((chunk_text, {**metadata, 'n_tokens': cost(start, end - 1), 'piece': piece}))
+                piece += 1
+                
+                # Carry trailing messages over as overlap, but always advance past the previous start
+                # and leave room for the message that didn't fit
+                new_start = end - 1
+                while (new_start - 1 > start and cost(new_start - 1, end - 1) <= overlap_tokens
+                       and cost(new_start - 1, end) <= budget):
+                    new_start -= 1
+                start = new_start
+        chunk_text, metadata = chunk_from_messages(messages[start:], author_col, offset)
+        chunks.append((chunk_text, {**metadata, 'n_tokens': cost(start, len(messages)), 'piece': piece}))
     
     return chunks
 
-def process_chats(chat_dfs: List[pl.DataFrame], batch_size: int = 32) -> None:
+def chunk_id(metadata: Dict[str, Any]) -> str:
+    """
+    Deterministic id for a chunk: the same chat, window offset and first message always map to the same id,
+    so re-chunking a conversation and upserting replaces its chunks instead of duplicating them.
+    Later pieces of a split window also carry their piece number, since several messages (and so
+    several pieces) can share a timestamp.
+    """
+    start_time = metadata['start_time']
+    if isinstance(start_time, datetime):
+        start_time = start_time.isoformat()
+    chunk = f"{metadata['chat_id']}-{int(metadata['offset_minutes'])}-{start_time}"
+    return f"{chunk}-{metadata['piece']}" if metadata.get('piece') else chunk
+
+def to_epoch(when: datetime) -> float:
+    """Chat timestamps are naive UTC; Chroma can only range-filter numbers, so times are also stored as epoch seconds."""
+    return when.replace(tzinfo=timezone.utc).timestamp()
+
+def shard_for(start_time: datetime, shard_by: str) -> Tuple[str, datetime, datetime]:
+    """The period key and [start, end) bounds of the time shard a chunk starting at start_time belongs to."""
+    if shard_by == "year":
+        period_start = datetime(start_time.year, 1, 1)
+        return f"{start_time.year}", period_start, period_start.replace(year=start_time.year + 1)
+    if shard_by == "month":
+        period_start = datetime(start_time.year, start_time.month, 1)
+        period_end = datetime(start_time.year + start_time.month // 12, start_time.month % 12 + 1, 1)
+        return f"{start_time.year}-{start_time.month:02d}", period_start, period_end
+    raise ValueError(f"Unknown shard_by: {shard_by}")
+
+def upsert_chunks(chunks: List[Tuple[str, Dict[str, Any]]], collection_name: str = "imessages",
+                  collection_metadata: Dict[str, Any] | None = None) -> requests.Response:
+    """Send (chunk_text, metadata) tuples to the embeddings server, replacing any chunks with the same id."""
+    # Duplicate ids within one request are rejected by Chroma, so keep the last chunk for each id.
+    # Chroma also rejects None metadata values (e.g. group_chat_name of a 1:1 chat), so those are dropped.
+    by_id = {
+        chunk_id(metadata): (
+            text,
+            {
+                **{key: value for key, value in metadata.items() if value is not None},
+                'start_time': metadata['start_time'].isoformat(),
+                'end_time': metadata['end_time'].isoformat(),
+                'start_ts': to_epoch(metadata['start_time']),
+                'end_ts': to_epoch(metadata['end_time']),
+            }
+        )
+        for text, metadata in chunks
+    }
+    if len(by_id) < len(chunks):
+        print(f"Warning: {len(chunks) - len(by_id)} chunks share an id with another chunk in the batch and were dropped")
+    payload = {
+        "ids": list(by_id),
+        "documents": [text for text, _ in by_id.values()],
+        "metadatas": [metadata for _, metadata in by_id.values()],
+        "collection_name": collection_name
+    }
+    if collection_metadata:
+        payload["collection_metadata"] = collection_metadata
+    return requests.post(f"{BASE_URL}/batch_upsert", json=payload)
+
+def chunk_collection(metadata: Dict[str, Any], collection_name: str = "imessages",
+                     shard_by: str | None = None) -> Tuple[str, Dict[str, Any] | None]:
+    """
+    The collection a chunk is stored in and the metadata to create it with: collection_name itself,
+    or with shard_by ("year" or "month") the collection for its period, e.g. imessages_2023, tagged
+    so the server can find and prune shards.
+    """
+    if shard_by is None:
+        return collection_name, None
+    period, period_start, period_end = shard_for(metadata['start_time'], shard_by)
+    return f"{collection_name}_{period}", {
+        "shard_of": collection_name,
+        "period_start": to_epoch(period_start),
+        "period_end": to_epoch(period_end),
+    }
+
+def upsert_chunk_batches(chunks: List[Tuple[str, Dict[str, Any]]], collection_name: str = "imessages",
+                         batch_size: int = 32, shard_by: str | None = None) -> None:
+    """
+    Upsert chunks in batches of batch_size, each to its collection (see chunk_collection).
+    Raises requests.exceptions.RequestException if a batch fails.
+    """
+    by_collection: Dict[str, Tuple[Dict[str, Any] | None, List[Tuple[str, Dict[str, Any]]]]] = {}
+    for chunk in chunks:
+        target, collection_metadata = chunk_collection(chunk[1], collection_name, shard_by)
+        by_collection.setdefault(target, (collection_metadata, []))[1].append(chunk)
+    
+    for target, (collection_metadata, target_chunks) in by_collection.items():
+        for i in range(0, len(target_chunks), batch_size):
+            upsert_chunks(target_chunks[i:i + batch_size], target, collection_metadata).raise_for_status()
+
+def dedup_path(target: str, collection_name: str = "imessages", dedup_dir: str = DEDUP_DIR) -> str:
+    """Where the near-duplicate state of one collection (or shard) of collection_name is saved."""
+    return os.path.join(dedup_dir, collection_name, target)
+
+def upsert_deduplicated_chunks(chunks: List[Tuple[str, Dict[str, Any]]], dedupers: Dict[str, ChunkDeduplicator],
+                               collection_name: str = "imessages", batch_size: int = 32, shard_by: str | None = None,
+                               dedup_dir: str = DEDUP_DIR, threshold: float = 0.9) -> Dict[str, int]:
+    """
+    Upsert only the chunks that are not near-duplicates of a chunk already in their collection, checking
+    each shard separately. Chunks that are duplicates are added to their representative's metadata
+    instead, and every collection's dedup state is saved for the next ingest. dedupers caches the
+    loaded states by collection; a collection without saved state starts one with the given threshold.
+    Returns dedup stats. Raises requests.exceptions.RequestException if a request fails.
+    """
+    by_collection: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+    for chunk in chunks:
+        by_collection.setdefault(chunk_collection(chunk[1], collection_name, shard_by)[0], []).append(chunk)
+    
+    totals: Dict[str, int] = {}
+    for target, target_chunks in by_collection.items():
+        path = dedup_path(target, collection_name, dedup_dir)
+        if target not in dedupers:
+            dedupers[target] = ChunkDeduplicator.load(path) if os.path.exists(f"{path}.json") else ChunkDeduplicator(threshold)
+        dedup = dedupers[target]
+        representatives, changed = dedup.add(target_chunks, [chunk_id(metadata) for _, metadata in target_chunks])
+        try:
+            upsert_chunk_batches(representatives, collection_name, batch_size, shard_by)
+            if changed:
+                requests.post(f"{BASE_URL}/update_metadata", json={
+                    "ids": changed,
+                    "metadatas": [dedup.duplicate_metadata(dedup.by_id[changed_id]) for changed_id in changed],
+                    "collection_name": target
+                }).raise_for_status()
+        except requests.exceptions.RequestException:
+            # Forget what this batch added, so a retry starts again from the saved state
+            del dedupers[target]
+            raise
+        dedup.save(path)
+        for key, value in dedup_stats(target_chunks, representatives).items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+def days_collection(collection_name: str = "imessages") -> str:
+    """The collection holding the per-chat-per-day digests of a chunk collection."""
+    return f"{collection_name}_days"
+
+def embed_texts(texts: List[str], batch_size: int = 256) -> np.ndarray:
+    """Embed texts with the server's model, returning an (n, dim) float32 array."""
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        response = requests.post(f"{BASE_URL}/embed", json={"texts": texts[i:i + batch_size]})
+        response.raise_for_status()
+        vectors.extend(response.json()["embeddings"])
+    return np.asarray(vectors, dtype=np.float32)
+
+def lexical_centrality(texts: List[str]) -> np.ndarray:
+    """
+    How central each text is to a set of texts, without a model: cosine similarity of its TF-IDF
+    vector (IDF over the set) to the mean of all of them.
+    """
+    docs = [re.findall(r"\w+", text.lower()) for text in texts]
+    vocabulary: Dict[str, int] = {}
+    for words in docs:
+        for word in words:
+            vocabulary.setdefault(word, len(vocabulary))
+    counts = np.zeros((len(docs), max(len(vocabulary), 1)), dtype=np.float32)
+    for row, words in enumerate(docs):
+        for word in words:
+            counts[row, vocabulary[word]] += 1
+    idf = np.log((1 + len(docs)) / (1 + (counts > 0).sum(axis=0))) + 1
+    vectors = counts * idf
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    centroid = vectors.mean(axis=0)
+    return vectors @ (centroid / (np.linalg.norm(centroid) + 1e-12))
+
+class EmbeddingCache:
+    """
+    Embeddings of message texts, most recently used kept. Short messages repeat a lot ("ok", "lol",
+    "on my way"), and the daemon re-digests whole days when a few messages arrive, so most texts a
+    digest needs were embedded before. computed counts the texts actually sent to the server.
+    """
+
+    def __init__(self, max_size: int = 20_000):
+        self.max_size = max_size
+        self.vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.computed = 0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of texts as an (n, dim) float32 array, embedding each distinct uncached text once."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        missing = list(dict.fromkeys(text for text in texts if text not in self.vectors))
+        if missing:
+            self.computed += len(missing)
+            new_vectors = dict(zip(missing, embed_texts(missing)))
+        else:
+            new_vectors = {}
+        result = np.stack([new_vectors[text] if text in new_vectors else self.vectors[text] for text in texts])
+        for text in texts:
+            if text in self.vectors:
+                self.vectors.move_to_end(text)
+        self.vectors.update(new_vectors)
+        while len(self.vectors) > self.max_size:
+            self.vectors.popitem(last=False)
+        return result
+
+# Shared by every digest built in this process (an ingest or the daemon)
+message_embeddings = EmbeddingCache()
+
+def create_day_digests(df: pl.DataFrame, n_representatives: int = 8, min_words: int = 3,
+                       selection: str = "embedding", cache: EmbeddingCache | None = None) -> List[Tuple[str, Dict[str, Any], List[float]]]:
+    """
+    One digest per day of a conversation: the messages closest to the day's embedding centroid
+    (preferring ones with at least min_words words), in chronological order. Returns
+    (digest_text, metadata, centroid) tuples; the centroid is what the digest is indexed under.
+    Message embeddings come from cache (default message_embeddings), so only texts it has not seen
+    are embedded. selection="lexical" is a model-free fallback: it ranks messages by TF-IDF similarity
+    to the day's other messages and indexes each digest under the embedding of its own text.
+    """
+    if selection not in ("lexical", "embedding"):
+        raise ValueError(f"Unknown digest selection: {selection}")
+    author_col = 'author_name' if 'author_name' in df.columns else 'author_handle'
+    df = df.drop_nulls('date_sent').filter(pl.col('text').is_not_null() & (pl.col('text').str.strip_chars() != '')).sort('date_sent')
+    if len(df) == 0:
+        return []
+    if df.schema['date_sent'] == pl.Utf8:
+        df = df.with_columns(pl.col('date_sent').str.strptime(pl.Datetime, format="%Y-%m-%dT%H:%M:%S%.f", strict=False))
+    df = df.with_columns(day=pl.col('date_sent').dt.date())
+    if selection == "embedding":
+        embeddings = (cache or message_embeddings).embed(df['text'].to_list())
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
+
+    digests = []
+    rows = df.with_row_index('row').partition_by('day', as_dict=False, maintain_order=True)
+    for day_df in rows:
+        if selection == "embedding":
+            vectors = embeddings[day_df['row'].to_numpy()]
+            centroid = vectors.mean(axis=0)
+            centroid /= np.linalg.norm(centroid) + 1e-12
+            similarity = vectors @ centroid
+        else:
+            centroid = None
+            similarity = lexical_centrality(day_df['text'].to_list())
+        # Substantive messages first, then by centrality; skip repeated texts
+        word_counts = np.array([len(text.split()) for text in day_df['text']])
+        order = sorted(range(len(day_df)), key=lambda i: (word_counts[i] < min_words, -similarity[i]))
+        chosen, seen = [], set()
+        for i in order:
+            key = day_df['text'][i].strip().casefold()
+            if key not in seen:
+                seen.add(key)
+                chosen.append(i)
+            if len(chosen) == n_representatives:
+                break
+        lines = [
+            f"{day_df[author_col][i] or day_df['author_handle'][i] or 'Unknown'}: {day_df['text'][i]}"
+            for i in sorted(chosen)
+        ]
+        day = day_df['day'][0]
+        day_start = datetime(day.year, day.month, day.day)
+        authors = sorted({str(name or handle) for name, handle in zip(day_df[author_col], day_df['author_handle']) if name or handle})
+        metadata = {
+            'chat_id': day_df['chat_id'][0],
+            'group_chat_name': day_df['group_chat_name'][0] if 'group_chat_name' in day_df.columns else None,
+            'day': day.isoformat(),
+            'start_ts': to_epoch(day_start),
+            'end_ts': to_epoch(day_start + timedelta(days=1)),
+            'n_messages': len(day_df),
+            'authors': ', '.join(authors),
+        }
+        digests.append(("\n".join(lines), metadata, centroid))
+    if selection == "lexical":
+        vectors = (cache or message_embeddings).embed([text for text, _, _ in digests])
+        digests = [(text, metadata, vector) for (text, metadata, _), vector in zip(digests, vectors)]
+    return [(text, metadata, vector.tolist()) for text, metadata, vector in digests]
+
+def upsert_day_digests(digests: List[Tuple[str, Dict[str, Any], List[float]]], collection_name: str = "imessages",
+                       batch_size: int = 256) -> None:
+    """Upsert digests (with their centroids as embeddings) into the days collection of collection_name."""
+    for i in range(0, len(digests), batch_size):
+        batch = digests[i:i + batch_size]
+        response = requests.post(f"{BASE_URL}/batch_upsert", json={
+            "ids": [f"{metadata['chat_id']}-{metadata['day']}" for _, metadata, _ in batch],
+            "documents": [text for text, _, _ in batch],
+            "metadatas": [{key: value for key, value in metadata.items() if value is not None} for _, metadata, _ in batch],
+            "embeddings": [centroid for _, _, centroid in batch],
+            "collection_name": days_collection(collection_name)
+        })
+        response.raise_for_status()
+
+def process_chats(chat_dfs: List[pl.DataFrame], batch_size: int = 32, chunking: str = "time",
+                  max_tokens: int = MODEL_MAX_TOKENS, overlap_tokens: int = 64,
+                  collection_name: str = "imessages", shard_by: str | None = None, digests: bool = False,
+                  dedup_threshold: float | None = None, dedup_dir: str = DEDUP_DIR,
+                  digest_selection: str = "embedding") -> None:
     """
     Process all chat dataframes to create chunks and store them in the local embeddings database.
     
     Args:
         chat_dfs: List of polars DataFrames containing chat data
         batch_size: Number of chunks to process at once
+        chunking: "time" for 30-minute windows, "tokens" to also split windows under a token budget
+        max_tokens: Token budget per chunk (including special tokens) when chunking="tokens"
+        overlap_tokens: Tokens of trailing messages repeated between split pieces when chunking="tokens"
+        collection_name: Collection to write to (the base name of the shards when sharding)
+        shard_by: None for a single collection, "year" or "month" for one collection per period
+        digests: Also write per-chat-per-day digests to <collection_name>_days for hierarchical search
+        digest_selection: How digest messages are picked, "embedding" or "lexical" (see create_day_digests)
+        dedup_threshold: If set, chunks whose texts have at least this (estimated) Jaccard similarity with
+            an earlier chunk in the same collection (or shard) are not embedded; the earlier chunk records where they were
+        dedup_dir: Where the dedup state is saved, so ingest_daemon.py can keep deduplicating against it
     """
-    # Reset/create the imessages collection
+    tokenizer = load_tokenizer() if chunking == "tokens" else None
+    
+    # Reset/create the imessages collection (or all of its shards)
     try:
-        requests.post(f"{BASE_URL}/reset_collection/imessages").json()
+        if shard_by is None:
+            requests.post(f"{BASE_URL}/reset_collection/{collection_name}").json()
+        else:
+            requests.post(f"{BASE_URL}/reset_shards/{collection_name}").json()
+        if digests:
+            requests.post(f"{BASE_URL}/reset_collection/{days_collection(collection_name)}").json()
     except requests.exceptions.ConnectionError:
         print("Error: Could not connect to the embeddings server. Make sure it's running at http://localhost:8000")
         return
+    # The collections start empty, and so does what they are deduplicated against
+    shutil.rmtree(os.path.join(dedup_dir, collection_name), ignore_errors=True)
     
-    all_documents = []
-    all_metadata = []
-    
-    # Create chunks for all chats
+    # Create chunks for all chats (held back until every chat is chunked when deduplicating)
+    all_chunks = []
+    digest_cost = {"days": 0, "messages": 0, "seconds": 0.0}
+    embedded_before = message_embeddings.computed
     for chat_df in chat_dfs:
-        chunks_with_metadata = create_chunks_with_overlap(chat_df)
+        if tokenizer is not None:
+            chunks_with_metadata = create_token_budget_chunks(chat_df, tokenizer, max_tokens, overlap_tokens)
+        else:
+            chunks_with_metadata = create_chunks_with_overlap(chat_df)
         
-        # Process in batches
-        for i in range(0, len(chunks_with_metadata), batch_size):
-            batch = chunks_with_metadata[i:i + batch_size]
-            
-            # Separate texts and metadata
-            documents = [chunk[0] for chunk in batch]
-            metadatas = [
-                {
-                    **chunk[1],
-                    'start_time': chunk[1]['start_time'].isoformat(),
-                    'end_time': chunk[1]['end_time'].isoformat(),
-                }
-                for chunk in batch
-            ]
-            
-            # Add to collections for batch processing
-            all_documents.extend(documents)
-            all_metadata.extend(metadatas)
-            
-            # If we've reached batch_size or this is the last batch, send to server
-            if len(all_documents) >= batch_size or i + batch_size >= len(chunks_with_metadata):
-                try:
-                    response = requests.post(
-                        f"{BASE_URL}/batch_insert",
-                        json={
-                            "documents": all_documents,
-                            "metadatas": all_metadata,
-                            "collection_name": "imessages"
-                        }
-                    )
-                    if response.status_code != 200:
-                        print(f"Error inserting batch: {response.json()}")
-                    
-                    # Clear the collections after successful insertion
-                    all_documents = []
-                    all_metadata = []
-                    
-                except requests.exceptions.RequestException as e:
-                    print(f"Error sending batch to server: {e}")
-                    continue
+        # Send to server in batches
+        if dedup_threshold is not None:
+            all_chunks.extend(chunks_with_metadata)
+        else:
+            try:
+                upsert_chunk_batches(chunks_with_metadata, collection_name, batch_size, shard_by)
+            except requests.exceptions.RequestException as e:
+                print(f"Error sending batch to server: {e}")
+        if digests:
+            try:
+                started = time.perf_counter()
+                day_digests = create_day_digests(chat_df, selection=digest_selection)
+                digest_cost["seconds"] += time.perf_counter() - started
+                digest_cost["days"] += len(day_digests)
+                digest_cost["messages"] += sum(metadata['n_messages'] for _, metadata, _ in day_digests)
+                upsert_day_digests(day_digests, collection_name)
+            except requests.exceptions.RequestException as e:
+                print(f"Error sending day digests to server: {e}")
         
         # Use the correct column name for the final print
         author_col = 'author_name' if 'author_name' in chat_df.columns else 'author_handle'
         authors = set(chat_df.filter(~pl.col(author_col).str.to_lowercase().str.contains('me'))[author_col])
         print(f"Processed chunks for chat with {authors}")
     
+    if digests:
+        embedded = message_embeddings.computed - embedded_before
+        print(f"Day digests ({digest_selection}): {digest_cost['days']:,} days from {digest_cost['messages']:,} messages, "
+              f"{embedded:,} texts embedded, {digest_cost['seconds']:.1f}s")
+    
+    if dedup_threshold is not None:
+        try:
+            stats = upsert_deduplicated_chunks(all_chunks, {}, collection_name, batch_size, shard_by, dedup_dir, dedup_threshold)
+            print(format_dedup_stats(stats))
+        except requests.exceptions.RequestException as e:
+            print(f"Error sending batch to server: {e}")
+    
     # Get collection info to verify insertion
     try:
-        info_response = requests.get(f"{BASE_URL}/collection_info/imessages")
+        if shard_by is None:
+            info_response = requests.get(f"{BASE_URL}/collection_info/{collection_name}")
+        else:
+            info_response = requests.get(f"{BASE_URL}/shards/{collection_name}")
         info = info_response.json()
         print(f"\nCollection Info:")
         print(json.dumps(info, indent=2))
@@ -0,0 +1,76 @@
+import argparse
+import random
+import statistics
+import time
+
+import requests
+
+from imessage_service.rerank import RERANK_BUDGET_MS, RERANK_MAX_LENGTH, RERANK_MODEL, CrossEncoderReranker
+
+WORDS = (
+    "hey are we still on for dinner tonight I think so what time works for you "
+    "the train was late again did you see the game last night lol that was wild "
+    "can you send me the address sure thing running a few minutes behind no worries"
+).split()
+
+
+def synthetic_chunks(n: int, words_per_chunk: int, seed: int = 0) -> list[str]:
+    """Chat-like chunks of "Name: message" lines, roughly the shape of real ingested windows."""
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(n):
+        lines, n_words = [], 0
+        while n_words < words_per_chunk:
+            message = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15)))
+            lines.append(f"{rng.choice(['Me', 'Alex', 'Sam'])}: {message}")
+            n_words += len(message.split())
+        chunks.append("\n".join(lines))
+    return chunks
+
+
+def fetch_chunks(vector_db_url: str, query: str, n: int, collection_name: str) -> list[str]:
+    """Real candidates: the top n vector search hits for the query."""
+    response = requests.post(f"{vector_db_url.rstrip('/')}/query", json={
+        "query_texts": [query], "n_results": n, "collection_name": collection_name, "include": ["documents"]
+    })
+    response.raise_for_status()
+    return response.json()["documents"][0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the latency the cross-encoder rerank stage adds per candidate count")
+    parser.add_argument("--model", default=RERANK_MODEL)
+    parser.add_argument("--max-length", type=int, default=RERANK_MAX_LENGTH)
+    parser.add_argument("--candidates", default="10,20,40,80", help="Comma-separated candidate counts")
+    parser.add_argument("--words-per-chunk", type=int, default=120, help="Size of synthetic chunks")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--query", default="dinner plans for tonight")
+    parser.add_argument("--vector-db-url", help="Rerank real hits from this chroma-imessage server instead of synthetic chunks")
+    parser.add_argument("--collection", default="imessages")
+    args = parser.parse_args()
+
+    counts = [int(c) for c in args.candidates.split(",")]
+    if args.vector_db_url:
+        chunks = fetch_chunks(args.vector_db_url, args.query, max(counts), args.collection)
+    else:
+        chunks = synthetic_chunks(max(counts), args.words_per_chunk)
+
+    reranker = CrossEncoderReranker(args.model, args.max_length)
+    start = time.perf_counter()
+    reranker.score(args.query, chunks[:2])
+    print(f"Loaded {args.model} in {time.perf_counter() - start:.1f}s (max_length={args.max_length})\n")
+
+    print(f"{'candidates':>10} {'p50 ms':>8} {'p95 ms':>8} {'ms/cand':>8} {'within budget':>14}")
+    for count in counts:
+        candidates = chunks[:count]
+        latencies = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            reranker.score(args.query, candidates)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        p50 = statistics.median(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        within = sum(latency <= RERANK_BUDGET_MS for latency in latencies) / len(latencies)
+        print(f"{len(candidates):>10} {p50:>8.1f} {p95:>8.1f} {p50 / len(candidates):>8.2f} {within:>13.0%}")
+    print(f"\nBudget: {RERANK_BUDGET_MS:.0f} ms (RERANK_BUDGET_MS); candidates per search: n_results * RERANK_OVERFETCH, capped by RERANK_MAX_CANDIDATES")
@@ -0,0 +1,131 @@
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import msgpack
+from pydantic import BaseModel
+
+from imessage_service.server import RESULT_METADATA_FIELDS, VectorDBClient, format_query_results
+
+try:
+    # What FastAPI runs on every value of a returned dict before json.dumps
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    jsonable_encoder = None
+
+WORDS = (
+    "hey are we still on for dinner tonight I think so what time works for you "
+    "the train was late again did you see the game last night lol that was wild "
+    "can you send me the address sure thing running a few minutes behind no worries"
+).split()
+
+
+def synthetic_results(n: int, words_per_chunk: int = 120, seed: int = 0) -> dict:
+    """One query's worth of Chroma results shaped like real hits, author and duplicate flags included."""
+    rng = random.Random(seed)
+    handles = [f"+1555{rng.randrange(10**7):07d}" for _ in range(40)]
+    documents, metadatas = [], []
+    for i in range(n):
+        documents.append(" ".join(rng.choice(WORDS) for _ in range(words_per_chunk)))
+        start = datetime(2023, 1, 1) + timedelta(minutes=rng.randrange(500_000))
+        participants = rng.sample(handles, rng.randint(2, 8))
+        metadata = {
+            "chat_id": rng.randrange(200),
+            "group_chat_name": f"Group {rng.randrange(50)}",
+            "authors": ", ".join(participants),
+            "start_time": start.isoformat(),
+            "end_time": (start + timedelta(minutes=20)).isoformat(),
+            "start_ts": start.timestamp(),
+            "end_ts": start.timestamp() + 1200,
+            "offset_minutes": 0.0,
+        }
+        metadata.update({f"author:{handle}": True for handle in participants})
+        metadata.update({f"chat:{rng.randrange(200)}": True for _ in range(rng.choice([0, 0, 0, 3]))})
+        metadatas.append(metadata)
+    return {
+        "ids": [[f"{rng.randrange(200)}-{i}" for i in range(n)]],
+        "documents": [documents],
+        "metadatas": [metadatas],
+        "distances": [sorted(rng.uniform(0.2, 0.8) for _ in range(n))],
+        "space": "cosine",
+    }
+
+
+def project(results: dict) -> dict:
+    return {**results, "metadatas": [[{key: m[key] for key in RESULT_METADATA_FIELDS if key in m} for m in row]
+                                     for row in results["metadatas"]]}
+
+
+class PydanticQueryResult(BaseModel):
+    """QueryResult as it was before it became a dataclass, for the baseline."""
+    document: str
+    metadata: dict
+    distance: float
+    id: str | None = None
+    space: str = "l2"
+    rerank_score: float | None = None
+
+
+def validated_results(results: dict) -> list:
+    """How hits were decoded before: JSON with every metadata key, into validated pydantic models."""
+    return [PydanticQueryResult(document=doc, metadata=meta, distance=dist, id=result_id, space=results["space"])
+            for doc, meta, dist, result_id in zip(results["documents"][0], results["metadatas"][0],
+                                                  results["distances"][0], results["ids"][0])]
+
+
+def encode_json(results: dict) -> bytes:
+    return json.dumps(jsonable_encoder(results) if jsonable_encoder else results).encode()
+
+
+# (name, server side: results -> bytes, client side: bytes -> QueryResults)
+FORMATS = [
+    ("json", encode_json, lambda body: validated_results(json.loads(body))),
+    ("json+projection", lambda r: encode_json(project(r)), lambda body: format_query_results(json.loads(body))),
+    ("msgpack+projection", lambda r: msgpack.packb(project(r)), lambda body: format_query_results(msgpack.unpackb(body))),
+]
+
+
+def median_ms(fn, repeats: int) -> float:
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure per-query serialization cost of vector search responses by format")
+    parser.add_argument("--results", default="10,100,1000", help="Comma-separated hit counts per query")
+    parser.add_argument("--words-per-chunk", type=int, default=120)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--vector-db-url", help="Also time full /query round trips against this chroma-imessage server")
+    parser.add_argument("--collection", default="imessages")
+    parser.add_argument("--query", default="dinner plans for tonight")
+    args = parser.parse_args()
+    counts = [int(c) for c in args.results.split(",")]
+
+    if jsonable_encoder is None:
+        print("fastapi not installed: JSON encode times leave out FastAPI's jsonable_encoder pass\n")
+    print(f"{'results':>7} {'format':<19} {'KB':>8} {'encode ms':>10} {'decode ms':>10} {'total ms':>9}")
+    for count in counts:
+        results = synthetic_results(count, args.words_per_chunk)
+        for name, encode, decode in FORMATS:
+            body = encode(results)
+            encode_ms = median_ms(lambda: encode(results), args.repeats)
+            decode_ms = median_ms(lambda: decode(body), args.repeats)
+            print(f"{count:>7} {name:<19} {len(body) / 1024:>8.1f} {encode_ms:>10.3f} {decode_ms:>10.3f} {encode_ms + decode_ms:>9.3f}")
+        print()
+
+    if args.vector_db_url:
+        print(f"Round trips to {args.vector_db_url} (includes embedding the query and the vector search)")
+        print(f"{'results':>7} {'format':<8} {'p50 ms':>8}")
+        for count in counts:
+            for wire_format in ("json", "msgpack"):
+                client = VectorDBClient(args.vector_db_url, wire_format)
+                search = lambda: format_query_results(client.query_collection(args.query, count, args.collection))
+                search()
+                print(f"{count:>7} {wire_format:<8} {median_ms(search, args.repeats):>8.2f}")
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+QUERIES = [
+    "dinner plans", "running late", "birthday party", "the game last night",
+    "coffee next week", "send me the address", "vacation photos", "moving apartments",
+]
+
+
+def fake_results(n_queries: int, n_results: int) -> dict:
+    """Response in the shape of the vector server's /query, with plausible chunk metadata."""
+    rows = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+    for _ in range(n_queries):
+        rows["ids"].append([f"{i}-0-2023-06-01T12:00:00" for i in range(n_results)])
+        rows["documents"].append([" ".join(random.choices(QUERIES, k=12)) for _ in range(n_results)])
+        rows["metadatas"].append([
+            {"chat_id": i % 7, "group_chat_name": "Friends", "authors": "Me, Alex",
+             "start_time": "2023-06-01T12:00:00", "end_time": "2023-06-01T12:25:00"}
+            for i in range(n_results)
+        ])
+        rows["distances"].append(sorted(random.uniform(0.2, 0.6) for _ in range(n_results)))
+    return {**rows, "space": "cosine"}
+
+
+def start_vector_server(latency_ms: float, jitter_ms: float, port: int = 0) -> ThreadingHTTPServer:
+    """
+    Stand-in for the chroma-imessage server: answers /query, /query_sharded and /query_batch after
+    latency_ms (+/- jitter_ms), handling requests concurrently, so any serialization measured is the MCP server's.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            time.sleep(max(0.0, random.gauss(latency_ms, jitter_ms)) / 1000)
+            n_queries = len(body.get("queries", [])) if self.path == "/query_batch" else len(body.get("query_texts", [""]))
+            payload = json.dumps(fake_results(n_queries, body.get("n_results", 10))).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_load(session: ClientSession, n_requests: int, concurrency: int, rate: float,
+                   chat_fraction: float, n_results: int) -> tuple[list[float], int, float]:
+    """
+    Issue n_requests tool calls, at most `concurrency` in flight. With a rate (calls/s) calls are
+    scheduled open-loop and latency is measured from the scheduled start, so queueing delay counts.
+    Returns (latencies in ms, errors, elapsed seconds).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one_call(scheduled: float | None):
+        nonlocal errors
+        async with semaphore:
+            # Closed loop: time the call itself; open loop: include the wait since its scheduled start
+            scheduled = scheduled or time.perf_counter()
+            if random.random() < chat_fraction:
+                name, arguments = "search_chat", {"query": random.choice(QUERIES), "chat_id": str(random.randint(1, 50)), "n_results": n_results}
+            else:
+                name, arguments = "search_messages", {"query": random.choice(QUERIES), "n_results": n_results}
+            try:
+                result = await session.call_tool(name, arguments)
+                if result.isError or result.content[0].text.startswith("Error"):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - scheduled) * 1000)
+
+    start = time.perf_counter()
+    tasks = []
+    for i in range(n_requests):
+        scheduled = None
+        if rate > 0:
+            scheduled = start + i / rate
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(one_call(scheduled)))
+    await asyncio.gather(*tasks)
+    return sorted(latencies), errors, time.perf_counter() - start
+
+
+async def main(args):
+    vector_server = start_vector_server(args.latency_ms, args.jitter_ms)
+    url = f"http://127.0.0.1:{vector_server.server_address[1]}"
+    params = StdioServerParameters(
+        command=sys.executable,
+        args=["-c", "import imessage_service; imessage_service.main()"],
+        env={**os.environ, "VECTOR_DB_URL": url, "RERANK": "0"}
+    )
+    print(f"Stand-in vector server at {url}: {args.latency_ms:.0f} ms +/- {args.jitter_ms:.0f} ms per query")
+
+    async with stdio_client(params) as (read_stream, write_stream):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            await run_load(session, min(10, args.requests), 1, 0, args.chat_fraction, args.n_results)  # warm up
+
+            print(f"\n{'concurrency':>11} {'rate/s':>7} {'calls':>6} {'errors':>6} {'calls/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                latencies, errors, elapsed = await run_load(
+                    session, args.requests, concurrency, args.rate, args.chat_fraction, args.n_results
+                )
+                rate = f"{args.rate:g}" if args.rate > 0 else "max"
+                print(f"{concurrency:>11} {rate:>7} {len(latencies):>6} {errors:>6} {len(latencies) / elapsed:>8.1f} "
+                      f"{percentile(latencies, 0.50):>8.1f} {percentile(latencies, 0.95):>8.1f} {percentile(latencies, 0.99):>8.1f}")
+
+    # With no head-of-line blocking, throughput scales with concurrency up to ~concurrency / latency
+    print(f"\nIf calls ran concurrently, throughput would approach concurrency / {args.latency_ms / 1000:g}s "
+          f"and p50 would stay near {args.latency_ms:.0f} ms")
+    vector_server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the MCP server over stdio against a stand-in vector server")
+    parser.add_argument("--requests", type=int, default=200, help="Tool calls per concurrency level")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated numbers of calls in flight")
+    parser.add_argument("--rate", type=float, default=0, help="Target calls per second (0: as fast as the concurrency allows)")
+    parser.add_argument("--chat-fraction", type=float, default=0.3, help="Share of calls that are search_chat instead of search_messages")
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Artificial vector server latency")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    asyncio.run(main(parser.parse_args()))
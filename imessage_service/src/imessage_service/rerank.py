@@ -0,0 +1,109 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger("imessage-service")
+
+# Small cross-encoder; needs the optional `rerank` extra (sentence-transformers)
+RERANK_MODEL = os.getenv('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+# Longer pairs are truncated; cost grows with length, so this bounds the latency per candidate
+RERANK_MAX_LENGTH = int(os.getenv('RERANK_MAX_LENGTH', '256'))
+# Candidates fetched per requested result, and the cap on candidates per search
+RERANK_OVERFETCH = int(os.getenv('RERANK_OVERFETCH', '4'))
+RERANK_MAX_CANDIDATES = int(os.getenv('RERANK_MAX_CANDIDATES', '50'))
+# Past this many milliseconds the vector order is returned instead
+RERANK_BUDGET_MS = float(os.getenv('RERANK_BUDGET_MS', '300'))
+
+T = TypeVar("T")
+
+
+def rerank_candidates(n_results: int) -> int:
+    """How many vector search hits to fetch so the reranker has something to choose from."""
+    return max(n_results, min(n_results * RERANK_OVERFETCH, RERANK_MAX_CANDIDATES))
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, chunk) pairs with a local cross-encoder, loaded on first use.
+    Scoring runs on a single worker thread so the MCP event loop stays free and
+    concurrent searches don't compete for the same CPU cores.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, max_length: int = RERANK_MAX_LENGTH):
+        self.model_name = model_name
+        self.max_length = max_length
+        self._model = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+                except ImportError:
+                    raise RuntimeError("Reranking needs sentence-transformers: install imessage-service[rerank]")
+                logger.info(f"Loading rerank model {self.model_name}")
+                self._model = CrossEncoder(self.model_name, max_length=self.max_length)
+        return self._model
+
+    def score(self, query: str, documents: Sequence[str], deadline: Optional[float] = None) -> Optional[List[float]]:
+        """
+        Relevance scores for the documents, all pairs in one batched forward pass. Returns None without
+        running the model if time.monotonic() is already past deadline (the caller has given up waiting).
+        """
+        if not documents:
+            return []
+        if deadline is not None and time.monotonic() > deadline:
+            return None
+        model = self._load()
+        scores = model.predict(
+            [(query, document) for document in documents],
+            batch_size=len(documents),
+            show_progress_bar=False
+        )
+        return [float(s) for s in scores]
+
+    def warm_up(self) -> None:
+        """Start loading the model in the background so the first search doesn't pay for it."""
+        self._executor.submit(self._load)
+
+    async def rerank(
+        self,
+        query: str,
+        results: List[T],
+        budget_ms: Optional[float] = RERANK_BUDGET_MS,
+        text: Callable[[T], str] = lambda result: result.document
+    ) -> Tuple[List[T], Optional[List[float]]]:
+        """
+        Reorder results by cross-encoder score, best first. Returns (results, scores), or the
+        results unchanged and None if scoring failed or didn't finish within budget_ms.
+        """
+        if len(results) < 2:
+            return results, None
+        loop = asyncio.get_running_loop()
+        try:
+            # Loading the model is a one-time cost, paid outside the budget (and not behind queued passes)
+            await loop.run_in_executor(None, self._load)
+        except Exception as e:
+            logger.error(f"Rerank failed, using vector order: {str(e)}")
+            return results, None
+        timeout = budget_ms / 1000 if budget_ms else None
+        deadline = time.monotonic() + timeout if timeout else None
+        future = loop.run_in_executor(self._executor, self.score, query, [text(r) for r in results], deadline)
+        try:
+            scores = await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            # A pass still queued is skipped at its deadline; one already running can't be interrupted,
+            # it finishes in the background and is discarded
+            logger.warning(f"Rerank of {len(results)} candidates exceeded {budget_ms:.0f} ms, using vector order")
+            return results, None
+        except Exception as e:
+            logger.error(f"Rerank failed, using vector order: {str(e)}")
+            return results, None
+        order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)
+        return [results[i] for i in order], [scores[i] for i in order]
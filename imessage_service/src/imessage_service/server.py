@@ -1,6 +1,16 @@
 import os
+import re
+import time
+import difflib
+import uuid
+import sqlite3
 import requests
+import json
 import logging
+import polars as pl
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from collections import OrderedDict
 from collections.abc import Sequence
 from typing import Any, Optional, Dict, List, Union
 from pathlib import Path
@@ -17,6 +27,13 @@ from mcp.types import (
 )
 from pydantic import BaseModel
 
+from .rerank import CrossEncoderReranker, rerank_candidates
+
+try:
+    import msgpack
+except ImportError:  # Vector server responses are then read as JSON
+    msgpack = None
+
 # Load environment variables
 load_dotenv()
 
@@ -27,69 +44,708 @@ logger = logging.getLogger("imessage-service")
 # Vector DB Configuration
 VECTOR_DB_URL = os.getenv('VECTOR_DB_URL', 'http://localhost:8000')
 DEFAULT_COLLECTION = "imessages"
+# Per-chat-per-day digests written by process_chats(..., digests=True), searched first in hierarchical mode
+DAYS_COLLECTION = os.getenv('DAYS_COLLECTION', f"{DEFAULT_COLLECTION}_days")
+# Set when ingestion wrote time-sharded collections (imessages_2023, ...) instead of one collection
+VECTOR_DB_SHARDED = os.getenv('VECTOR_DB_SHARDED', '').lower() in ('1', 'true', 'yes')
+# Ask the vector server for msgpack query responses (if msgpack is installed) instead of JSON
+VECTOR_DB_FORMAT = os.getenv('VECTOR_DB_FORMAT', 'msgpack').lower()
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Metadata keys that formatting search hits reads; the vector server leaves out the rest,
+# such as the author:<handle> and chat:<id> filter flags, which can outnumber them many times over
+RESULT_METADATA_FIELDS = ["chat_id", "group_chat_name", "authors", "start_time", "end_time", "n_duplicates", "duplicates"]
+DAY_METADATA_FIELDS = ["chat_id", "day", "start_ts", "end_ts"]
+
+# Time-sorted message index written by main.py / ingest_daemon.py
+MESSAGE_INDEX_PATH = os.getenv('MESSAGE_INDEX_PATH', 'message_index.db')
+
+# Rerank search hits with a local cross-encoder unless a call passes rerank=false (see rerank.py for tuning)
+RERANK_DEFAULT = os.getenv('RERANK', '').lower() in ('1', 'true', 'yes')
+
+# Parquet conversation rollups written by build_rollups.py
+ROLLUP_DIR = os.getenv('ROLLUP_DIR', 'rollups')
+
+# Manifest of accounts ingested by ingest_accounts.py; when set, tools take an "account" argument
+ACCOUNTS_MANIFEST = os.getenv('ACCOUNTS_MANIFEST')
+
+# Search candidate lists kept for pagination
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '64'))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv('RESULT_CACHE_TTL_SECONDS', '1800'))
+
+def combine_where(*conditions: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """AND together the non-empty where filters."""
+    conditions = [c for c in conditions if c]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def any_of(conditions: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """OR together where filters (Chroma requires at least two operands for $or)."""
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$or": conditions}
+
+def author_key(handle: str) -> str:
+    """Metadata key ingestion sets on chunks the handle wrote in (see generate_embedding_vectors.author_key)."""
+    return f"author:{handle}"
+
+def chat_key(chat_id: int) -> str:
+    """Metadata key dedup sets on chunks whose text also occurs in the chat (see chunk_dedup.chat_key)."""
+    return f"chat:{chat_id}"
+
+def chat_filter(chat_ids: List[int]) -> Optional[Dict[str, Any]]:
+    """Where filter for chunks from any of the chats, including near-duplicates that were stored under another chat."""
+    in_chats = {"chat_id": chat_ids[0]} if len(chat_ids) == 1 else {"chat_id": {"$in": chat_ids}}
+    return any_of([in_chats] + [{chat_key(chat_id): True} for chat_id in chat_ids])
+
+def day_filter(days: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Where filter for chunks overlapping any of the given chat days (metadata of day digests)."""
+    return any_of([
+        {"$and": [{"chat_id": day["chat_id"]}, {"end_ts": {"$gte": day["start_ts"]}}, {"start_ts": {"$lt": day["end_ts"]}}]}
+        for day in days
+    ])
+
+def to_epoch(value: str) -> float:
+    """ISO date/time (naive means UTC, like the stored chat timestamps) to epoch seconds."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def end_of_day_epoch(value: str) -> float:
+    """Like to_epoch, but a bare date means the end of that day, so end_date is inclusive."""
+    return to_epoch(value) + (86400 if "T" not in value and " " not in value else 0)
 
 class VectorDBClient:
-    def __init__(self, base_url: str = VECTOR_DB_URL):
+    def __init__(self, base_url: str = VECTOR_DB_URL, wire_format: str = VECTOR_DB_FORMAT):
         self.base_url = base_url.rstrip('/')
+        self.headers = {"Accept": f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.5"} if msgpack and wire_format == "msgpack" else {}
+    
+    def _post_query(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a query and decode the response in whichever format the server chose."""
+        response = requests.post(f"{self.base_url}{path}", json=payload, headers=self.headers)
+        response.raise_for_status()
+        if response.headers.get("content-type", "").startswith(MSGPACK_MEDIA_TYPE):
+            return msgpack.unpackb(response.content)
+        return response.json()
         
     def query_collection(
         self,
         query_text: str,
         n_results: int = 10,
         collection_name: str = DEFAULT_COLLECTION,
-        where: Optional[Dict] = None
+        where: Optional[Dict] = None,
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+        sharded: bool = VECTOR_DB_SHARDED,
+        metadata_fields: Optional[List[str]] = RESULT_METADATA_FIELDS
     ) -> Dict[str, Any]:
-        """Query the vector database for similar chunks."""
+        """
+        Query the vector database for similar chunks, optionally only those overlapping
+        [start_ts, end_ts] (epoch seconds). Sharded collections are searched through
+        /query_sharded, which skips shards outside the time range entirely.
+        """
         try:
             payload = {
                 "query_texts": [query_text],
                 "n_results": n_results,
                 "collection_name": collection_name,
-                "include": ["documents", "metadatas", "distances"]
+                "include": ["documents", "metadatas", "distances"],
+                "metadata_fields": metadata_fields
             }
+            if sharded:
+                payload["start_ts"] = start_ts
+                payload["end_ts"] = end_ts
+            else:
+                where = combine_where(
+                    where,
+                    {"end_ts": {"$gte": start_ts}} if start_ts is not None else None,
+                    {"start_ts": {"$lte": end_ts}} if end_ts is not None else None
+                )
             if where:
                 payload["where"] = where
                 
+            return self._post_query("/query_sharded" if sharded else "/query", payload)
+            
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Vector DB query failed: {str(e)}")
+            raise RuntimeError(f"Vector DB error: {str(e)}")
+
+    def query_collection_batch(
+        self,
+        queries: List[Dict[str, Any]],
+        n_results: int = 10,
+        collection_name: str = DEFAULT_COLLECTION
+    ) -> Dict[str, Any]:
+        """
+        Query the vector database with many queries in one round trip.
+        Each query is a dict with "query_text" and optional "where"/"where_document" filters;
+        the results have one row per query, in order.
+        """
+        try:
+            payload = {
+                "queries": queries,
+                "n_results": n_results,
+                "collection_name": collection_name,
+                "include": ["documents", "metadatas", "distances"],
+                "metadata_fields": RESULT_METADATA_FIELDS
+            }
+            return self._post_query("/query_batch", payload)
+            
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Vector DB batch query failed: {str(e)}")
+            raise RuntimeError(f"Vector DB error: {str(e)}")
+
+    def find_chats(self, query_text: str, n_results: int = 10, collection_name: str = DEFAULT_COLLECTION) -> List[Dict[str, Any]]:
+        """Chats ranked by the similarity of their chunk centroids to the query (see /find_chats)."""
+        try:
             response = requests.post(
-                f"{self.base_url}/query",
-                json=payload
+                f"{self.base_url}/find_chats",
+                json={"query_text": query_text, "n_results": n_results, "collection_name": collection_name}
             )
             response.raise_for_status()
-            return response.json()
+            return response.json()["chats"]
             
         except requests.exceptions.RequestException as e:
-            logger.error(f"Vector DB query failed: {str(e)}")
+            logger.error(f"Vector DB find_chats failed: {str(e)}")
             raise RuntimeError(f"Vector DB error: {str(e)}")
 
-class QueryResult(BaseModel):
+class MessageIndex:
+    """Read-only access to the (chat_id, date_sent)-sorted message index built at extraction time."""
+
+    def __init__(self, path: str = MESSAGE_INDEX_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if not os.path.exists(self.path):
+                raise RuntimeError(f"Message index not found at {self.path}. Run main.py to build it.")
+            self._conn = sqlite3.connect(
+                f"{Path(self.path).resolve().as_uri()}?mode=ro",
+                uri=True,
+                check_same_thread=False
+            )
+        return self._conn
+
+    def chat_name(self, chat_id: int) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT group_chat_name FROM chats WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_context(
+        self,
+        chat_id: int,
+        start_time: str,
+        end_time: str,
+        n_before: int = 10,
+        n_after: int = 10,
+        max_within: int = 200
+    ) -> Dict[str, List[tuple]]:
+        """
+        Messages of a chat around [start_time, end_time]: up to n_before before it, the messages
+        inside it (capped at max_within) and up to n_after after it. Each one is a single range scan.
+        Rows are (date_sent, author_handle, author_name, text) tuples in chronological order.
+        """
+        conn = self._connection()
+        columns = "date_sent, author_handle, author_name, text"
+        before = conn.execute(
+            f"SELECT {columns} FROM messages WHERE chat_id = ? AND date_sent < ? ORDER BY date_sent DESC LIMIT ?",
+            (chat_id, start_time, n_before)
+        ).fetchall()
+        within = conn.execute(
+            f"SELECT {columns} FROM messages WHERE chat_id = ? AND date_sent >= ? AND date_sent <= ? ORDER BY date_sent LIMIT ?",
+            (chat_id, start_time, end_time, max_within)
+        ).fetchall()
+        after = conn.execute(
+            f"SELECT {columns} FROM messages WHERE chat_id = ? AND date_sent > ? ORDER BY date_sent LIMIT ?",
+            (chat_id, end_time, n_after)
+        ).fetchall()
+        return {"before": before[::-1], "within": within, "after": after}
+
+    def find_people(self, person: str, min_score: float = 0.75) -> List[tuple]:
+        """
+        Resolve a name (partial or misspelled) or a phone number/email to the best matching people,
+        as (name, handles) tuples. Several people are returned only if they match equally well.
+        """
+        conn = self._connection()
+        needle = person.strip().casefold()
+        digits = re.sub(r"\D", "", needle)
+        handles_by_name: Dict[str, set] = {}
+        for name, handle in conn.execute(
+            "SELECT name, handle FROM contacts UNION SELECT author_name, author_handle FROM handle_chats"
+        ):
+            handles_by_name.setdefault(name or handle, set()).add(handle)
+
+        # Handles match exactly, or phone numbers by their trailing digits (formats differ: +1 (555) ... vs 555...)
+        handle_matches = {
+            name: handles for name, handles in handles_by_name.items()
+            if any(h.casefold() == needle or (len(digits) >= 7 and re.sub(r"\D", "", h).endswith(digits)) for h in handles)
+        }
+        if handle_matches:
+            return sorted(handle_matches.items())
+
+        def score(name: str) -> float:
+            candidate = name.casefold()
+            tokens = candidate.split()
+            if candidate == needle:
+                return 1.0
+            if any(token.startswith(needle) for token in tokens) or candidate.startswith(needle):
+                return 0.9
+            if needle in candidate:
+                return 0.8
+            return max(difflib.SequenceMatcher(None, needle, option).ratio() for option in [candidate, *tokens])
+
+        scores = {name: score(name) for name in handles_by_name}
+        best = max(scores.values(), default=0.0)
+        if best < min_score:
+            return []
+        return sorted((name, handles_by_name[name]) for name, s in scores.items() if s == best)
+
+    def chats_with(self, handles: List[str]) -> List[int]:
+        """Chats in which any of the handles wrote, most active first."""
+        placeholders = ", ".join("?" for _ in handles)
+        rows = self._connection().execute(
+            f"SELECT chat_id FROM handle_chats WHERE author_handle IN ({placeholders}) GROUP BY chat_id ORDER BY SUM(n_messages) DESC",
+            list(handles)
+        ).fetchall()
+        return [chat_id for (chat_id,) in rows]
+
+class Rollups:
+    """Read-only access to the parquet rollups written by build_rollups.py, reloaded whenever a file is replaced."""
+
+    def __init__(self, rollup_dir: str = ROLLUP_DIR):
+        self.rollup_dir = rollup_dir
+        self._tables: Dict[str, pl.DataFrame] = {}
+        self._mtimes: Dict[str, float] = {}
+
+    def table(self, name: str) -> pl.DataFrame:
+        path = os.path.join(self.rollup_dir, f"{name}.parquet")
+        if not os.path.exists(path):
+            raise RuntimeError(f"Rollups not found in {self.rollup_dir}. Run main.py or build_rollups.py to build them.")
+        mtime = os.path.getmtime(path)
+        if self._mtimes.get(name) != mtime:
+            self._tables[name] = pl.read_parquet(path)
+            self._mtimes[name] = mtime
+        return self._tables[name]
+
+    def find_contacts(self, contact: str) -> pl.DataFrame:
+        """Contacts whose handle or name contains the given text (case-insensitive), most messages first."""
+        needle = contact.strip().lower()
+        return self.table("contacts").filter(
+            pl.col("author_handle").str.to_lowercase().str.contains(needle, literal=True)
+            | pl.col("author_name").str.to_lowercase().str.contains(needle, literal=True).fill_null(False)
+        ).sort("n_messages", descending=True)
+
+    def chat(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        rows = self.table("chats").filter(pl.col("chat_id") == chat_id).to_dicts()
+        return rows[0] if rows else None
+
+    def top_contacts(self, limit: int = 10, sort_by: str = "messages",
+                     start_date: Optional[str] = None, end_date: Optional[str] = None) -> pl.DataFrame:
+        """
+        Contacts ranked by message volume (both sides of their 1:1 chats plus their group messages) or by
+        most recent conversation. With a date range, volume counts only their 1:1 chats within it.
+        """
+        contacts = self.table("contacts")
+        if start_date or end_date:
+            direct_chats = self.table("participants").join(
+                self.table("chats").filter(~pl.col("is_group")).select("chat_id"), on="chat_id"
+            )
+            counts = self.activity(start_date=start_date, end_date=end_date).join(direct_chats, on="chat_id").group_by("author_handle").agg(
+                n_messages=pl.col("n_messages").sum(), n_direct_from_me=pl.col("n_from_me").sum()
+            )
+            contacts = contacts.drop("n_messages", "n_direct_messages", "n_direct_from_me", "my_share", "n_group_from_them").join(
+                counts, on="author_handle"
+            ).with_columns(
+                n_direct_messages=pl.col("n_messages"),
+                my_share=pl.col("n_direct_from_me") / pl.col("n_messages"),
+                n_group_from_them=pl.lit(None, pl.UInt32)
+            )
+        sort_column = "last_message" if sort_by == "recent" else "n_messages"
+        return contacts.sort(sort_column, descending=True, nulls_last=True).head(limit)
+
+    def top_chats(self, limit: int = 10, sort_by: str = "messages",
+                  start_date: Optional[str] = None, end_date: Optional[str] = None) -> pl.DataFrame:
+        """Chats ranked by message count (optionally within a date range) or by most recent message."""
+        chats = self.table("chats")
+        if start_date or end_date:
+            counts = self.activity(start_date=start_date, end_date=end_date).group_by("chat_id").agg(
+                n_messages=pl.col("n_messages").sum(), n_from_me=pl.col("n_from_me").sum()
+            )
+            chats = chats.drop("n_messages", "n_from_me").join(counts, on="chat_id")
+        sort_column = "last_message" if sort_by == "recent" else "n_messages"
+        return chats.sort(sort_column, descending=True, nulls_last=True).head(limit)
+
+    def activity(self, chat_ids: Optional[List[int]] = None, granularity: str = "day",
+                 start_date: Optional[str] = None, end_date: Optional[str] = None) -> pl.DataFrame:
+        """Per-chat message counts by day or week, optionally for some chats and an ISO date range."""
+        period = "week" if granularity == "week" else "day"
+        activity = self.table("weekly" if period == "week" else "daily")
+        if chat_ids is not None:
+            activity = activity.filter(pl.col("chat_id").is_in(chat_ids))
+        if start_date:
+            activity = activity.filter(pl.col(period) >= datetime.fromisoformat(start_date).date())
+        if end_date:
+            activity = activity.filter(pl.col(period) <= datetime.fromisoformat(end_date).date())
+        return activity
+
+    def contact_chat_ids(self, author_handle: str, direct_only: bool = False) -> List[int]:
+        chat_ids = self.table("participants").filter(pl.col("author_handle") == author_handle)["chat_id"]
+        if direct_only:
+            chat_ids = self.table("chats").filter(pl.col("chat_id").is_in(chat_ids) & ~pl.col("is_group"))["chat_id"]
+        return chat_ids.to_list()
+
+class Account:
+    """Where one account's data lives: its chunk and day digest collections, message index and rollups."""
+
+    def __init__(self, name: str, collection: str, days_collection: str, index_path: str, rollup_dir: str):
+        self.name = name
+        self.collection = collection
+        self.days_collection = days_collection
+        self.message_index = MessageIndex(index_path)
+        self.rollups = Rollups(rollup_dir)
+
+def load_accounts(manifest_path: Optional[str] = ACCOUNTS_MANIFEST) -> Dict[str, Account]:
+    """
+    The accounts in an ingest_accounts.py manifest, by name and in manifest order; the first is the
+    default. Without a manifest, one unnamed account configured by the environment variables above.
+    """
+    if not manifest_path:
+        return {"": Account("", DEFAULT_COLLECTION, DAYS_COLLECTION, MESSAGE_INDEX_PATH, ROLLUP_DIR)}
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    accounts = {}
+    for entry in manifest["accounts"]:
+        # Same layout as ingest_accounts.py writes: index and rollups inside the account's directory
+        path = os.path.join(base_dir, entry["path"])
+        collection = entry.get("collection") or f"{DEFAULT_COLLECTION}_{entry['name']}"
+        accounts[entry["name"]] = Account(
+            entry["name"],
+            collection,
+            f"{collection}_days",
+            os.path.join(path, "message_index.db"),
+            os.path.join(path, "rollups")
+        )
+    return accounts
+
+def normalize_timestamp(value: str) -> str:
+    """Parse an ISO timestamp into the naive-UTC ISO form the index stores."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat()
+
+def parse_chat_id(value: Any) -> Any:
+    """Chat ids are stored as integers, but agents often pass them as strings."""
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+@dataclass(slots=True)
+class QueryResult:
+    """One search hit. Up to hundreds are built per search, so a slotted dataclass rather than a pydantic model."""
     document: str
     metadata: Dict[str, Any]
     distance: float
+    id: Optional[str] = None
+    space: str = "l2"
+    rerank_score: Optional[float] = None
 
-def format_query_results(results: Dict[str, Any]) -> List[QueryResult]:
-    """Format raw vector DB results into structured objects."""
+def format_query_results(results: Dict[str, Any], query_index: int = 0) -> List[QueryResult]:
+    """Format raw vector DB results (for one of the queries) into structured objects."""
     formatted_results = []
     
-    if not results.get('documents') or not results['documents'][0]:
+    if not results.get('documents') or not results['documents'][query_index]:
         return formatted_results
         
-    documents = results['documents'][0]
-    metadatas = results['metadatas'][0]
-    distances = results['distances'][0]
+    documents = results['documents'][query_index]
+    metadatas = results['metadatas'][query_index]
+    distances = results['distances'][query_index]
+    ids = results['ids'][query_index] if results.get('ids') else [None] * len(documents)
+    # Servers that don't report the collection's distance space use Chroma's default
+    space = results.get('space', 'l2')
     
-    for doc, meta, dist in zip(documents, metadatas, distances):
+    for doc, meta, dist, result_id in zip(documents, metadatas, distances, ids):
         formatted_results.append(
             QueryResult(
                 document=doc,
                 metadata=meta,
-                distance=dist
+                distance=dist,
+                id=result_id,
+                space=space
             )
         )
     
     return formatted_results
 
-# Initialize vector DB client
+def fuse_results(result_lists: List[List[QueryResult]], k: int = 60) -> List[QueryResult]:
+    """
+    Reciprocal rank fusion: merge ranked lists by summing 1 / (k + rank) per chunk,
+    so chunks that several paraphrased queries agree on rise to the top.
+    """
+    scores: Dict[str, float] = {}
+    best: Dict[str, QueryResult] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, 1):
+            key = result.id or result.document
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            if key not in best or result.distance < best[key].distance:
+                best[key] = result
+    return [best[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+def relevance(result: QueryResult) -> float:
+    """Cosine similarity of a hit, assuming normalized embeddings (as BGE's are)."""
+    if result.space == "l2":
+        # Chroma's l2 is the squared distance, which is 2 - 2 * cosine for unit vectors
+        return 1 - result.distance / 2
+    # cosine distance is 1 - cosine, ip distance is 1 - dot product
+    return 1 - result.distance
+
+def format_result(i: int, result: QueryResult, include_chat: bool = True) -> str:
+    """One numbered search hit, with the chat id and time range needed to fetch its context."""
+    metadata = result.metadata
+    text = f"\n{i}. Message: {result.document}\n"
+    text += f"   From: {metadata.get('authors', 'Unknown')}\n"
+    if include_chat:
+        text += f"   Chat: {metadata.get('group_chat_name') or 'N/A'} (chat_id: {metadata.get('chat_id', 'N/A')})\n"
+    text += f"   Date: {metadata.get('start_time', 'N/A')} to {metadata.get('end_time', 'N/A')}\n"
+    if metadata.get('n_duplicates'):
+        copies = json.loads(metadata.get('duplicates') or '[]')
+        chats = sorted({copy['chat_id'] for copy in copies})
+        text += f"   Also sent {metadata['n_duplicates']} more time(s) (chat_ids: {', '.join(map(str, chats))})\n"
+    text += f"   Relevance: {relevance(result):.4f}\n"
+    if result.rerank_score is not None:
+        text += f"   Rerank score: {result.rerank_score:.4f}\n"
+    return text
+
+def relative_time(timestamp: Optional[str], now: Optional[datetime] = None) -> str:
+    """'3d ago'-style age of a naive-UTC ISO timestamp."""
+    if not timestamp:
+        return "?"
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    seconds = (now - datetime.fromisoformat(timestamp)).total_seconds()
+    for unit, size in (("y", 365 * 86400), ("mo", 30 * 86400), ("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{int(seconds // size)}{unit} ago"
+    return "just now"
+
+def sender_code(n: int) -> str:
+    """A, B, ..., Z, AA, AB, ... for dictionary-encoding sender names."""
+    code = ""
+    n += 1
+    while n:
+        n, remainder = divmod(n - 1, 26)
+        code = chr(ord("A") + remainder) + code
+    return code
+
+def snippet(text: str, max_chars: int) -> str:
+    text = " / ".join(line.strip() for line in text.splitlines() if line.strip())
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + "…"
+
+def format_results_compact(results: List[QueryResult], start: int = 0, include_chat: bool = True, snippet_chars: int = 160) -> str:
+    """
+    Token-lean rendering: truncated snippets, senders replaced by short codes from a legend,
+    and relative timestamps. Chat ids are kept so get_conversation_context still works.
+    """
+    codes: Dict[str, str] = {}
+    lines = []
+    for i, result in enumerate(results, start + 1):
+        metadata = result.metadata
+        authors = [a for a in str(metadata.get('authors') or '').split(', ') if a]
+        senders = ",".join(codes.setdefault(a, sender_code(len(codes))) for a in authors)
+        fields = []
+        if include_chat:
+            chat_name = metadata.get('group_chat_name')
+            fields.append(f"chat {metadata.get('chat_id', '?')}{f' {chat_name}' if chat_name else ''}")
+        fields += [relative_time(metadata.get('start_time')), senders or "?", f"{relevance(result):.2f}"]
+        lines.append(f"{i}. [{' | '.join(fields)}] {snippet(result.document, snippet_chars)}")
+    legend = "Senders: " + "; ".join(f"{code}={author}" for author, code in codes.items())
+    return "\n".join([legend] + lines) + "\n"
+
+class CachedSearch(BaseModel):
+    title: str
+    results: List[QueryResult]
+    include_chat: bool = True
+    page_size: Optional[int] = None
+
+class ResultCache:
+    """
+    Recent searches' full candidate lists, keyed by cursor, so later pages are sliced
+    from memory instead of re-running the vector search. Entries expire after a TTL
+    and the least recently used are dropped once the cache is full.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, CachedSearch]]" = OrderedDict()
+
+    def put(self, search: CachedSearch) -> str:
+        key = uuid.uuid4().hex[:12]
+        self._entries[key] = (time.monotonic(), search)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return key
+
+    def get(self, key: str) -> CachedSearch:
+        created, search = self._entries.get(key, (None, None))
+        if search is None or time.monotonic() - created > self.ttl_seconds:
+            self._entries.pop(key, None)
+            raise ValueError("Unknown or expired cursor, please run the search again")
+        self._entries.move_to_end(key)
+        return search
+
+def render_page(search: CachedSearch, page_size: Optional[int] = None, cursor: Optional[str] = None,
+                compact: bool = False, snippet_chars: int = 160) -> str:
+    """
+    Render one page of a search. Without a cursor this is the first page; if more results remain,
+    the candidate list is cached and the response ends with the cursor for the next page.
+    """
+    if cursor:
+        key, _, offset = cursor.partition(":")
+        search = result_cache.get(key)
+        start = int(offset or 0)
+    else:
+        key = None
+        start = 0
+    total = len(search.results)
+    # Later pages keep the first page's size unless asked otherwise
+    page_size = page_size or search.page_size or total
+    search.page_size = page_size
+    page = search.results[start:start + page_size]
+    
+    title = search.title
+    if start > 0 or start + len(page) < total:
+        title += f" (results {start + 1}-{start + len(page)} of {total})"
+    response_parts = [f"{title}:\n"]
+    if compact:
+        response_parts.append(format_results_compact(page, start, search.include_chat, snippet_chars))
+    else:
+        for i, result in enumerate(page, start + 1):
+            response_parts.append(format_result(i, result, include_chat=search.include_chat))
+    
+    if start + len(page) < total:
+        key = key or result_cache.put(search)
+        response_parts.append(f"\nMore results available. Pass cursor=\"{key}:{start + len(page)}\" for the next page.\n")
+    return "".join(response_parts)
+
+async def rerank_results(query: str, results: List[QueryResult], n_results: int) -> List[QueryResult]:
+    """Reorder over-fetched vector hits with the cross-encoder and keep the best n_results (vector order if over budget)."""
+    reranked, scores = await reranker.rerank(query, results)
+    if scores is not None:
+        reranked = [replace(result, rerank_score=score) for result, score in zip(reranked, scores)]
+    return reranked[:n_results]
+
+def format_context_message(row: tuple, marker: str = " ") -> str:
+    date_sent, author_handle, author_name, text = row
+    return f"{marker} [{date_sent}] {author_name or author_handle or 'Unknown'}: {text or ''}\n"
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "n/a"
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f}h"
+    return f"{seconds / 86400:.1f}d"
+
+def format_share(share: Optional[float]) -> str:
+    return "n/a" if share is None else f"{share:.0%}"
+
+def format_chat_stats(i: int, row: Dict[str, Any]) -> str:
+    kind = "group" if row["is_group"] else "1:1"
+    return (
+        f"{i}. {row['chat_name']} (Chat {row['chat_id']}, {kind})\n"
+        f"   Messages: {row['n_messages']} ({row['n_from_me']} from me, {format_share(row['n_from_me'] / row['n_messages'] if row['n_messages'] else None)})\n"
+        f"   First: {row['first_message']}  Last: {row['last_message']}\n"
+        f"   Median reply time: me {format_duration(row['my_median_reply_seconds'])}, them {format_duration(row['their_median_reply_seconds'])}\n"
+    )
+
+def format_found_chat(i: int, chat: Dict[str, Any]) -> str:
+    """One find_chats hit: who is in the chat and when it was active, enough to pick a chat_id for search_chat."""
+    participants = ", ".join(chat["authors"]) or "Unknown"
+    dates = [
+        datetime.fromtimestamp(chat[key], timezone.utc).date().isoformat() if chat.get(key) is not None else "?"
+        for key in ("start_ts", "end_ts")
+    ]
+    return (
+        f"{i}. {chat.get('group_chat_name') or participants} (chat_id: {chat['chat_id']})\n"
+        f"   Participants: {participants}\n"
+        f"   Active: {dates[0]} to {dates[1]} ({chat['n_chunks']} chunks)\n"
+        f"   Relevance: {chat['score']:.4f}\n"
+    )
+
+def format_contact_stats(i: int, row: Dict[str, Any]) -> str:
+    name = f"{row['author_name']} ({row['author_handle']})" if row["author_name"] else row["author_handle"]
+    # Counts restricted to a date range only cover 1:1 chats
+    group_messages = "" if row["n_group_from_them"] is None else f"; their group chat messages: {row['n_group_from_them']}"
+    return (
+        f"{i}. {name}\n"
+        f"   Messages: {row['n_messages']} (1:1 chats: {row['n_direct_messages']}, {format_share(row['my_share'])} from me{group_messages})\n"
+        f"   Chats: {row['n_chats']} ({row['n_group_chats']} group)\n"
+        f"   First: {row['first_message']}  Last: {row['last_message']}  Last from them: {row['last_from_them']}\n"
+        f"   Median reply time: me {format_duration(row['my_median_reply_seconds'])}, them {format_duration(row['their_median_reply_seconds'])}\n"
+    )
+
+def resolve_account(arguments: Any) -> Account:
+    """The account named by a tool call's "account" argument, or the default account."""
+    name = arguments.get("account") if isinstance(arguments, dict) else None
+    if not name:
+        return next(iter(accounts.values()))
+    if name not in accounts:
+        known = ", ".join(a for a in accounts if a)
+        raise ValueError(f"Unknown account \"{name}\"" + (f". Known accounts: {known}" if known else ". Set ACCOUNTS_MANIFEST to search several accounts"))
+    return accounts[name]
+
+def format_activity(activity: pl.DataFrame, period: str) -> str:
+    totals = activity.group_by(period).agg(pl.col("n_messages").sum(), pl.col("n_from_me").sum()).sort(period)
+    if len(totals) == 0:
+        return "   No messages in that period.\n"
+    return "".join(f"   {day}: {n} messages ({mine} from me)\n" for day, n, mine in totals.iter_rows())
+
+# Initialize vector DB client, accounts (message index and rollups of each) and pagination cache
 vector_db = VectorDBClient()
+accounts = load_accounts()
+result_cache = ResultCache()
+reranker = CrossEncoderReranker()
+
+RERANK_PROPERTY = {
+    "type": "boolean",
+    "description": f"Fetch extra candidates and reorder them with a local cross-encoder before returning n_results (default: {str(RERANK_DEFAULT).lower()})",
+    "default": RERANK_DEFAULT
+}
+
+PAGINATION_PROPERTIES = {
+    "page_size": {
+        "type": "integer",
+        "description": "Results per page. If fewer than n_results, the response includes a cursor for the next page (default: all n_results at once)"
+    },
+    "cursor": {
+        "type": "string",
+        "description": "Cursor from a previous response to fetch its next page without searching again (other arguments are then ignored)"
+    },
+    "compact": {
+        "type": "boolean",
+        "description": "Compact output: truncated snippets, sender codes and relative dates (default: false)",
+        "default": False
+    },
+    "snippet_chars": {
+        "type": "integer",
+        "description": "Maximum characters per snippet in compact output (default: 160)",
+        "default": 160
+    }
+}
+
+ACCOUNT_PROPERTY = {
+    "type": "string",
+    "description": "Which account's messages to use, when several are indexed (default: the first account)"
+}
 
 app = Server("imessage-service")
 
@@ -99,7 +755,7 @@ async def list_tools() -> list[Tool]:
     return [
         Tool(
             name="search_messages",
-            description="Search through iMessage history using semantic similarity to find relevant messages and conversations",
+            description="Search through iMessage history using semantic similarity to find relevant messages and conversations. Requires query, unless fetching the next page with cursor",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -116,14 +772,36 @@ async def list_tools() -> list[Tool]:
                         "type": "string",
                         "description": "Optional filter by message category (e.g. 'personal', 'work', 'family')",
                         "default": None
-                    }
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Optional ISO date; only search conversations on or after it (e.g. '2023-06-01')"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Optional ISO date; only search conversations on or before it"
+                    },
+                    "mode": {
+                        "type": "string",
+                        "enum": ["flat", "hierarchical"],
+                        "description": "\"hierarchical\" first finds the most relevant days of conversation, then searches only within them; good for broad questions over a long history (default: flat)",
+                        "default": "flat"
+                    },
+                    "n_days": {
+                        "type": "integer",
+                        "description": "Number of days to search within in hierarchical mode (default: 5)",
+                        "default": 5
+                    },
+                    "rerank": RERANK_PROPERTY,
+                    "account": ACCOUNT_PROPERTY,
+                    **PAGINATION_PROPERTIES
                 },
-                "required": ["query"]
+                "required": []
             }
         ),
         Tool(
             name="search_chat",
-            description="Search within a specific iMessage chat or conversation",
+            description="Search within a specific iMessage chat or conversation. Requires query and chat_id, unless fetching the next page with cursor",
             inputSchema={
                 "type": "object", 
                 "properties": {
@@ -139,9 +817,198 @@ async def list_tools() -> list[Tool]:
                         "type": "integer",
                         "description": "Number of message chunks to return (default: 10)",
                         "default": 10
-                    }
+                    },
+                    "rerank": RERANK_PROPERTY,
+                    "account": ACCOUNT_PROPERTY,
+                    **PAGINATION_PROPERTIES
+                },
+                "required": []
+            }
+        ),
+        Tool(
+            name="search_person",
+            description="Search what you discussed with a specific person (e.g. 'what did Alice say about the trip'). Resolves a name or phone number/email to their chats and searches only those. Requires person and query, unless fetching the next page with cursor",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "person": {
+                        "type": "string",
+                        "description": "Contact name (partial or approximate is fine), phone number or email"
+                    },
+                    "query": {
+                        "type": "string",
+                        "description": "What to search for in conversations with this person"
+                    },
+                    "scope": {
+                        "type": "string",
+                        "enum": ["said", "chats"],
+                        "description": "\"said\": only passages where the person wrote something; \"chats\": anything in chats they are part of (default: said)",
+                        "default": "said"
+                    },
+                    "n_results": {
+                        "type": "integer",
+                        "description": "Number of message chunks to return (default: 10)",
+                        "default": 10
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Optional ISO date; only search conversations on or after it"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Optional ISO date; only search conversations on or before it"
+                    },
+                    "rerank": RERANK_PROPERTY,
+                    "account": ACCOUNT_PROPERTY,
+                    **PAGINATION_PROPERTIES
+                },
+                "required": []
+            }
+        ),
+        Tool(
+            name="search_messages_batch",
+            description="Run several searches (e.g. paraphrases of one question) in a single call. Much faster than calling search_messages repeatedly. Optionally fuses the rankings into one list.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "queries": {
+                        "type": "array",
+                        "description": "Searches to run. Each is a query string, or an object with \"query\" and an optional \"chat_id\" to search within one conversation",
+                        "items": {
+                            "anyOf": [
+                                {"type": "string"},
+                                {
+                                    "type": "object",
+                                    "properties": {
+                                        "query": {"type": "string"},
+                                        "chat_id": {"type": "string"}
+                                    },
+                                    "required": ["query"]
+                                }
+                            ]
+                        }
+                    },
+                    "n_results": {
+                        "type": "integer",
+                        "description": "Number of message chunks to return per query (default: 5)",
+                        "default": 5
+                    },
+                    "fuse": {
+                        "type": "boolean",
+                        "description": "Return one fused ranking across all queries instead of per-query results (default: false)",
+                        "default": False
+                    },
+                    "compact": PAGINATION_PROPERTIES["compact"],
+                    "snippet_chars": PAGINATION_PROPERTIES["snippet_chars"],
+                    "account": ACCOUNT_PROPERTY
+                },
+                "required": ["queries"]
+            }
+        ),
+        Tool(
+            name="get_conversation_context",
+            description="Get the messages immediately before and after a point in a chat, e.g. around a search result. Pass the result's chat_id with either a timestamp or its start_time/end_time.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "chat_id": {
+                        "type": "string",
+                        "description": "ID of the chat/conversation"
+                    },
+                    "timestamp": {
+                        "type": "string",
+                        "description": "ISO timestamp to center the context on"
+                    },
+                    "start_time": {
+                        "type": "string",
+                        "description": "ISO start of a search result's time range (use instead of timestamp)"
+                    },
+                    "end_time": {
+                        "type": "string",
+                        "description": "ISO end of a search result's time range (defaults to start_time)"
+                    },
+                    "n_before": {
+                        "type": "integer",
+                        "description": "Number of messages to return before (default: 10)",
+                        "default": 10
+                    },
+                    "n_after": {
+                        "type": "integer",
+                        "description": "Number of messages to return after (default: 10)",
+                        "default": 10
+                    },
+                    "account": ACCOUNT_PROPERTY
                 },
-                "required": ["query", "chat_id"]
+                "required": ["chat_id"]
+            }
+        ),
+        Tool(
+            name="find_chats",
+            description="Find which conversations are about a topic, ranked by how close each chat's overall content is to the query. Use it to pick a chat_id for search_chat.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Topic to look for"
+                    },
+                    "n_results": {
+                        "type": "integer",
+                        "description": "Number of chats to return (default: 10)",
+                        "default": 10
+                    },
+                    "account": ACCOUNT_PROPERTY
+                },
+                "required": ["query"]
+            }
+        ),
+        Tool(
+            name="conversation_stats",
+            description="Answer questions about messaging patterns (who do I text most, when did I last talk to someone, how fast do we reply) from precomputed statistics. Pass contact or chat_id for one person or chat; pass neither for a ranking.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "contact": {
+                        "type": "string",
+                        "description": "Name or phone number/email (or part of one) of a contact"
+                    },
+                    "chat_id": {
+                        "type": "string",
+                        "description": "ID of a chat/conversation"
+                    },
+                    "rank": {
+                        "type": "string",
+                        "enum": ["contacts", "chats"],
+                        "description": "What to rank when neither contact nor chat_id is given (default: contacts)",
+                        "default": "contacts"
+                    },
+                    "sort_by": {
+                        "type": "string",
+                        "enum": ["messages", "recent"],
+                        "description": "Rank by message count or by most recent message (default: messages)",
+                        "default": "messages"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Optional ISO date; only count messages on or after it"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Optional ISO date; only count messages on or before it"
+                    },
+                    "granularity": {
+                        "type": "string",
+                        "enum": ["day", "week"],
+                        "description": "For a contact or chat, also list message counts per day or week"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of ranked contacts/chats to return (default: 10)",
+                        "default": 10
+                    },
+                    "account": ACCOUNT_PROPERTY
+                },
+                "required": []
             }
         )
     ]
@@ -150,73 +1017,310 @@ async def list_tools() -> list[Tool]:
 async def call_tool(name: str, arguments: Any) -> Sequence[TextContent | ImageContent | EmbeddedResource]:
     """Handle iMessage search tool calls."""
     try:
+        account = resolve_account(arguments)
+        
         if name == "search_messages":
-            if not isinstance(arguments, dict) or "query" not in arguments:
+            if not isinstance(arguments, dict) or ("query" not in arguments and "cursor" not in arguments):
                 raise ValueError("query parameter is required")
+            
+            if arguments.get("cursor"):
+                search = None
+            else:
+                n_results = arguments.get("n_results", 10)
+                where = None
+                if category := arguments.get("category"):
+                    where = {"category": category}
+                rerank = arguments.get("rerank", RERANK_DEFAULT)
+                start_ts = to_epoch(arguments["start_date"]) if arguments.get("start_date") else None
+                end_ts = end_of_day_epoch(arguments["end_date"]) if arguments.get("end_date") else None
+                title = "Message Search Results"
                 
-            n_results = arguments.get("n_results", 10)
-            where = None
-            if category := arguments.get("category"):
-                where = {"category": category}
+                if arguments.get("mode") == "hierarchical":
+                    # Coarse pass over the (much smaller) day digests, then the chunk search only within those days
+                    try:
+                        day_results = vector_db.query_collection(
+                            arguments["query"],
+                            n_results=arguments.get("n_days", 5),
+                            collection_name=account.days_collection,
+                            start_ts=start_ts,
+                            end_ts=end_ts,
+                            sharded=False,
+                            metadata_fields=DAY_METADATA_FIELDS
+                        )
+                        days = day_results["metadatas"][0] if day_results.get("metadatas") else []
+                    except RuntimeError:
+                        days = []
+                    if days:
+                        where = combine_where(where, day_filter(days))
+                        start_ts = max(start_ts or 0, min(day["start_ts"] for day in days))
+                        end_ts = min(end_ts or float("inf"), max(day["end_ts"] for day in days))
+                        title += f" (within the top {len(days)} days: " + ", ".join(
+                            f"{day.get('day')} in chat {day['chat_id']}" for day in days
+                        ) + ")"
+                    else:
+                        title += " (no matching day digests, searched all chunks)"
+                    
+                # Query vector DB, over-fetching when the hits get reranked
+                results = vector_db.query_collection(
+                    arguments["query"],
+                    n_results=rerank_candidates(n_results) if rerank else n_results,
+                    collection_name=account.collection,
+                    where=where,
+                    start_ts=start_ts,
+                    end_ts=end_ts
+                )
                 
-            # Query vector DB
-            results = vector_db.query_collection(
-                arguments["query"],
-                n_results=n_results,
-                where=where
-            )
-            
-            # Format results
-            formatted_results = format_query_results(results)
+                # Format results
+                formatted_results = format_query_results(results)
+                if rerank:
+                    formatted_results = await rerank_results(arguments["query"], formatted_results, n_results)
+                search = CachedSearch(title=title, results=formatted_results)
             
             # Generate response text
-            response_parts = ["Message Search Results:\n"]
-            for i, result in enumerate(formatted_results, 1):
-                response_parts.append(
-                    f"\n{i}. Message: {result.document}\n"
-                    f"   From: {result.metadata.get('sender', 'Unknown')}\n"
-                    f"   Chat: {result.metadata.get('chat_name', 'N/A')}\n"
-                    f"   Date: {result.metadata.get('timestamp', 'N/A')}\n"
-                    f"   Relevance: {1 - result.distance:.4f}\n"
-                )
-            
             return [TextContent(
                 type="text",
-                text="".join(response_parts)
+                text=render_page(
+                    search,
+                    page_size=arguments.get("page_size"),
+                    cursor=arguments.get("cursor"),
+                    compact=arguments.get("compact", False),
+                    snippet_chars=arguments.get("snippet_chars", 160)
+                )
             )]
             
         elif name == "search_chat":
-            if not isinstance(arguments, dict) or "query" not in arguments or "chat_id" not in arguments:
+            if not isinstance(arguments, dict) or (("query" not in arguments or "chat_id" not in arguments) and "cursor" not in arguments):
                 raise ValueError("Both query and chat_id parameters are required")
+            
+            if arguments.get("cursor"):
+                search = None
+            else:
+                n_results = arguments.get("n_results", 10)
+                where = chat_filter([parse_chat_id(arguments["chat_id"])])
+                rerank = arguments.get("rerank", RERANK_DEFAULT)
                 
-            n_results = arguments.get("n_results", 10)
-            where = {"chat_id": arguments["chat_id"]}
-            
-            # Query vector DB
-            results = vector_db.query_collection(
-                arguments["query"],
-                n_results=n_results,
-                where=where
-            )
+                # Query vector DB, over-fetching when the hits get reranked
+                results = vector_db.query_collection(
+                    arguments["query"],
+                    n_results=rerank_candidates(n_results) if rerank else n_results,
+                    collection_name=account.collection,
+                    where=where
+                )
+                
+                # Format results
+                formatted_results = format_query_results(results)
+                if rerank:
+                    formatted_results = await rerank_results(arguments["query"], formatted_results, n_results)
+                search = CachedSearch(
+                    title=f"Search Results for Chat {arguments['chat_id']}",
+                    results=formatted_results,
+                    include_chat=False
+                )
+            
+            # Generate response text
+            return [TextContent(
+                type="text",
+                text=render_page(
+                    search,
+                    page_size=arguments.get("page_size"),
+                    cursor=arguments.get("cursor"),
+                    compact=arguments.get("compact", False),
+                    snippet_chars=arguments.get("snippet_chars", 160)
+                )
+            )]
             
-            # Format results
-            formatted_results = format_query_results(results)
+        elif name == "search_person":
+            if not isinstance(arguments, dict) or (("query" not in arguments or "person" not in arguments) and "cursor" not in arguments):
+                raise ValueError("Both person and query parameters are required")
+            
+            if arguments.get("cursor"):
+                search = None
+            else:
+                people = account.message_index.find_people(arguments["person"])
+                if not people:
+                    raise ValueError(f"No contact matching \"{arguments['person']}\"")
+                names = [person_name for person_name, _ in people]
+                handles = sorted({handle for _, person_handles in people for handle in person_handles})
+                chat_ids = account.message_index.chats_with(handles)
+                if not chat_ids:
+                    raise ValueError(f"No messages with {', '.join(names)}")
+                
+                n_results = arguments.get("n_results", 10)
+                rerank = arguments.get("rerank", RERANK_DEFAULT)
+                chats_filter = chat_filter(chat_ids)
+                said_filter = any_of([{author_key(handle): True} for handle in handles])
+                
+                def person_search(where):
+                    return vector_db.query_collection(
+                        arguments["query"],
+                        n_results=rerank_candidates(n_results) if rerank else n_results,
+                        collection_name=account.collection,
+                        where=where,
+                        start_ts=to_epoch(arguments["start_date"]) if arguments.get("start_date") else None,
+                        end_ts=end_of_day_epoch(arguments["end_date"]) if arguments.get("end_date") else None
+                    )
+                
+                # Query vector DB, restricted to the person's chats (and to chunks they wrote in)
+                title = f"Search Results for {', '.join(names)} ({len(chat_ids)} chats)"
+                if arguments.get("scope", "said") == "said":
+                    results = person_search(combine_where(chats_filter, said_filter))
+                    if not results.get("ids") or not results["ids"][0]:
+                        # Chunks ingested before author keys existed can only be filtered by chat
+                        results = person_search(chats_filter)
+                        title += " - no passages tagged with their messages, searched their chats instead"
+                else:
+                    results = person_search(chats_filter)
+                
+                # Format results
+                formatted_results = format_query_results(results)
+                if rerank:
+                    formatted_results = await rerank_results(arguments["query"], formatted_results, n_results)
+                search = CachedSearch(title=title, results=formatted_results)
             
             # Generate response text
-            response_parts = [f"Search Results for Chat {arguments['chat_id']}:\n"]
-            for i, result in enumerate(formatted_results, 1):
-                response_parts.append(
-                    f"\n{i}. Message: {result.document}\n"
-                    f"   From: {result.metadata.get('sender', 'Unknown')}\n"
-                    f"   Date: {result.metadata.get('timestamp', 'N/A')}\n"
-                    f"   Relevance: {1 - result.distance:.4f}\n"
+            return [TextContent(
+                type="text",
+                text=render_page(
+                    search,
+                    page_size=arguments.get("page_size"),
+                    cursor=arguments.get("cursor"),
+                    compact=arguments.get("compact", False),
+                    snippet_chars=arguments.get("snippet_chars", 160)
                 )
+            )]
+            
+        elif name == "search_messages_batch":
+            if not isinstance(arguments, dict) or not arguments.get("queries"):
+                raise ValueError("queries parameter is required")
+                
+            n_results = arguments.get("n_results", 5)
+            queries = []
+            for item in arguments["queries"]:
+                if isinstance(item, str):
+                    item = {"query": item}
+                query = {"query_text": item["query"]}
+                if item.get("chat_id") is not None:
+                    query["where"] = chat_filter([parse_chat_id(item["chat_id"])])
+                queries.append(query)
+            
+            # One round trip and one embedding batch for all queries
+            results = vector_db.query_collection_batch(queries, n_results=n_results, collection_name=account.collection)
+            result_lists = [format_query_results(results, i) for i in range(len(queries))]
+            
+            # Generate response text
+            if arguments.get("fuse", False):
+                sections = [(f"Fused Search Results for {len(queries)} queries", fuse_results(result_lists)[:n_results])]
+            else:
+                sections = [(f"\nResults for \"{query['query_text']}\"", formatted_results)
+                            for query, formatted_results in zip(queries, result_lists)]
+            response_parts = []
+            for title, formatted_results in sections:
+                search = CachedSearch(title=title, results=formatted_results)
+                response_parts.append(render_page(search, compact=arguments.get("compact", False),
+                                                  snippet_chars=arguments.get("snippet_chars", 160)))
             
             return [TextContent(
                 type="text",
                 text="".join(response_parts)
             )]
             
+        elif name == "get_conversation_context":
+            if not isinstance(arguments, dict) or "chat_id" not in arguments:
+                raise ValueError("chat_id parameter is required")
+            anchor = arguments.get("timestamp") or arguments.get("start_time")
+            if not anchor:
+                raise ValueError("Either timestamp or start_time is required")
+
+            chat_id = parse_chat_id(arguments["chat_id"])
+            start_time = normalize_timestamp(anchor)
+            end_time = normalize_timestamp(arguments.get("end_time") or anchor)
+            context = account.message_index.get_context(
+                chat_id,
+                start_time,
+                end_time,
+                n_before=arguments.get("n_before", 10),
+                n_after=arguments.get("n_after", 10)
+            )
+
+            # Generate response text; ">" marks the messages inside the requested range
+            chat_name = account.message_index.chat_name(chat_id)
+            response_parts = [f"Conversation context for Chat {chat_id}{f' ({chat_name})' if chat_name else ''}:\n\n"]
+            response_parts.extend(format_context_message(row) for row in context["before"])
+            response_parts.extend(format_context_message(row, ">") for row in context["within"])
+            response_parts.extend(format_context_message(row) for row in context["after"])
+            if len(response_parts) == 1:
+                response_parts.append("No messages found around that time.")
+
+            return [TextContent(
+                type="text",
+                text="".join(response_parts)
+            )]
+
+        elif name == "find_chats":
+            if not isinstance(arguments, dict) or "query" not in arguments:
+                raise ValueError("query parameter is required")
+            
+            chats = vector_db.find_chats(arguments["query"], arguments.get("n_results", 10), account.collection)
+            response_parts = [f"Chats about \"{arguments['query']}\":\n\n"]
+            response_parts.extend(format_found_chat(i, chat) + "\n" for i, chat in enumerate(chats, 1))
+            if not chats:
+                response_parts.append("No chats found. Chat centroids are built while ingesting; POST /rebuild_chat_centroids/<collection> on the vector server builds them for an existing collection.")
+            
+            return [TextContent(
+                type="text",
+                text="".join(response_parts)
+            )]
+
+        elif name == "conversation_stats":
+            arguments = arguments if isinstance(arguments, dict) else {}
+            start_date = arguments.get("start_date")
+            end_date = arguments.get("end_date")
+            granularity = arguments.get("granularity")
+            limit = arguments.get("limit", 10)
+
+            if arguments.get("contact"):
+                matches = account.rollups.find_contacts(arguments["contact"])
+                if len(matches) == 0:
+                    raise ValueError(f"No contact matching \"{arguments['contact']}\"")
+                response_parts = [f"Conversation stats for contacts matching \"{arguments['contact']}\":\n\n"]
+                for i, row in enumerate(matches.head(limit).to_dicts(), 1):
+                    response_parts.append(format_contact_stats(i, row))
+                    if granularity:
+                        chat_ids = account.rollups.contact_chat_ids(row["author_handle"], direct_only=True)
+                        response_parts.append(f"   Messages per {granularity} in 1:1 chats:\n")
+                        response_parts.append(format_activity(account.rollups.activity(chat_ids, granularity, start_date, end_date), granularity))
+                    response_parts.append("\n")
+
+            elif arguments.get("chat_id") is not None:
+                chat_id = parse_chat_id(arguments["chat_id"])
+                row = account.rollups.chat(chat_id)
+                if row is None:
+                    raise ValueError(f"No chat with chat_id {chat_id}")
+                response_parts = ["Conversation stats:\n\n", format_chat_stats(1, row)]
+                if granularity:
+                    response_parts.append(f"   Messages per {granularity}:\n")
+                    response_parts.append(format_activity(account.rollups.activity([chat_id], granularity, start_date, end_date), granularity))
+
+            else:
+                sort_by = arguments.get("sort_by", "messages")
+                period = f" from {start_date or 'the beginning'} to {end_date or 'now'}" if start_date or end_date else ""
+                order = "by most recent message" if sort_by == "recent" else "with the most messages"
+                if arguments.get("rank", "contacts") == "chats":
+                    ranked = account.rollups.top_chats(limit, sort_by, start_date, end_date)
+                    response_parts = [f"Chats {order}{period}:\n\n"]
+                    response_parts.extend(format_chat_stats(i, row) + "\n" for i, row in enumerate(ranked.to_dicts(), 1))
+                else:
+                    ranked = account.rollups.top_contacts(limit, sort_by, start_date, end_date)
+                    response_parts = [f"Contacts {order}{period}:\n\n"]
+                    response_parts.extend(format_contact_stats(i, row) + "\n" for i, row in enumerate(ranked.to_dicts(), 1))
+                if len(ranked) == 0:
+                    response_parts.append("No messages found.")
+
+            return [TextContent(
+                type="text",
+                text="".join(response_parts)
+            )]
+
         else:
             raise ValueError(f"Unknown tool: {name}")
             
@@ -229,6 +1333,9 @@ async def call_tool(name: str, arguments: Any) -> Sequence[TextContent | ImageCo
 
 async def main():
     from mcp.server.stdio import stdio_server
+
+    if RERANK_DEFAULT:
+        reranker.warm_up()
     
     async with stdio_server() as (read_stream, write_stream):
         await app.run(
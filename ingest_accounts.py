@@ -0,0 +1,111 @@
+import os
+import re
+import json
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List
+from main import ingest_account
+
+DEFAULT_MANIFEST = "accounts.json"
+# Chroma collection names allow letters, digits, "_" and "-"; account names become part of one
+ACCOUNT_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def account_collection(name: str, base_collection: str = "imessages") -> str:
+    """The collection an account's chunks go to unless its manifest entry names one."""
+    return f"{base_collection}_{name}"
+
+
+def load_manifest(manifest_path: str = DEFAULT_MANIFEST) -> List[Dict[str, Any]]:
+    """
+    Read a manifest of accounts, e.g.
+        {"accounts": [{"name": "alice", "path": "accounts/alice"},
+                      {"name": "bob", "path": "/exports/bob", "collection": "bob_messages"}]}
+    Each path is a directory holding that account's chat.db and contacts.abbu (or contacts_cache.csv);
+    relative paths are relative to the manifest. Returns the entries with absolute paths and collections.
+    """
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    accounts, names = [], set()
+    for entry in manifest["accounts"]:
+        name = entry["name"]
+        if not ACCOUNT_NAME.match(name):
+            raise ValueError(f"Account name {name!r} may only contain letters, digits, '_' and '-'")
+        if name in names:
+            raise ValueError(f"Account {name!r} appears twice in {manifest_path}")
+        names.add(name)
+        accounts.append({
+            **entry,
+            "path": os.path.join(base_dir, entry["path"]),
+            "collection": entry.get("collection") or account_collection(name),
+        })
+    return accounts
+
+
+def ingest_worker(account: Dict[str, Any], process_options: Dict[str, Any]) -> Dict[str, Any]:
+    """Ingest one account in a worker process, logging its progress to ingest.log in the account's directory."""
+    start = time.perf_counter()
+    with open(os.path.join(account["path"], "ingest.log"), "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        ok = ingest_account(account["path"], account["collection"], **process_options)
+    return {"name": account["name"], "collection": account["collection"], "ok": ok, "seconds": time.perf_counter() - start}
+
+
+def ingest_accounts(accounts: List[Dict[str, Any]], workers: int | None = None, **process_options) -> List[Dict[str, Any]]:
+    """
+    Ingest several accounts concurrently, one worker process per account (up to workers at a time).
+    Extraction, indexing and chunking run in parallel; every worker sends its chunks to the same
+    embeddings server, which keeps the model busy while other accounts are still being extracted.
+    """
+    workers = workers or min(len(accounts), os.cpu_count() or 1)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(ingest_worker, account, process_options): account for account in accounts}
+        for future in as_completed(futures):
+            account = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"name": account["name"], "collection": account["collection"], "ok": False, "error": str(e)}
+            results.append(result)
+            if result["ok"]:
+                print(f"{result['name']}: done in {result['seconds']:.1f}s -> {result['collection']}")
+            else:
+                print(f"{result['name']}: FAILED ({result.get('error') or 'see ' + os.path.join(account['path'], 'ingest.log')})")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest several accounts' chat.db exports into per-account collections")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="JSON manifest listing each account's name and directory")
+    parser.add_argument("--accounts", default=None, help="Comma-separated account names to ingest (default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="Accounts ingested at once (default: one per account, up to the CPU count)")
+    parser.add_argument("--chunking", choices=["time", "tokens"], default="time")
+    parser.add_argument("--shard-by", choices=["year", "month"], default=None)
+    parser.add_argument("--digests", action="store_true", help="Also write per-day digests for hierarchical search")
+    parser.add_argument("--digest-selection", choices=["embedding", "lexical"], default="embedding", help="How digest messages are picked")
+    parser.add_argument("--dedup-threshold", type=float, default=None, help="Skip embedding near-duplicate chunks (within each account)")
+    args = parser.parse_args()
+
+    accounts = load_manifest(args.manifest)
+    if args.accounts:
+        selected = set(args.accounts.split(","))
+        unknown = selected - {account["name"] for account in accounts}
+        if unknown:
+            parser.error(f"Unknown accounts: {', '.join(sorted(unknown))}")
+        accounts = [account for account in accounts if account["name"] in selected]
+
+    start = time.perf_counter()
+    results = ingest_accounts(
+        accounts,
+        args.workers,
+        chunking=args.chunking,
+        shard_by=args.shard_by,
+        digests=args.digests,
+        digest_selection=args.digest_selection,
+        dedup_threshold=args.dedup_threshold,
+    )
+    n_ok = sum(result["ok"] for result in results)
+    print(f"Ingested {n_ok} of {len(results)} accounts in {time.perf_counter() - start:.1f}s")
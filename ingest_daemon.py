@@ -0,0 +1,315 @@
+import os
+import sys
+import json
+import time
+import select
+import traceback
+import struct
+import ctypes
+import ctypes.util
+import sqlite3
+import datetime as dt
+import argparse
+import polars as pl
+from extract_chats import extract_chat_messages
+from snapshot_reader import open_chat_db, connect_read_only
+from message_index import DEFAULT_INDEX_PATH, add_messages, read_messages
+from build_rollups import DEFAULT_ROLLUP_DIR, update_rollups
+from generate_embedding_vectors import (
+    DEDUP_DIR,
+    create_chunks_with_overlap,
+    create_day_digests,
+    create_token_budget_chunks,
+    load_tokenizer,
+    upsert_chunk_batches,
+    upsert_day_digests,
+    upsert_deduplicated_chunks,
+)
+
+# Same gap that create_chunks_with_overlap uses to force a new chunk
+SESSION_GAP_SECONDS = 30 * 60
+
+NEW_MESSAGES_QUERY = '''
+    SELECT message.ROWID, chat_message_join.chat_id, message.date
+    FROM message
+    JOIN chat_message_join ON message.ROWID = chat_message_join.message_id
+    WHERE message.ROWID > ?
+'''
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Wakes up on writes to the watched files. Linux only."""
+
+    def __init__(self, paths: list[str]):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watch the directories rather than the files: the WAL is created, truncated and
+        # replaced by checkpoints, which would silently drop a watch on the file itself
+        self.names = {os.path.basename(p) for p in paths}
+        for directory in {os.path.dirname(os.path.abspath(p)) for p in paths}:
+            mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+            if self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float | None) -> bool:
+        """Block until one of the watched files changes (True) or the timeout passes (False)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return False
+            data = os.read(self.fd, 64 * 1024)
+            offset = 0
+            changed = False
+            while offset < len(data):
+                _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+                changed = changed or os.fsdecode(name) in self.names
+                offset += INOTIFY_EVENT.size + length
+            if changed:
+                return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback watcher that compares file mtimes and sizes every poll_interval seconds."""
+
+    def __init__(self, paths: list[str], poll_interval: float = 1.0):
+        self.paths = paths
+        self.poll_interval = poll_interval
+        self._last = self._signature()
+
+    def _signature(self):
+        signature = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return signature
+
+    def wait(self, timeout: float | None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self._signature()
+            if current != self._last:
+                self._last = current
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            sleep_for = self.poll_interval if deadline is None else min(self.poll_interval, max(0.0, deadline - time.monotonic()))
+            time.sleep(sleep_for)
+
+    def close(self):
+        pass
+
+
+def make_watcher(paths: list[str], poll_interval: float = 1.0, force_polling: bool = False):
+    """Use inotify where available, polling everywhere else (e.g. macOS)."""
+    if not force_polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(paths, poll_interval)
+
+
+def wait_for_burst(watcher, debounce_seconds: float, max_delay_seconds: float) -> None:
+    """
+    Block until a change happens, then keep waiting until the writer has been quiet for debounce_seconds
+    (or max_delay_seconds have passed since the first change), so a sync burst is ingested once.
+    """
+    watcher.wait(None)
+    first_change = time.monotonic()
+    while True:
+        remaining = max_delay_seconds - (time.monotonic() - first_change)
+        if remaining <= 0 or not watcher.wait(min(debounce_seconds, remaining)):
+            return
+
+
+def load_state(state_path: str) -> dict:
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state_path: str, state: dict) -> None:
+    # Write then rename so a crash never leaves a truncated state file behind
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def load_contacts(contacts_path: str = 'contacts_cache.csv') -> pl.DataFrame:
+    if os.path.exists(contacts_path):
+        return pl.read_csv(contacts_path)
+    return pl.DataFrame(schema={"Phone Number": pl.Utf8, "Name": pl.Utf8})
+
+
+def find_session_start(cursor: sqlite3.Cursor, chat_id: int, date: int) -> int:
+    """
+    Walk back from an Apple timestamp to the first message of its conversation session,
+    i.e. the message after the last gap longer than SESSION_GAP_SECONDS.
+    Chunk boundaries only depend on messages since that gap, so re-chunking from there
+    reproduces the existing chunk ids and only the session's chunks need to be upserted.
+    """
+    cursor.execute('''
+        SELECT message.date
+        FROM message
+        JOIN chat_message_join ON message.ROWID = chat_message_join.message_id
+        WHERE chat_message_join.chat_id = ? AND message.date <= ?
+        ORDER BY message.date DESC
+    ''', (chat_id, date))
+    session_start = date
+    for (message_date,) in cursor:
+        if (session_start - message_date) / 1e9 > SESSION_GAP_SECONDS:
+            break
+        session_start = message_date
+    return session_start
+
+
+def ingest_new_messages(db_path: str, contacts_df: pl.DataFrame, last_rowid: int,
+                        collection_name: str = "imessages", batch_size: int = 32, tokenizer=None,
+                        index_path: str = DEFAULT_INDEX_PATH, shard_by: str | None = None, digests: bool = False,
+                        dedupers: dict | None = None, dedup_dir: str = DEDUP_DIR, digest_selection: str = "embedding",
+                        rollup_dir: str | None = None) -> int:
+    """
+    Re-chunk and upsert the conversation sessions touched by messages with ROWID > last_rowid.
+    With rollup_dir, the rollups of the chats they landed in are updated there afterwards.
+    With dedupers (a dict to cache dedup state in across calls), chunks are deduplicated against the
+    state process_chats saved in dedup_dir, as in a deduplicated batch ingest.
+    Returns the highest ROWID processed (last_rowid if nothing was new).
+    """
+    with open_chat_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(NEW_MESSAGES_QUERY, (last_rowid,))
+        new_rows = cursor.fetchall()
+        if not new_rows:
+            return last_rowid
+
+        # Earliest new message per chat; out-of-order syncs can land messages in the past
+        earliest_by_chat = {}
+        for _, chat_id, date in new_rows:
+            date = date or 0
+            earliest_by_chat[chat_id] = min(date, earliest_by_chat.get(chat_id, date))
+
+        n_chunks = 0
+        indexed_chats = []
+        for chat_id, earliest in earliest_by_chat.items():
+            chat_guid, display_name = cursor.execute('SELECT guid, display_name FROM chat WHERE ROWID = ?', (chat_id,)).fetchone()
+            session_start = find_session_start(cursor, chat_id, earliest)
+            df = extract_chat_messages(cursor, chat_id, chat_guid, display_name or None, contacts_df, since_date=session_start)
+            if df is None:
+                continue
+            add_messages([df], index_path)
+            indexed_chats.append(chat_id)
+            if tokenizer is not None:
+                chunks = create_token_budget_chunks(df, tokenizer)
+            else:
+                chunks = create_chunks_with_overlap(df)
+            if dedupers is not None:
+                upsert_deduplicated_chunks(chunks, dedupers, collection_name, batch_size, shard_by, dedup_dir)
+            else:
+                upsert_chunk_batches(chunks, collection_name, batch_size, shard_by)
+            n_chunks += len(chunks)
+            if digests:
+                # A day's digest depends on all of its messages, which the message index has
+                for day in df['date_sent'].dt.date().unique().sort():
+                    day_start = dt.datetime(day.year, day.month, day.day)
+                    day_df = read_messages(chat_id, day_start.isoformat(), (day_start + dt.timedelta(days=1)).isoformat(), index_path)
+                    upsert_day_digests(create_day_digests(day_df, selection=digest_selection), collection_name)
+
+    if rollup_dir is not None and indexed_chats:
+        update_rollups(indexed_chats, index_path, rollup_dir)
+    print(f"Ingested {len(new_rows)} new messages in {len(earliest_by_chat)} chats ({n_chunks} chunks upserted)")
+    return max(rowid for rowid, _, _ in new_rows)
+
+
+def run(db_path: str = 'chat.db', contacts_path: str = 'contacts_cache.csv', state_path: str = 'ingest_state.json',
+        collection_name: str = "imessages", debounce_seconds: float = 2.0, max_delay_seconds: float = 10.0,
+        poll_interval: float = 1.0, force_polling: bool = False, from_start: bool = False, once: bool = False,
+        chunking: str = "time", index_path: str = DEFAULT_INDEX_PATH, shard_by: str | None = None,
+        rollup_dir: str = DEFAULT_ROLLUP_DIR, digests: bool = False, dedup: bool = False,
+        dedup_dir: str = DEDUP_DIR, digest_selection: str = "embedding") -> None:
+    contacts_df = load_contacts(contacts_path)
+    tokenizer = load_tokenizer() if chunking == "tokens" else None
+    state = load_state(state_path)
+    dedupers = {} if dedup else None
+    if "last_rowid" not in state:
+        # Assume main.py already backfilled everything that exists right now
+        if from_start:
+            state["last_rowid"] = 0
+        else:
+            conn = connect_read_only(db_path)
+            state["last_rowid"] = conn.execute('SELECT IFNULL(MAX(ROWID), 0) FROM message').fetchone()[0]
+            conn.close()
+        save_state(state_path, state)
+
+    watcher = make_watcher([db_path, f"{db_path}-wal"], poll_interval, force_polling)
+    print(f"Watching {db_path} with {type(watcher).__name__} from ROWID {state['last_rowid']}")
+    try:
+        while True:
+            try:
+                last_rowid = ingest_new_messages(db_path, contacts_df, state["last_rowid"], collection_name,
+                                                 tokenizer=tokenizer, index_path=index_path, shard_by=shard_by, digests=digests,
+                                                 dedupers=dedupers, dedup_dir=dedup_dir, digest_selection=digest_selection,
+                                                 rollup_dir=rollup_dir)
+                if last_rowid != state["last_rowid"]:
+                    state["last_rowid"] = last_rowid
+                    save_state(state_path, state)
+            except Exception as e:
+                # Whatever failed (a locked database, the server, a malformed row), keep watching and leave
+                # last_rowid where it was so the same rows are retried on the next change
+                print(f"Error ingesting new messages: {e!r}")
+                traceback.print_exc()
+            if once:
+                return
+            wait_for_burst(watcher, debounce_seconds, max_delay_seconds)
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuously ingest new iMessages into the vector database")
+    parser.add_argument("--db", default="chat.db", help="Path to chat.db")
+    parser.add_argument("--contacts", default="contacts_cache.csv", help="Path to the contacts cache CSV")
+    parser.add_argument("--state", default="ingest_state.json", help="Where the last processed ROWID is stored")
+    parser.add_argument("--collection", default="imessages")
+    parser.add_argument("--debounce", type=float, default=2.0, help="Seconds of quiet before ingesting a burst")
+    parser.add_argument("--max-delay", type=float, default=10.0, help="Upper bound on how long a burst is deferred")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Polling interval when inotify is unavailable")
+    parser.add_argument("--poll", action="store_true", help="Force polling instead of inotify")
+    parser.add_argument("--from-start", action="store_true", help="Ingest every message on first run instead of only new ones")
+    parser.add_argument("--once", action="store_true", help="Ingest whatever is new and exit")
+    parser.add_argument("--chunking", choices=["time", "tokens"], default="time", help="Must match how the collection was built")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Message index used for conversation context lookups")
+    parser.add_argument("--shard-by", choices=["year", "month"], default=None, help="Must match how the collection was built")
+    parser.add_argument("--rollups", default=DEFAULT_ROLLUP_DIR, help="Where the rollups of the chats each ingest touches are updated")
+    parser.add_argument("--digests", action="store_true", help="Also update the per-day digests (if the collection was built with them)")
+    parser.add_argument("--digest-selection", choices=["embedding", "lexical"], default="embedding", help="How digest messages are picked; lexical avoids embedding each message")
+    parser.add_argument("--dedup", action="store_true", help="Deduplicate against the state a deduplicated ingest saved (if the collection was built with it)")
+    parser.add_argument("--dedup-dir", default=DEDUP_DIR, help="Where that ingest saved its dedup state")
+    args = parser.parse_args()
+
+    run(args.db, args.contacts, args.state, args.collection, args.debounce, args.max_delay,
+        args.poll_interval, args.poll, args.from_start, args.once, args.chunking, args.index, args.shard_by, args.rollups, args.digests,
+        args.dedup, args.dedup_dir, args.digest_selection)
@@ -2,55 +2,92 @@ import glob
 import os
 import polars as pl
 from datetime import datetime, timedelta
+from typing import List
 from extract_contacts import extract_contacts
 from extract_chats import extract_chats
 from generate_embedding_vectors import process_chats
+from message_index import build_message_index
+from build_rollups import build_rollups
+
+
+def load_contacts(account_dir: str = '.') -> pl.DataFrame | None:
+    """The account's contacts, extracted from contacts.abbu once and cached in contacts_cache.csv."""
+    cache_path = os.path.join(account_dir, 'contacts_cache.csv')
+    abbu_path = os.path.join(account_dir, 'contacts.abbu')
+    if not os.path.exists(cache_path) and not os.path.exists(abbu_path):
+        print(f"ERROR: contacts.abbu file not found. Please make sure it is in {os.path.abspath(account_dir)}. " +
+              "Copy your `contacts.abbu` file from your mac, by going to the Contacts app, clicking on `Contacts` in the top left, then `File` -> `Export...` -> `Address Book Archive` -> Save to this directory as `contacts.abbu`.")
+        return None
+    if not os.path.exists(cache_path):
+        # Extract contacts from the .abbu file
+        print("Extracting contacts...")
+        contacts = extract_contacts(abbu_path)
+        contacts.write_csv(cache_path)
+    else:
+        # Load contacts from the .csv file
+        contacts = pl.read_csv(cache_path)
+    return contacts
+
+
+def load_chats(account_dir: str, contacts: pl.DataFrame) -> List[pl.DataFrame]:
+    """The account's chats, extracted from chat.db and cached as one CSV per chat in chats/."""
+    chats_dir = os.path.join(account_dir, 'chats')
+    if len(glob.glob(os.path.join(chats_dir, '*.csv'))) >= 100:
+        return [pl.read_csv(f) for f in glob.glob(os.path.join(chats_dir, '*.csv'))]
 
-# Check if chat.db exists
-if not os.path.exists('chat.db'):
-    print("ERROR: chat.db file not found. Please make sure it is in the current directory. (Copy it here from ~/Library/Messages/chat.db)")
-    exit()
-
-if not os.path.exists('contacts_cache.csv') and not os.path.exists('contacts.abbu'):
-    print("ERROR: contacts.abbu file not found. Please make sure it is in the current directory." +
-          "Copy your `contacts.abbu` file from your mac, by going to the Contacts app, clicking on `Contacts` in the top left, then `File` -> `Export...` -> `Address Book Archive` -> Save to this directory as `contacts.abbu`.")
-    exit()
-if not os.path.exists('contacts_cache.csv'):
-    # Extract contacts from the .abbu file
-    print("Extracting contacts...")
-    contacts = extract_contacts('contacts.abbu')
-    contacts.write_csv('contacts_cache.csv')
-else:
-    # Load contacts from the .csv file
-    contacts = pl.read_csv('contacts_cache.csv')
-
-print(f"Found {len(contacts.unique('Name'))} contacts")
-
-# Get all chats from the chat.db file
-if len(glob.glob('chats/*.csv')) < 100: 
     print("Extracting & Formatting chats...")
-    chat_dfs = extract_chats('chat.db', contacts)
+    os.makedirs(chats_dir, exist_ok=True)
+    chat_dfs = extract_chats(os.path.join(account_dir, 'chat.db'), contacts)
     for chat_df in chat_dfs:
         try:
             name_maybe = list(chat_df.drop_nulls('group_chat_name')['group_chat_name'])
             name_maybe = name_maybe if len(name_maybe) > 0 else list(set(chat_df.filter(~pl.col('author_name').str.to_lowercase().str.contains('me'))['author_name']))
             name_maybe = name_maybe[0]if len(name_maybe) > 0 else list(set(chat_df.filter(~pl.col('author_handle').str.to_lowercase().str.contains('me'))['author_handle']))[0]
             name = ' '.join(name_maybe.split()).replace(' ', '_').replace("+","00").lower()
-            if os.path.exists(f'chats/{name}.csv'):
-                chat_df0 = pl.read_csv(f'chats/{name}.csv')
+            path = os.path.join(chats_dir, f'{name}.csv')
+            if os.path.exists(path):
+                chat_df0 = pl.read_csv(path)
                 chat_df = chat_df0.vstack(chat_df)
-            chat_df.write_csv(f'chats/{name}.csv')
+            chat_df.write_csv(path)
         except Exception as e:
             continue
-else:
-    chat_dfs = [pl.read_csv(f) for f in glob.glob('chats/*.csv')]
-print(f"Retrieved {len(chat_dfs)} non-empty chats")
+    return chat_dfs
+
+
+def ingest_account(account_dir: str = '.', collection_name: str = 'imessages', **process_options) -> bool:
+    """
+    Extract, index and embed one account's export: chat.db plus contacts.abbu (or contacts_cache.csv)
+    in account_dir. The message index, rollups and dedup state are written next to them, the chunks to
+    collection_name. Extra keyword arguments go to process_chats. Returns False if files are missing.
+    """
+    # Check if chat.db exists
+    if not os.path.exists(os.path.join(account_dir, 'chat.db')):
+        print(f"ERROR: chat.db file not found. Please make sure it is in {os.path.abspath(account_dir)}. (Copy it here from ~/Library/Messages/chat.db)")
+        return False
+
+    contacts = load_contacts(account_dir)
+    if contacts is None:
+        return False
+    print(f"Found {len(contacts.unique('Name'))} contacts")
+
+    # Get all chats from the chat.db file
+    chat_dfs = load_chats(account_dir, contacts)
+    print(f"Retrieved {len(chat_dfs)} non-empty chats")
+
+    # Time-sorted index for fetching the messages around a search hit
+    print("Building message index...")
+    n_indexed = build_message_index(chat_dfs, os.path.join(account_dir, 'message_index.db'), contacts_df=contacts)
+    print(f"Indexed {n_indexed} messages")
+
+    # Per-chat and per-contact aggregates for the conversation_stats tool
+    print("Building conversation rollups...")
+    rollups = build_rollups(chat_dfs, os.path.join(account_dir, 'rollups'))
+    print(f"Rolled up {len(rollups['chats'])} chats and {len(rollups['contacts'])} contacts")
 
+    print("Generating embeddings...")
+    process_chats(chat_dfs, collection_name=collection_name, dedup_dir=os.path.join(account_dir, 'dedup'), **process_options)
+    return True
 
-# # TODO: do embedding stuff here
-print("Generating embeddings...")
-processed_chunks = process_chats(chat_dfs)
-print(f"Processed {len(processed_chunks)} chunks")
 
-import pprint
-pprint.pprint(processed_chunks[:10])
\ No newline at end of file
+if __name__ == "__main__":
+    ingest_account('.')
@@ -0,0 +1,158 @@
+import zlib
+import sqlite3
+import polars as pl
+from typing import List
+
+DEFAULT_INDEX_PATH = "message_index.db"
+
+# Clustered on (chat_id, date_sent): "N messages around time T in chat C" is one short range scan
+# that never leaves the table b-tree, and the table doubles as its own covering index. message_id
+# (the message's ROWID in chat.db) keeps every message its own row, even several in the same second
+# from the same sender, while re-ingesting a message replaces it.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id INTEGER NOT NULL,
+    date_sent TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    author_handle TEXT NOT NULL DEFAULT '',
+    author_name TEXT,
+    text TEXT,
+    PRIMARY KEY (chat_id, date_sent, message_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    group_chat_name TEXT
+);
+-- Who wrote in which chat, keyed by handle so a person's chats are one range scan
+CREATE TABLE IF NOT EXISTS handle_chats (
+    author_handle TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    author_name TEXT,
+    n_messages INTEGER NOT NULL,
+    PRIMARY KEY (author_handle, chat_id)
+) WITHOUT ROWID;
+-- Address book entries, so a name also finds handles that haven't written yet (e.g. a second number)
+CREATE TABLE IF NOT EXISTS contacts (
+    name TEXT NOT NULL,
+    handle TEXT NOT NULL,
+    PRIMARY KEY (handle, name)
+) WITHOUT ROWID;
+"""
+
+
+def _fallback_message_id(author_handle: str | None, text: str | None) -> int:
+    # Chats cached as CSV before message ids were extracted: a stable id from the content, negative so
+    # it never collides with a real ROWID (only identical messages in the same second share a row)
+    return -1 - zlib.crc32(f"{author_handle}\0{text}".encode())
+
+
+def _message_rows(chat_df: pl.DataFrame) -> List[tuple]:
+    # Chats reloaded from CSV have string dates; normalize everything to ISO strings, which sort chronologically
+    if chat_df.schema['date_sent'] == pl.Utf8:
+        chat_df = chat_df.with_columns(
+            pl.col('date_sent').str.strptime(pl.Datetime, format="%Y-%m-%dT%H:%M:%S%.f", strict=False)
+        )
+    chat_df = chat_df.drop_nulls('date_sent')
+    author_names = chat_df['author_name'] if 'author_name' in chat_df.columns else [None] * len(chat_df)
+    if 'message_id' in chat_df.columns:
+        message_ids = chat_df['message_id']
+    else:
+        message_ids = [_fallback_message_id(handle, text) for handle, text in zip(chat_df['author_handle'], chat_df['text'])]
+    return [
+        (chat_id, date_sent.isoformat(), message_id, author_handle or '', author_name, text)
+        for chat_id, date_sent, message_id, author_handle, author_name, text in zip(
+            chat_df['chat_id'], chat_df['date_sent'], message_ids, chat_df['author_handle'], author_names, chat_df['text']
+        )
+    ]
+
+
+def update_handle_chats(conn: sqlite3.Connection, chat_id: int) -> None:
+    """Recount the senders of one chat from its (already indexed) messages."""
+    conn.execute("DELETE FROM handle_chats WHERE chat_id = ?", (chat_id,))
+    conn.execute(
+        """
+        INSERT INTO handle_chats
+        SELECT author_handle, chat_id, MAX(author_name), COUNT(*) FROM messages
+        WHERE chat_id = ? AND author_handle NOT IN ('', 'Me')
+        GROUP BY author_handle
+        """,
+        (chat_id,)
+    )
+
+
+def add_contacts(contacts_df: pl.DataFrame, index_path: str = DEFAULT_INDEX_PATH) -> int:
+    """Replace the contacts table with the (Name, Phone Number) pairs of the contacts cache."""
+    rows = [
+        (name, handle)
+        for name, handle in zip(contacts_df['Name'], contacts_df['Phone Number'])
+        if name and handle
+    ]
+    conn = sqlite3.connect(index_path)
+    conn.executescript(SCHEMA)
+    with conn:
+        conn.execute("DELETE FROM contacts")
+        conn.executemany("INSERT OR IGNORE INTO contacts VALUES (?, ?)", rows)
+    conn.close()
+    return len(rows)
+
+
+def add_messages(chat_dfs: List[pl.DataFrame], index_path: str = DEFAULT_INDEX_PATH) -> int:
+    """Insert (or replace) the messages of the given chats in the index. Returns the number of rows written."""
+    conn = sqlite3.connect(index_path)
+    conn.executescript(SCHEMA)
+    if 'message_id' not in [column for _, column, *_ in conn.execute("PRAGMA table_info(messages)")]:
+        conn.close()
+        raise ValueError(f"{index_path} predates message ids and would drop messages; rebuild it by running main.py")
+    n_rows = 0
+    with conn:
+        for chat_df in chat_dfs:
+            if len(chat_df) == 0:
+                continue
+            # main.load_chats merges chats with the same name into one CSV, so a frame can hold several chats
+            for part in chat_df.partition_by('chat_id', maintain_order=True):
+                rows = _message_rows(part)
+                conn.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?)", rows)
+                group_chat_name = part['group_chat_name'][0] if 'group_chat_name' in part.columns else None
+                conn.execute("INSERT OR REPLACE INTO chats VALUES (?, ?)", (part['chat_id'][0], group_chat_name))
+                update_handle_chats(conn, part['chat_id'][0])
+                n_rows += len(rows)
+    conn.close()
+    return n_rows
+
+
+def read_messages(chat_id: int, start_time: str, end_time: str, index_path: str = DEFAULT_INDEX_PATH) -> pl.DataFrame:
+    """The indexed messages of a chat with start_time <= date_sent < end_time (ISO strings), oldest first."""
+    conn = sqlite3.connect(index_path)
+    rows = conn.execute(
+        """
+        SELECT messages.chat_id, chats.group_chat_name, date_sent, author_handle, author_name, text
+        FROM messages LEFT JOIN chats USING (chat_id)
+        WHERE messages.chat_id = ? AND date_sent >= ? AND date_sent < ?
+        ORDER BY date_sent
+        """,
+        (chat_id, start_time, end_time)
+    ).fetchall()
+    conn.close()
+    schema = {"chat_id": pl.Int64, "group_chat_name": pl.Utf8, "date_sent": pl.Utf8,
+              "author_handle": pl.Utf8, "author_name": pl.Utf8, "text": pl.Utf8}
+    return pl.DataFrame(rows, schema=schema, orient="row").with_columns(pl.col('date_sent').str.to_datetime(time_unit="us"))
+
+
+def build_message_index(chat_dfs: List[pl.DataFrame], index_path: str = DEFAULT_INDEX_PATH,
+                        contacts_df: pl.DataFrame | None = None) -> int:
+    """
+    Rebuild from scratch the time-sorted message index used by the get_conversation_context tool,
+    and the person index (contacts and per-handle chats) used by search_person.
+    """
+    conn = sqlite3.connect(index_path)
+    conn.executescript(
+        "DROP TABLE IF EXISTS messages; DROP TABLE IF EXISTS chats; DROP TABLE IF EXISTS handle_chats; DROP TABLE IF EXISTS contacts;"
+    )
+    conn.close()
+    if contacts_df is not None:
+        add_contacts(contacts_df, index_path)
+    n_rows = add_messages(chat_dfs, index_path)
+    conn = sqlite3.connect(index_path)
+    conn.execute("VACUUM")
+    conn.close()
+    return n_rows
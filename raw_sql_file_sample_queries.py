@@ -1,9 +1,6 @@
 import polars as pl
-import sqlite3
 import pprint
-
-# Connect to the database
-conn = sqlite3.connect('./chat.db')
+from snapshot_reader import open_chat_db
 
 
 # Get list of all tables
@@ -69,12 +66,11 @@ WHERE chat.ROWID IN (
 )
 """
 
-# Read into dataframe
+# Connect to the database (read-only snapshot, so Messages can keep writing)
+# and read into dataframe
+with open_chat_db('./chat.db') as conn:
+    df = pl.read_database(query, conn, infer_schema_length=10_000)
+
 # Print the message contents as a list, one per line
-df = pl.read_database(query, conn, infer_schema_length=10_000)
 pprint.pprint(df['text'].to_list())
 
-
-# Close connection
-conn.close()
-
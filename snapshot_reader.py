@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import quote
+
+# Defaults tuned for one big sequential scan of chat.db
+DEFAULT_MMAP_SIZE = 1 << 30          # map up to 1 GiB of the database file
+DEFAULT_CACHE_SIZE_KIB = 256 * 1024  # 256 MiB page cache
+DEFAULT_TEMP_STORE = "MEMORY"        # sorts for ORDER BY never spill to disk
+
+
+def apply_scan_pragmas(conn: sqlite3.Connection, mmap_size: int = DEFAULT_MMAP_SIZE,
+                       cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB, temp_store: str = DEFAULT_TEMP_STORE) -> None:
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    # A negative cache_size is a size in KiB rather than a page count
+    conn.execute(f"PRAGMA cache_size = {-int(cache_size_kib)}")
+    conn.execute(f"PRAGMA temp_store = {temp_store}")
+    conn.execute("PRAGMA query_only = 1")
+
+
+def connect_read_only(db_path: str) -> sqlite3.Connection:
+    """Open a database through a mode=ro URI so we never take write locks on it."""
+    return sqlite3.connect(f"file:{quote(os.path.abspath(db_path))}?mode=ro", uri=True)
+
+
+@contextmanager
+def open_chat_db(db_path: str, snapshot_dir: str | None = None, mmap_size: int = DEFAULT_MMAP_SIZE,
+                 cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB, temp_store: str = DEFAULT_TEMP_STORE):
+    """
+    Open chat.db for a consistent read-only scan.
+
+    The connection is read-only and all reads happen inside one read transaction, so they see a single
+    snapshot even while Messages keeps writing to the WAL. If snapshot_dir is given (e.g. /dev/shm), the
+    database is first copied there with the online backup API and the scan runs against the copy,
+    which releases the WAL as soon as the copy is done.
+    """
+    snapshot_path = None
+    source = connect_read_only(db_path)
+    try:
+        if snapshot_dir is not None:
+            fd, snapshot_path = tempfile.mkstemp(prefix="chat-snapshot-", suffix=".db", dir=snapshot_dir)
+            os.close(fd)
+            copy = sqlite3.connect(snapshot_path)
+            source.backup(copy)
+            # The copy inherits WAL mode from chat.db; switch it back so it can be opened read-only
+            # without a -shm file next to it
+            copy.execute("PRAGMA journal_mode = DELETE")
+            copy.close()
+            source.close()
+            source = connect_read_only(snapshot_path)
+
+        apply_scan_pragmas(source, mmap_size, cache_size_kib, temp_store)
+        source.execute("BEGIN")
+        yield source
+    finally:
+        source.close()
+        if snapshot_path is not None:
+            os.remove(snapshot_path)
@@ -0,0 +1,232 @@
+import random
+import sqlite3
+import datetime as dt
+
+APPLE_EPOCH = dt.datetime(2001, 1, 1)
+
+WORDS = (
+    "hey are we still on for dinner tonight I think so what time works for you "
+    "the train was late again did you see the game last night lol that was wild "
+    "can you send me the address sure thing running a few minutes behind no worries "
+    "happy birthday thanks so much let's grab coffee next week sounds good to me"
+).split()
+
+# Tapback associated_message_type values and the text Messages stores for them
+TAPBACK_VERBS = {2000: "Loved", 2001: "Liked", 2002: "Disliked", 2003: "Laughed at", 2004: "Emphasized", 2005: "Questioned"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat (
+    ROWID INTEGER PRIMARY KEY AUTOINCREMENT,
+    guid TEXT UNIQUE NOT NULL,
+    chat_identifier TEXT,
+    display_name TEXT
+);
+CREATE TABLE IF NOT EXISTS handle (
+    ROWID INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL,
+    service TEXT DEFAULT 'iMessage'
+);
+CREATE TABLE IF NOT EXISTS message (
+    ROWID INTEGER PRIMARY KEY AUTOINCREMENT,
+    guid TEXT UNIQUE NOT NULL,
+    text TEXT,
+    handle_id INTEGER DEFAULT 0,
+    date INTEGER,
+    date_delivered INTEGER,
+    date_read INTEGER,
+    is_from_me INTEGER DEFAULT 0,
+    item_type INTEGER DEFAULT 0,
+    group_action_type INTEGER DEFAULT 0,
+    associated_message_guid TEXT,
+    associated_message_type INTEGER DEFAULT 0,
+    cache_has_attachments INTEGER DEFAULT 0,
+    attributedBody BLOB
+);
+CREATE TABLE IF NOT EXISTS chat_message_join (
+    chat_id INTEGER,
+    message_id INTEGER,
+    message_date INTEGER DEFAULT 0,
+    PRIMARY KEY (chat_id, message_id)
+);
+CREATE TABLE IF NOT EXISTS chat_handle_join (
+    chat_id INTEGER,
+    handle_id INTEGER,
+    UNIQUE (chat_id, handle_id)
+);
+CREATE INDEX IF NOT EXISTS chat_message_join_idx_message_id ON chat_message_join(message_id);
+"""
+
+
+def to_apple_timestamp(when: dt.datetime) -> int:
+    """Convert a datetime to an Apple timestamp (nanoseconds since 2001-01-01)."""
+    return int((when - APPLE_EPOCH).total_seconds() * 1e9)
+
+
+def attributed_body(text: str) -> bytes:
+    """A minimal typedstream-encoded NSAttributedString, laid out like the attributedBody Messages stores."""
+    data = text.encode("utf-8")
+    if len(data) < 0x80:
+        length = bytes([len(data)])
+    elif len(data) < 0x8000:
+        length = b"\x81" + len(data).to_bytes(2, "little")
+    else:
+        length = b"\x82" + len(data).to_bytes(4, "little")
+    return (b"\x04\x0bstreamtyped\x81\xe8\x03\x84\x01@\x84\x84\x84\x12NSAttributedString\x00\x84\x84\x08NSObject\x00"
+            b"\x85\x92\x84\x84\x84\x08NSString\x01\x94\x84\x01+" + length + data + b"\x86\x84\x02iI\x01" + length + b"\x92\x86\x86")
+
+
+def random_text(rng: random.Random, min_words: int = 3, max_words: int = 20) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def create_synthetic_chat_db(
+    db_path: str,
+    n_chats: int = 20,
+    messages_per_chat: int = 500,
+    start: dt.datetime = dt.datetime(2023, 1, 1),
+    seed: int = 0,
+    mean_gap_seconds: float = 90,
+    max_words: int = 20,
+    reaction_rate: float = 0.0,
+    system_rate: float = 0.0,
+    attachment_rate: float = 0.0,
+    body_only_rate: float = 0.0,
+) -> None:
+    """
+    Create (or extend) a SQLite database with the subset of the chat.db schema that
+    the extraction code reads, filled with random conversations.
+    The rates add non-content rows like a real archive has: tapbacks on a fraction of the
+    messages, system events (renames, participants added) and attachment-only messages.
+    body_only_rate stores that fraction of the messages like recent macOS does: text NULL, body only in attributedBody.
+    The database is put in WAL mode, like the real Messages database.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    cursor = conn.cursor()
+
+    for c in range(n_chats):
+        is_group = c % 4 == 0
+        n_handles = rng.randint(2, 5) if is_group else 1
+        handle_ids = []
+        for _ in range(n_handles):
+            phone = f"+1555{rng.randint(0, 9_999_999):07d}"
+            cursor.execute("INSERT INTO handle (id) VALUES (?)", (phone,))
+            handle_ids.append(cursor.lastrowid)
+        cursor.execute(
+            "INSERT INTO chat (guid, chat_identifier, display_name) VALUES (?, ?, ?)",
+            (f"iMessage;{'+' if is_group else '-'};chat{rng.getrandbits(48):012x}",
+             f"chat{c}", f"Group {c}" if is_group else None)
+        )
+        chat_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO chat_handle_join (chat_id, handle_id) VALUES (?, ?)",
+            [(chat_id, h) for h in handle_ids]
+        )
+
+        when = start + dt.timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+        senders = [0] + handle_ids
+        for _ in range(messages_per_chat):
+            # Mostly quick back-and-forth, occasionally a gap of hours or days
+            gap = rng.expovariate(1 / mean_gap_seconds) if rng.random() < 0.9 else rng.expovariate(1 / (60 * 60 * 24))
+            when += dt.timedelta(seconds=gap)
+            sender = rng.choice(senders)
+            if rng.random() < attachment_rate:
+                if body_only_rate and rng.random() < body_only_rate:
+                    append_message(cursor, chat_id, None, when, handle_id=sender, is_from_me=sender == 0, rng=rng,
+                                   cache_has_attachments=1, attributedBody=attributed_body("\ufffc"))
+                else:
+                    append_message(cursor, chat_id, "\ufffc", when, handle_id=sender, is_from_me=sender == 0, rng=rng, cache_has_attachments=1)
+                continue
+            text = random_text(rng, max_words=max_words)
+            guid = f"{rng.getrandbits(128):032X}"
+            if body_only_rate and rng.random() < body_only_rate:
+                append_message(cursor, chat_id, None, when, handle_id=sender, is_from_me=sender == 0, rng=rng, guid=guid,
+                               attributedBody=attributed_body(text))
+            else:
+                append_message(cursor, chat_id, text, when, handle_id=sender, is_from_me=sender == 0, rng=rng, guid=guid)
+            if rng.random() < reaction_rate:
+                reactor = rng.choice([s for s in senders if s != sender])
+                reaction_type = rng.choice(list(TAPBACK_VERBS))
+                append_message(
+                    cursor, chat_id, f"{TAPBACK_VERBS[reaction_type]} “{text}”", when + dt.timedelta(seconds=rng.uniform(1, 60)),
+                    handle_id=reactor, is_from_me=reactor == 0, rng=rng,
+                    associated_message_guid=f"p:0/{guid}", associated_message_type=reaction_type
+                )
+            if is_group and rng.random() < system_rate:
+                # Group renamed (item_type 2) or participant added (item_type 1); these rows have no text
+                append_message(cursor, chat_id, None, when, handle_id=rng.choice(handle_ids), rng=rng,
+                               item_type=rng.choice([1, 2]), group_action_type=0)
+
+    conn.commit()
+    conn.close()
+
+
+def append_message(
+    cursor: sqlite3.Cursor,
+    chat_id: int,
+    text: str | None,
+    when: dt.datetime,
+    handle_id: int = 0,
+    is_from_me: bool = False,
+    rng: random.Random | None = None,
+    **columns,
+) -> int:
+    """Insert one message row (plus its chat_message_join row) and return its ROWID."""
+    rng = rng or random.Random()
+    apple_date = to_apple_timestamp(when)
+    row = {
+        "guid": columns.pop("guid", f"{rng.getrandbits(128):032X}"),
+        "text": text,
+        "handle_id": handle_id,
+        "date": apple_date,
+        "date_delivered": apple_date,
+        "date_read": apple_date,
+        "is_from_me": int(is_from_me),
+        **columns,
+    }
+    cursor.execute(
+        f"INSERT INTO message ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})",
+        tuple(row.values())
+    )
+    message_id = cursor.lastrowid
+    cursor.execute(
+        "INSERT INTO chat_message_join (chat_id, message_id, message_date) VALUES (?, ?, ?)",
+        (chat_id, message_id, apple_date)
+    )
+    return message_id
+
+
+def append_messages(db_path: str, chat_id: int, texts: list[str], when: dt.datetime | None = None) -> list[int]:
+    """
+    Append messages to an existing chat, one second apart, in a single transaction.
+    Useful for exercising the live ingest daemon: the rows land in the WAL like real ones.
+    """
+    when = when or dt.datetime.now()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    handle_ids = [h for (h,) in cursor.execute("SELECT handle_id FROM chat_handle_join WHERE chat_id = ?", (chat_id,))]
+    rng = random.Random()
+    rowids = []
+    for i, text in enumerate(texts):
+        sender = rng.choice([0] + handle_ids)
+        rowids.append(append_message(cursor, chat_id, text, when + dt.timedelta(seconds=i),
+                                     handle_id=sender, is_from_me=sender == 0, rng=rng))
+    conn.commit()
+    conn.close()
+    return rowids
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic chat.db for local testing")
+    parser.add_argument("db_path", nargs="?", default="synthetic_chat.db")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages-per-chat", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    create_synthetic_chat_db(args.db_path, args.chats, args.messages_per_chat, seed=args.seed)
+    print(f"Wrote {args.chats * args.messages_per_chat} messages in {args.chats} chats to {args.db_path}")
@@ -0,0 +1,30 @@
+import datetime as dt
+import sqlite3
+
+import polars as pl
+
+from extract_chats import extract_chats
+from synthetic_chat_db import SCHEMA, append_message, attributed_body
+
+CONTACTS = pl.DataFrame(schema={"Phone Number": pl.Utf8, "Name": pl.Utf8})
+
+
+def test_attributed_body_only_messages_are_kept(tmp_path):
+    db_path = str(tmp_path / "chat.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT INTO chat (guid, chat_identifier) VALUES ('iMessage;-;chat0', 'chat0')")
+    conn.execute("INSERT INTO handle (id) VALUES ('+15550000000')")
+    cursor = conn.cursor()
+    when = dt.datetime(2024, 6, 1, 12, 0)
+    append_message(cursor, 1, "plain text column", when, handle_id=1)
+    append_message(cursor, 1, None, when + dt.timedelta(seconds=1), is_from_me=True, attributedBody=attributed_body("only in the body " * 10))
+    append_message(cursor, 1, None, when + dt.timedelta(seconds=2), attributedBody=attributed_body("￼"), cache_has_attachments=1)
+    append_message(cursor, 1, "Liked “plain text column”", when + dt.timedelta(seconds=3), associated_message_type=2001)
+    conn.commit()
+    conn.close()
+
+    [df] = extract_chats(db_path, CONTACTS)
+    assert df["text"].to_list() == ["plain text column", "only in the body " * 10]
+    [df] = extract_chats(db_path, CONTACTS, content_only=False)
+    assert len(df) == 4 and df["text"][2] == "￼"
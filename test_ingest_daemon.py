@@ -0,0 +1,100 @@
+import json
+import sqlite3
+import datetime as dt
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+import ingest_daemon
+from build_rollups import build_rollups_from_index
+from extract_chats import extract_chats
+from generate_embedding_vectors import chunk_id
+from message_index import build_message_index
+from synthetic_chat_db import append_messages, create_synthetic_chat_db
+
+NEW_SESSION = dt.datetime(2024, 6, 1, 12, 0)
+
+
+@pytest.fixture
+def chat_db(tmp_path):
+    db_path = str(tmp_path / "chat.db")
+    create_synthetic_chat_db(db_path, n_chats=3, messages_per_chat=50)
+    return db_path
+
+
+@pytest.fixture
+def upserted(monkeypatch):
+    """Chunk ids sent to the server, one list per upsert_chunk_batches call."""
+    calls = []
+    monkeypatch.setattr(ingest_daemon, "upsert_chunk_batches",
+                        lambda chunks, *args, **kwargs: calls.append([chunk_id(metadata) for _, metadata in chunks]))
+    return calls
+
+
+def max_rowid(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT MAX(ROWID) FROM message").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def ingest(db_path, last_rowid, tmp_path):
+    return ingest_daemon.ingest_new_messages(db_path, ingest_daemon.load_contacts(str(tmp_path / "contacts.csv")),
+                                             last_rowid, index_path=str(tmp_path / "message_index.db"))
+
+
+def test_new_messages_reupsert_their_session(chat_db, upserted, tmp_path):
+    last_rowid = max_rowid(chat_db)
+    assert ingest(chat_db, last_rowid, tmp_path) == last_rowid
+    assert upserted == []
+
+    first = append_messages(chat_db, 1, ["are we still on for dinner", "yes 7pm works"], NEW_SESSION)
+    last_rowid = ingest(chat_db, last_rowid, tmp_path)
+    assert last_rowid == first[-1]
+    assert len(upserted) == 1 and upserted[0]
+
+    # A later message in the same session re-chunks the session: its existing chunks keep their ids
+    second = append_messages(chat_db, 1, ["see you there"], NEW_SESSION + dt.timedelta(minutes=5))
+    last_rowid = ingest(chat_db, last_rowid, tmp_path)
+    assert last_rowid == second[-1]
+    assert len(upserted) == 2
+    assert set(upserted[0]) <= set(upserted[1])
+
+
+def test_failed_pass_keeps_last_rowid(chat_db, tmp_path, monkeypatch):
+    state_path = str(tmp_path / "ingest_state.json")
+    last_rowid = max_rowid(chat_db)
+    with open(state_path, "w") as f:
+        json.dump({"last_rowid": last_rowid}, f)
+    append_messages(chat_db, 2, ["running late"], NEW_SESSION)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("server went away")
+    monkeypatch.setattr(ingest_daemon, "upsert_chunk_batches", fail)
+
+    ingest_daemon.run(chat_db, str(tmp_path / "contacts.csv"), state_path, once=True, force_polling=True,
+                      index_path=str(tmp_path / "message_index.db"), rollup_dir=str(tmp_path / "rollups"))
+    with open(state_path) as f:
+        assert json.load(f)["last_rowid"] == last_rowid
+
+
+def test_rollups_of_touched_chats_match_a_full_rebuild(chat_db, upserted, tmp_path):
+    index_path, rollup_dir = str(tmp_path / "message_index.db"), str(tmp_path / "rollups")
+    build_message_index(extract_chats(chat_db, ingest_daemon.load_contacts(str(tmp_path / "contacts.csv"))), index_path)
+    build_rollups_from_index(index_path, rollup_dir)
+    last_rowid = max_rowid(chat_db)
+
+    # Someone from the 1:1 chat 2 joins group chat 1, so their contact row spans both chats
+    conn = sqlite3.connect(chat_db)
+    conn.execute("INSERT INTO chat_handle_join SELECT 1, handle_id FROM chat_handle_join WHERE chat_id = 2")
+    conn.commit()
+    conn.close()
+    append_messages(chat_db, 1, [f"message {i}" for i in range(20)], NEW_SESSION)
+    ingest_daemon.ingest_new_messages(chat_db, ingest_daemon.load_contacts(str(tmp_path / "contacts.csv")), last_rowid,
+                                      index_path=index_path, rollup_dir=rollup_dir)
+
+    updated = {name: pl.read_parquet(tmp_path / "rollups" / f"{name}.parquet") for name in ("chats", "contacts", "participants", "daily", "weekly")}
+    for name, table in build_rollups_from_index(index_path, str(tmp_path / "rebuilt")).items():
+        assert_frame_equal(updated[name], table, check_dtypes=False)
@@ -0,0 +1,47 @@
+import datetime as dt
+
+import polars as pl
+
+from generate_embedding_vectors import chunk_id, create_token_budget_chunks
+
+
+class WordTokenizer:
+    """One token per word, plus [CLS] and [SEP], standing in for the model's tokenizer."""
+
+    def num_special_tokens_to_add(self) -> int:
+        return 2
+
+    def __call__(self, texts, add_special_tokens=True):
+        extra = 2 if add_special_tokens else 0
+        return {"input_ids": [[0] * (len(text.split()) + extra) for text in texts]}
+
+
+def chat(texts, times):
+    return pl.DataFrame({
+        "chat_id": [1] * len(texts),
+        "group_chat_name": [None] * len(texts),
+        "author_handle": ["+15550000000"] * len(texts),
+        "author_name": ["Alice"] * len(texts),
+        "text": texts,
+        "date_sent": times,
+    })
+
+
+def test_split_pieces_with_the_same_timestamp_get_distinct_ids():
+    when = dt.datetime(2024, 6, 1, 12, 0)
+    texts = [" ".join(f"w{i}_{j}" for j in range(60)) for i in range(3)]
+    chunks = create_token_budget_chunks(chat(texts, [when] * 3), WordTokenizer(), max_tokens=102, overlap_tokens=0)
+
+    assert len(chunks) == 9  # three offsets, each split into one piece per message
+    assert all(metadata['n_tokens'] <= 100 for _, metadata in chunks)
+    assert len({chunk_id(metadata) for _, metadata in chunks}) == len(chunks)
+
+
+def test_unsplit_windows_keep_their_ids():
+    when = dt.datetime(2024, 6, 1, 12, 0)
+    texts = ["are we still on for dinner", "yes 7pm works"]
+    chunks = create_token_budget_chunks(chat(texts, [when, when + dt.timedelta(minutes=1)]), WordTokenizer())
+
+    assert {chunk_id(metadata) for _, metadata in chunks} == {
+        f"1-{offset}-{when.isoformat()}" for offset in (0, 10, 20)
+    }